@@ -0,0 +1,50 @@
+"""Add geohash cell for geo matching
+
+Revision ID: 002_geo_cell
+Revises: 001_initial
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from config import settings
+from utils.geo import encode_geohash
+
+# revision identifiers, used by Alembic.
+revision = '002_geo_cell'
+down_revision = '001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('geo_cell', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_users_geo_cell'), 'users', ['geo_cell'], unique=False)
+
+    # Заполняем ячейки для пользователей, у которых уже есть координаты
+    users = sa.table(
+        'users',
+        sa.column('id', sa.Integer()),
+        sa.column('latitude', sa.Float()),
+        sa.column('longitude', sa.Float()),
+        sa.column('geo_cell', sa.String()),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(users.c.id, users.c.latitude, users.c.longitude).where(
+            users.c.latitude.isnot(None),
+            users.c.longitude.isnot(None)
+        )
+    ).all()
+    for user_id, latitude, longitude in rows:
+        bind.execute(
+            users.update()
+            .where(users.c.id == user_id)
+            .values(geo_cell=encode_geohash(latitude, longitude, settings.GEO_CELL_PRECISION))
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_geo_cell'), table_name='users')
+    op.drop_column('users', 'geo_cell')
@@ -0,0 +1,37 @@
+"""Add search filters and candidate search indexes
+
+Revision ID: 003_search_filters
+Revises: 002_geo_cell
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_search_filters'
+down_revision = '002_geo_cell'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('search_age_min', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('search_age_max', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('search_max_distance_km', sa.Float(), nullable=True))
+    op.create_index(
+        'ix_users_search', 'users',
+        ['is_active', 'is_banned', 'is_hidden', 'gender', 'city', 'age'], unique=False
+    )
+    op.create_index(
+        'ix_users_search_age', 'users',
+        ['is_active', 'is_banned', 'is_hidden', 'gender', 'age'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_search_age', table_name='users')
+    op.drop_index('ix_users_search', table_name='users')
+    op.drop_column('users', 'search_max_distance_km')
+    op.drop_column('users', 'search_age_max')
+    op.drop_column('users', 'search_age_min')
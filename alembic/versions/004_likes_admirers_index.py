@@ -0,0 +1,22 @@
+"""Add likes (to_user_id, from_user_id) index for admirers lane
+
+Revision ID: 004_likes_admirers_index
+Revises: 003_search_filters
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '004_likes_admirers_index'
+down_revision = '003_search_filters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_likes_to_user_from_user', 'likes', ['to_user_id', 'from_user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_likes_to_user_from_user', table_name='likes')
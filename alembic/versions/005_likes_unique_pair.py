@@ -0,0 +1,59 @@
+"""Deduplicate likes and add unique (from_user_id, to_user_id) index
+
+Revision ID: 005_likes_unique_pair
+Revises: 004_likes_admirers_index
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_likes_unique_pair'
+down_revision = '004_likes_admirers_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    likes = sa.table(
+        'likes',
+        sa.column('id', sa.Integer()),
+        sa.column('from_user_id', sa.Integer()),
+        sa.column('to_user_id', sa.Integer()),
+        sa.column('is_super_like', sa.Boolean()),
+        sa.column('is_mutual', sa.Boolean()),
+    )
+    bind = op.get_bind()
+
+    # Для каждой пары оставляем первую запись, перенося на нее флаги дублей
+    duplicates = bind.execute(
+        sa.select(
+            likes.c.from_user_id,
+            likes.c.to_user_id,
+            sa.func.min(likes.c.id),
+            sa.func.max(sa.case((likes.c.is_super_like == sa.true(), 1), else_=0)),
+            sa.func.max(sa.case((likes.c.is_mutual == sa.true(), 1), else_=0)),
+        )
+        .group_by(likes.c.from_user_id, likes.c.to_user_id)
+        .having(sa.func.count() > 1)
+    ).all()
+    for from_user_id, to_user_id, keep_id, is_super_like, is_mutual in duplicates:
+        bind.execute(
+            likes.update()
+            .where(likes.c.id == keep_id)
+            .values(is_super_like=bool(is_super_like), is_mutual=bool(is_mutual))
+        )
+        bind.execute(
+            likes.delete().where(
+                likes.c.from_user_id == from_user_id,
+                likes.c.to_user_id == to_user_id,
+                likes.c.id != keep_id
+            )
+        )
+
+    op.create_index('uq_likes_from_user_to_user', 'likes', ['from_user_id', 'to_user_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_likes_from_user_to_user', table_name='likes')
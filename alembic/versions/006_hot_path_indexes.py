@@ -0,0 +1,76 @@
+"""Deduplicate dislikes/event participants and index hot lookup paths
+
+Revision ID: 006_hot_path_indexes
+Revises: 005_likes_unique_pair
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_hot_path_indexes'
+down_revision = '005_likes_unique_pair'
+branch_labels = None
+depends_on = None
+
+
+# (имя, таблица, колонки, unique)
+INDEXES = [
+    # Дизлайк пары / дизлайки пользователя (seen_set)
+    ('uq_dislikes_from_user_to_user', 'dislikes', ['from_user_id', 'to_user_id'], True),
+    # Участие в событии / участники события
+    ('uq_event_participants_event_user', 'event_participants', ['event_id', 'user_id'], True),
+    # События, в которых участвует пользователь
+    ('ix_event_participants_user_id', 'event_participants', ['user_id'], False),
+    # События города / ближайшие события / события создателя
+    ('ix_events_city_event_date', 'events', ['city', 'event_date'], False),
+    ('ix_events_event_date', 'events', ['event_date'], False),
+    ('ix_events_creator_id_event_date', 'events', ['creator_id', 'event_date'], False),
+    # Нерассмотренные жалобы (админка)
+    ('ix_complaints_is_resolved', 'complaints', ['is_resolved'], False),
+    # Активные boost (реестр boost)
+    ('ix_boosts_expires_at_user_id', 'boosts', ['expires_at', 'user_id'], False),
+    # Платежи по статусу (ожидающие оплаты, сверка)
+    ('ix_payments_status_created_at', 'payments', ['status', 'created_at'], False),
+    # Активный чат поддержки пользователя
+    ('ix_support_chats_user_id_is_active', 'support_chats', ['user_id', 'is_active'], False),
+    # Сообщения чата поддержки
+    ('ix_support_messages_chat_id', 'support_messages', ['chat_id'], False),
+    # Рефералы пользователя за период (users.referral_code уже уникален)
+    ('ix_users_referred_by_created_at', 'users', ['referred_by', 'created_at'], False),
+]
+
+
+def _deduplicate(bind, table_name: str, key_columns: list) -> None:
+    """Оставляет для каждого ключа запись с минимальным id"""
+    table = sa.table(table_name, sa.column('id', sa.Integer()), *(sa.column(c, sa.Integer()) for c in key_columns))
+    keys = [table.c[c] for c in key_columns]
+
+    duplicates = bind.execute(
+        sa.select(*keys, sa.func.min(table.c.id))
+        .group_by(*keys)
+        .having(sa.func.count() > 1)
+    ).all()
+    for row in duplicates:
+        *values, keep_id = row
+        bind.execute(
+            table.delete().where(
+                *(key == value for key, value in zip(keys, values)),
+                table.c.id != keep_id
+            )
+        )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    _deduplicate(bind, 'dislikes', ['from_user_id', 'to_user_id'])
+    _deduplicate(bind, 'event_participants', ['event_id', 'user_id'])
+
+    for name, table_name, columns, unique in INDEXES:
+        op.create_index(name, table_name, columns, unique=unique)
+
+
+def downgrade() -> None:
+    for name, table_name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table_name)
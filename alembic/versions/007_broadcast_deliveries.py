@@ -0,0 +1,63 @@
+"""Broadcast delivery state and user reachability
+
+Revision ID: 007_broadcast_deliveries
+Revises: 006_hot_path_indexes
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_broadcast_deliveries'
+down_revision = '006_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('is_reachable', sa.Boolean(), nullable=True, server_default=sa.true()))
+
+    op.add_column('admin_messages', sa.Column('status', sa.String(length=20), nullable=True))
+    op.add_column('admin_messages', sa.Column('cursor_user_id', sa.Integer(), nullable=True))
+    op.add_column('admin_messages', sa.Column('failed_count', sa.Integer(), nullable=True))
+    op.add_column('admin_messages', sa.Column('blocked_count', sa.Integer(), nullable=True))
+    op.add_column('admin_messages', sa.Column('report_chat_id', sa.Integer(), nullable=True))
+    op.add_column('admin_messages', sa.Column('report_message_id', sa.Integer(), nullable=True))
+    # Старые рассылки уже отправлены старым кодом - не возобновлять их
+    op.execute(
+        "UPDATE admin_messages SET status = CASE WHEN sent_at IS NULL THEN 'draft' ELSE 'done' END, "
+        "cursor_user_id = 0, failed_count = 0, blocked_count = 0"
+    )
+
+    op.create_table(
+        'broadcast_deliveries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('admin_message_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['admin_message_id'], ['admin_messages.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_broadcast_deliveries_id'), 'broadcast_deliveries', ['id'], unique=False)
+    op.create_index(
+        'uq_broadcast_deliveries_message_user', 'broadcast_deliveries',
+        ['admin_message_id', 'user_id'], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_broadcast_deliveries_message_user', table_name='broadcast_deliveries')
+    op.drop_index(op.f('ix_broadcast_deliveries_id'), table_name='broadcast_deliveries')
+    op.drop_table('broadcast_deliveries')
+
+    op.drop_column('admin_messages', 'report_message_id')
+    op.drop_column('admin_messages', 'report_chat_id')
+    op.drop_column('admin_messages', 'blocked_count')
+    op.drop_column('admin_messages', 'failed_count')
+    op.drop_column('admin_messages', 'cursor_user_id')
+    op.drop_column('admin_messages', 'status')
+    op.drop_column('users', 'is_reachable')
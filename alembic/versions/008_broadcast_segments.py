@@ -0,0 +1,38 @@
+"""Broadcast segments, scheduling and user activity
+
+Revision ID: 008_broadcast_segments
+Revises: 007_broadcast_deliveries
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_broadcast_segments'
+down_revision = '007_broadcast_deliveries'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('admin_messages', sa.Column('segment', sa.JSON(), nullable=True))
+    op.add_column('admin_messages', sa.Column('scheduled_at', sa.DateTime(), nullable=True))
+
+    op.add_column('users', sa.Column('last_active_at', sa.DateTime(), nullable=True))
+    # До появления отметки активности ближайшая оценка - последнее изменение анкеты
+    op.execute("UPDATE users SET last_active_at = updated_at")
+    op.create_index(
+        'ix_users_audience', 'users',
+        ['is_active', 'is_banned', 'is_reachable', 'city', 'gender'], unique=False
+    )
+    op.create_index('ix_users_last_active_at', 'users', ['last_active_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_last_active_at', table_name='users')
+    op.drop_index('ix_users_audience', table_name='users')
+    op.drop_column('users', 'last_active_at')
+
+    op.drop_column('admin_messages', 'scheduled_at')
+    op.drop_column('admin_messages', 'segment')
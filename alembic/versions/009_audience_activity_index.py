@@ -0,0 +1,31 @@
+"""Audience activity index: recipient flags + last_active_at
+
+Revision ID: 009_audience_activity_index
+Revises: 008_broadcast_segments
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009_audience_activity_index'
+down_revision = '008_broadcast_segments'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Сегмент по активности всегда идет вместе с условиями получателей
+    # (is_active, is_banned, is_reachable): с одним last_active_at планировщик
+    # выбирал ix_users_audience по трем флагам и фильтровал активность построчно
+    op.drop_index('ix_users_last_active_at', table_name='users')
+    op.create_index(
+        'ix_users_last_active_at', 'users',
+        ['is_active', 'is_banned', 'is_reachable', 'last_active_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_last_active_at', table_name='users')
+    op.create_index('ix_users_last_active_at', 'users', ['last_active_at'], unique=False)
@@ -0,0 +1,357 @@
+"""
+Бенчмарк подбора анкет и лайков
+
+Заполняет отдельную БД синтетическими пользователями, лайками, дизлайками и
+boost на нескольких масштабах и замеряет get_next_profile (холодный и теплый
+вызов), check_mutual_like и весь путь лайка. Для каждой операции выводятся
+p50/p95/p99, среднее число SQL-запросов и пиковая память (tracemalloc).
+Результат - JSON, чтобы сравнивать релизы между собой.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_matchmaking.py --scales 10000 100000 1000000 --output bench.json
+
+По умолчанию используется SQLite во временном каталоге. Для PostgreSQL
+укажите BENCH_POSTGRES_URL (postgresql+asyncpg://...) - база будет очищена.
+Каждый масштаб запускается в отдельном процессе, чтобы память и кэши
+не влияли на соседние замеры.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CITIES = [
+    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань",
+    "Нижний Новгород", "Челябинск", "Самара", "Омск", "Ростов-на-Дону",
+]
+# Центры городов для координат (широта, долгота)
+CITY_CENTERS = [
+    (55.75, 37.62), (59.94, 30.31), (55.03, 82.92), (56.84, 60.61), (55.79, 49.12),
+    (56.33, 44.00), (55.16, 61.40), (53.20, 50.15), (54.99, 73.37), (47.23, 39.72),
+]
+
+
+def percentiles(samples_ms: list) -> dict:
+    """Сводка по латентности в миллисекундах"""
+    import numpy as np
+
+    values = np.asarray(samples_ms, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+class QueryCounter:
+    """Считает SQL-запросы через событие before_cursor_execute"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+async def seed(engine, scale: int, likes_per_user: int, dislikes_per_user: int, boost_share: float) -> dict:
+    """Заполняет БД синтетическими данными"""
+    from sqlalchemy import insert
+    from database.models import Base, User, Like, Dislike, Boost, Gender, Interest
+    from utils.geo import encode_geohash
+    from config import settings
+
+    rng = random.Random(42)
+    started = time.perf_counter()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    chunk = 10000
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        for offset in range(0, scale, chunk):
+            rows = []
+            for user_id in range(offset + 1, min(offset + chunk, scale) + 1):
+                city_index = rng.randrange(len(CITIES))
+                lat = CITY_CENTERS[city_index][0] + rng.uniform(-0.3, 0.3)
+                lon = CITY_CENTERS[city_index][1] + rng.uniform(-0.3, 0.3)
+                rows.append(dict(
+                    id=user_id,
+                    telegram_id=10_000_000 + user_id,
+                    name=f"user{user_id}",
+                    age=rng.randint(18, 45),
+                    gender=rng.choice((Gender.MALE, Gender.FEMALE)),
+                    interest=rng.choice((Interest.MALE, Interest.FEMALE, Interest.FEMALE, Interest.MALE, Interest.ALL)),
+                    city=CITIES[city_index],
+                    latitude=lat,
+                    longitude=lon,
+                    geo_cell=encode_geohash(lat, lon, settings.GEO_CELL_PRECISION),
+                    is_active=True,
+                    is_banned=rng.random() < 0.01,
+                    is_hidden=rng.random() < 0.02,
+                    is_verified=rng.random() < 0.1,
+                    total_likes=0,
+                    total_dislikes=0,
+                    created_at=now - timedelta(days=rng.randint(0, 365)),
+                    updated_at=now,
+                ))
+            await conn.execute(insert(User), rows)
+
+        for model, per_user in ((Like, likes_per_user), (Dislike, dislikes_per_user)):
+            rows = []
+            for from_user_id in range(1, scale + 1):
+                targets = set()
+                while len(targets) < per_user:
+                    target = rng.randint(1, scale)
+                    if target != from_user_id:
+                        targets.add(target)
+                rows.extend(dict(from_user_id=from_user_id, to_user_id=target) for target in targets)
+                if len(rows) >= chunk:
+                    await conn.execute(insert(model), rows)
+                    rows = []
+            if rows:
+                await conn.execute(insert(model), rows)
+
+        boosted = rng.sample(range(1, scale + 1), max(1, int(scale * boost_share)))
+        await conn.execute(insert(Boost), [
+            dict(user_id=user_id, expires_at=now + timedelta(hours=rng.randint(1, 24)))
+            for user_id in boosted
+        ])
+
+    return {"seed_seconds": round(time.perf_counter() - started, 2)}
+
+
+async def like_flow(session, telegram_id: int, target_user_id: int) -> None:
+    """Путь лайка из callback_like без отправки сообщений в Telegram"""
+    from sqlalchemy import select
+    from database.models import User
+    from services.seen_set import seen_set
+    from utils.helpers import can_like, record_like
+
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    user = result.scalar_one_or_none()
+    result_target = await session.execute(select(User).where(User.id == target_user_id))
+    target_user = result_target.scalar_one_or_none()
+    await can_like(session, user)
+
+    created, _ = await record_like(session, user.id, target_user_id)
+    if not created:
+        await session.rollback()
+        return
+    await session.commit()
+    await seen_set.add(user.id, target_user_id)
+
+
+async def measure(operation, iterations: int, counter: QueryCounter, memory_iterations: int) -> dict:
+    """Замеряет операцию: латентность, запросы, пиковую память"""
+    samples = []
+    queries_before = counter.count
+    for i in range(iterations):
+        started = time.perf_counter()
+        await operation(i)
+        samples.append((time.perf_counter() - started) * 1000)
+        # Даем отработать фоновым задачам (пополнение очереди) между вызовами
+        await asyncio.sleep(0)
+    queries = counter.count - queries_before
+
+    # Память меряем отдельным коротким проходом: tracemalloc искажает латентность
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for i in range(iterations, iterations + memory_iterations):
+        await operation(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = percentiles(samples)
+    stats["queries_per_op"] = round(queries / max(iterations, 1), 2)
+    stats["peak_memory_kb"] = round(peak / 1024, 1)
+    return stats
+
+
+async def run_scale(args) -> dict:
+    """Прогон одного масштаба (в дочернем процессе)"""
+    from sqlalchemy import select, func
+    from database.connection import engine, async_session_maker
+    from database.models import User
+    from services.candidate_queue import candidate_queue
+    from services.profile_snapshot import profile_snapshot
+    from services.boost_registry import boost_registry
+    from utils.helpers import get_next_profile, check_mutual_like
+
+    engine.echo = False
+    scale = args.scale
+    report = {"scale": scale, "dialect": engine.dialect.name}
+    report.update(await seed(
+        engine, scale,
+        args.likes_per_user, args.dislikes_per_user, args.boost_share
+    ))
+
+    counter = QueryCounter(engine)
+    rng = random.Random(7)
+
+    async with async_session_maker() as session:
+        started = time.perf_counter()
+        await boost_registry.load(session)
+        await profile_snapshot.refresh(session)
+        report["warmup_seconds"] = round(time.perf_counter() - started, 3)
+        visible = await session.scalar(
+            select(func.count(User.id)).where(User.is_banned == False, User.is_hidden == False)
+        )
+        report["visible_profiles"] = int(visible)
+
+    viewer_ids = [rng.randint(1, scale) for _ in range(args.iterations + args.memory_iterations)]
+    operations = {}
+
+    async def next_profile_cold(i):
+        candidate_queue.invalidate(viewer_ids[i])
+        async with async_session_maker() as session:
+            viewer = await session.get(User, viewer_ids[i])
+            await get_next_profile(session, viewer)
+
+    async def next_profile_warm(i):
+        async with async_session_maker() as session:
+            viewer = await session.get(User, viewer_ids[i])
+            await get_next_profile(session, viewer)
+
+    async def mutual_check(i):
+        async with async_session_maker() as session:
+            await check_mutual_like(session, viewer_ids[i], rng.randint(1, scale))
+
+    async def like(i):
+        async with async_session_maker() as session:
+            target = rng.randint(1, scale)
+            if target == viewer_ids[i]:
+                target = target % scale + 1
+            await like_flow(session, 10_000_000 + viewer_ids[i], target)
+
+    operations["get_next_profile_cold"] = await measure(
+        next_profile_cold, args.iterations, counter, args.memory_iterations
+    )
+    operations["get_next_profile_warm"] = await measure(
+        next_profile_warm, args.iterations, counter, args.memory_iterations
+    )
+    operations["check_mutual_like"] = await measure(
+        mutual_check, args.iterations, counter, args.memory_iterations
+    )
+    operations["like_flow"] = await measure(
+        like, args.iterations, counter, args.memory_iterations
+    )
+    report["operations"] = operations
+
+    try:
+        import resource
+        # ru_maxrss в КБ на Linux
+        report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        pass
+
+    await engine.dispose()
+    return report
+
+
+def run_child(args) -> None:
+    report = asyncio.run(run_scale(args))
+    print(json.dumps(report, ensure_ascii=False))
+
+
+def run_parent(args) -> None:
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench_matchmaking_")
+    for scale in args.scales:
+        env = dict(os.environ)
+        env.setdefault("BOT_TOKEN", "0:benchmark")
+        # Redis не нужен: сервисы работают на in-process структурах
+        env.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")
+        if os.environ.get("BENCH_POSTGRES_URL"):
+            env["DATABASE_URL"] = os.environ["BENCH_POSTGRES_URL"]
+        else:
+            env["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, f'bench_{scale}.db')}"
+
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child",
+            "--scale", str(scale),
+            "--iterations", str(args.iterations),
+            "--memory-iterations", str(args.memory_iterations),
+            "--likes-per-user", str(args.likes_per_user),
+            "--dislikes-per-user", str(args.dislikes_per_user),
+            "--boost-share", str(args.boost_share),
+        ]
+        print(f"[bench] scale={scale} ...", file=sys.stderr)
+        completed = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            results.append({"scale": scale, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        revision = ""
+
+    output = {
+        "benchmark": "matchmaking",
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "iterations": args.iterations,
+            "memory_iterations": args.memory_iterations,
+            "likes_per_user": args.likes_per_user,
+            "dislikes_per_user": args.dislikes_per_user,
+            "boost_share": args.boost_share,
+        },
+        "results": results,
+    }
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[bench] результаты записаны в {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк подбора анкет и лайков")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--iterations", type=int, default=200, help="Замеров на операцию")
+    parser.add_argument("--memory-iterations", type=int, default=20, help="Прогонов под tracemalloc")
+    parser.add_argument("--likes-per-user", type=int, default=3)
+    parser.add_argument("--dislikes-per-user", type=int, default=3)
+    parser.add_argument("--boost-share", type=float, default=0.01, help="Доля пользователей с boost")
+    parser.add_argument("--output", help="Файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, ROOT)
+    arguments = parse_args()
+    if arguments.child:
+        run_child(arguments)
+    else:
+        run_parent(arguments)
@@ -0,0 +1,141 @@
+"""
+Проверка планов горячих запросов
+
+Выполняет EXPLAIN для запросов, которые бот делает на каждом действии
+пользователя (поиск по telegram_id, пары лайков/дизлайков, участие в событиях,
+активные boost, жалобы, чаты поддержки и т.д.), и проверяет, что ни один из
+них не читает таблицу целиком, а запросы из EXPECTED_INDEXES идут по индексу,
+созданному именно для них.
+
+Запуск из корня репозитория:
+    python benchmarks/explain_hot_queries.py
+
+По умолчанию схема создается по моделям в пустой SQLite во временном
+каталоге. Чтобы проверить рабочую БД после `alembic upgrade head`, укажите
+EXPLAIN_DATABASE_URL. Для PostgreSQL на время проверки отключается seq scan,
+иначе на маленьких таблицах планировщик выбирает его при наличии индекса.
+Код выхода 1, если хотя бы один запрос идет полным сканированием или не по
+ожидаемому индексу.
+"""
+import asyncio
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Признаки полного сканирования таблицы в плане
+FULL_SCAN_PATTERNS = {
+    # SCAN в SQLite - обход всей таблицы или всего индекса, SEARCH - поиск по ключу
+    "sqlite": re.compile(r"^SCAN ", re.MULTILINE),
+    "postgresql": re.compile(r"Seq Scan"),
+}
+
+# Запросы, для которых заведен свой индекс: план должен использовать именно его
+EXPECTED_INDEXES = {
+    "broadcast_audience_city": "ix_users_audience",
+    "broadcast_audience_active": "ix_users_last_active_at",
+}
+
+
+def hot_queries() -> dict:
+    """Запросы в той форме, в какой их строят обработчики и сервисы"""
+    from sqlalchemy import select, func
+    from database.models import (
+        User, Like, Dislike, Event, EventParticipant, Complaint,
+        Boost, Payment, SupportChat, SupportMessage,
+    )
+    from services.broadcast import recipient_conditions
+
+    now = datetime.utcnow()
+    return {
+        "user_by_telegram_id": select(User).where(User.telegram_id == 1),
+        "user_by_referral_code": select(User).where(User.referral_code == "ABC123"),
+        "referrals_for_period": select(func.count(User.id)).where(
+            User.referred_by == 1, User.created_at >= now - timedelta(days=14)
+        ),
+        "like_pair": select(Like).where(Like.from_user_id == 1, Like.to_user_id == 2),
+        "likes_received": select(Like.from_user_id).where(Like.to_user_id == 1),
+        "dislike_pair": select(Dislike).where(Dislike.from_user_id == 1, Dislike.to_user_id == 2),
+        "dislikes_given": select(Dislike.to_user_id).where(Dislike.from_user_id == 1),
+        "event_participation": select(EventParticipant).where(
+            EventParticipant.event_id == 1, EventParticipant.user_id == 1
+        ),
+        "event_participants": select(EventParticipant).where(EventParticipant.event_id == 1),
+        "events_of_participant": select(Event).join(EventParticipant).where(
+            EventParticipant.user_id == 1
+        ).order_by(Event.event_date.desc()),
+        "events_in_city": select(Event).where(Event.city == "Москва", Event.event_date >= now),
+        "upcoming_events": select(Event).where(Event.event_date >= now).order_by(Event.event_date),
+        "events_of_creator": select(Event).where(Event.creator_id == 1).order_by(Event.event_date.desc()),
+        "unresolved_complaints": select(func.count(Complaint.id)).where(Complaint.is_resolved == False),
+        "active_boosts": select(Boost.user_id, func.max(Boost.expires_at)).where(
+            Boost.expires_at > now
+        ).group_by(Boost.user_id),
+        "payments_by_status": select(Payment.id).where(Payment.status == "pending"),
+        "active_support_chat": select(SupportChat).where(
+            SupportChat.user_id == 1, SupportChat.is_active == True
+        ),
+        "support_chat_messages": select(SupportMessage).where(SupportMessage.chat_id == 1),
+        "broadcast_audience_city": select(func.count(User.id)).where(
+            *recipient_conditions({"city": "Москва", "gender": "female"})
+        ),
+        "broadcast_audience_active": select(func.count(User.id)).where(
+            *recipient_conditions({"active_days": 7})
+        ),
+    }
+
+
+async def explain_all() -> bool:
+    from sqlalchemy import text
+    from database.connection import engine
+    from database.models import Base
+
+    engine.echo = False
+    dialect = engine.dialect.name
+    if not os.environ.get("EXPLAIN_DATABASE_URL"):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    full_scan = FULL_SCAN_PATTERNS.get(dialect)
+    prefix = "EXPLAIN QUERY PLAN" if dialect == "sqlite" else "EXPLAIN"
+    ok = True
+
+    async with engine.connect() as conn:
+        if dialect == "postgresql":
+            await conn.execute(text("SET enable_seqscan = off"))
+        for name, query in hot_queries().items():
+            sql = str(query.compile(engine.sync_engine, compile_kwargs={"literal_binds": True}))
+            rows = (await conn.execute(text(f"{prefix} {sql}"))).all()
+            # SQLite: (id, parent, notused, detail); PostgreSQL: одна колонка с текстом
+            plan = "\n".join(str(row[-1]) for row in rows)
+            scans = bool(full_scan and full_scan.search(plan))
+            expected_index = EXPECTED_INDEXES.get(name)
+            wrong_index = bool(expected_index and expected_index not in plan)
+            ok = ok and not scans and not wrong_index
+
+            status = "FULL SCAN" if scans else f"NO {expected_index}" if wrong_index else "ok"
+            print(f"{status:>9}  {name}")
+            for line in plan.splitlines():
+                print(f"           {line}")
+
+    await engine.dispose()
+    return ok
+
+
+def main() -> None:
+    if os.environ.get("EXPLAIN_DATABASE_URL"):
+        os.environ["DATABASE_URL"] = os.environ["EXPLAIN_DATABASE_URL"]
+    else:
+        workdir = tempfile.mkdtemp(prefix="explain_")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'explain.db')}"
+    sys.path.insert(0, ROOT)
+
+    ok = asyncio.run(explain_all())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Стресс-тест взаимных лайков
+
+Создает пары пользователей и для каждой пары одновременно отправляет два
+встречных лайка из разных сессий (и соединений). После этого проверяет, что
+обе записи каждой пары отмечены взаимными и что совпадение увидел хотя бы
+один из двух вызовов record_like. Повторяется несколько раундов.
+
+Запуск из корня репозитория:
+    python benchmarks/stress_mutual_likes.py --pairs 200 --rounds 5 --concurrency 10
+
+По умолчанию используется SQLite во временном каталоге. Для PostgreSQL
+укажите BENCH_POSTGRES_URL (postgresql+asyncpg://...) - база будет очищена.
+Код выхода 1, если хотя бы одна пара потеряла взаимность.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def run(args) -> dict:
+    from sqlalchemy import insert, select, delete, func
+    from database.connection import engine, async_session_maker
+    from database.models import Base, User, Like, Gender, Interest
+    from utils.helpers import record_like
+
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [
+            {
+                "id": i,
+                "telegram_id": 10_000_000 + i,
+                "name": f"user{i}",
+                "age": 25,
+                "gender": Gender.MALE if i % 2 else Gender.FEMALE,
+                "interest": Interest.ALL,
+            }
+            for i in range(1, args.pairs * 2 + 1)
+        ])
+
+    async def like(from_user_id: int, to_user_id: int) -> bool:
+        async with async_session_maker() as session:
+            _, is_mutual = await record_like(session, from_user_id, to_user_id)
+            await session.commit()
+            return is_mutual
+
+    report = {"dialect": engine.dialect.name, "pairs": args.pairs, "rounds": []}
+    failed = False
+    for round_no in range(args.rounds):
+        async with engine.begin() as conn:
+            await conn.execute(delete(Like))
+
+        pairs = [(2 * i - 1, 2 * i) for i in range(1, args.pairs + 1)]
+        results = []
+        started = time.perf_counter()
+        # Пары отправляются волнами: SQLite при сотнях одновременных писателей
+        # упирается в busy timeout раньше, чем проявляется гонка
+        for offset in range(0, len(pairs), args.concurrency):
+            results.extend(await asyncio.gather(*(
+                coro
+                for a, b in pairs[offset:offset + args.concurrency]
+                for coro in (like(a, b), like(b, a))
+            )))
+        elapsed = time.perf_counter() - started
+
+        # Сколько пар ни один из вызовов не признал взаимными
+        unseen = sum(1 for i in range(0, len(results), 2) if not (results[i] or results[i + 1]))
+        async with async_session_maker() as session:
+            not_mutual = await session.scalar(
+                select(func.count(Like.id)).where(Like.is_mutual == False)
+            )
+            total = await session.scalar(select(func.count(Like.id)))
+
+        ok = not unseen and not not_mutual and total == args.pairs * 2
+        failed = failed or not ok
+        report["rounds"].append({
+            "round": round_no + 1,
+            "likes": int(total),
+            "rows_not_mutual": int(not_mutual),
+            "pairs_match_not_reported": unseen,
+            "seconds": round(elapsed, 3),
+            "ok": ok,
+        })
+
+    report["ok"] = not failed
+    await engine.dispose()
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Стресс-тест одновременных встречных лайков")
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=10, help="Пар в одной волне")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if os.environ.get("BENCH_POSTGRES_URL"):
+        os.environ["DATABASE_URL"] = os.environ["BENCH_POSTGRES_URL"]
+    else:
+        workdir = tempfile.mkdtemp(prefix="stress_likes_")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'stress.db')}"
+    sys.path.insert(0, ROOT)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,28 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Any, Dict, List, Literal, Optional
+
+
+# Профили движка БД. dev - локальная разработка: маленький пул, быстрый отказ
+# при исчерпании. prod - пул под конкурентные апдейты и фоновые воркеры, проверка
+# соединений после простоя и переоткрытие до таймаутов на стороне сервера/прокси.
+DB_ENGINE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "dev": {
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 10.0,
+        "pool_pre_ping": False,
+        "pool_recycle": -1,
+        "statement_cache_size": 100,
+    },
+    "prod": {
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 30.0,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "statement_cache_size": 500,
+    },
+}
 
 
 class Settings(BaseSettings):
@@ -10,6 +33,21 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = ""  # Для SQLAlchemy (SQLite/PostgreSQL) - оставлено для совместимости
     
+    # Database engine (профиль задает параметры пула, DB_* ниже переопределяют отдельные значения)
+    DB_PROFILE: Literal["dev", "prod"] = "prod"
+    DB_ECHO: bool = False  # Логировать каждый SQL-запрос (только для отладки)
+    DB_POOL_SIZE: Optional[int] = None  # Постоянных соединений в пуле
+    DB_MAX_OVERFLOW: Optional[int] = None  # Временных соединений сверх пула при пиковой нагрузке
+    DB_POOL_TIMEOUT: Optional[float] = None  # Сколько ждать свободное соединение, секунд
+    DB_POOL_PRE_PING: Optional[bool] = None  # Проверять соединение перед выдачей (обрывы после простоя)
+    DB_POOL_RECYCLE: Optional[int] = None  # Переоткрывать соединения старше N секунд (-1 - никогда)
+    DB_STATEMENT_CACHE_SIZE: Optional[int] = None  # Кеш prepared statements asyncpg (0 - для pgbouncer)
+    DB_POOL_SLOW_CHECKOUT_MS: float = 100.0  # Предупреждать в лог о долгом ожидании соединения
+    
+    # Read replica (обработчики с флагом read_only читают с реплики; пусто - все идет в основную БД)
+    DATABASE_REPLICA_URL: str = ""
+    REPLICA_PIN_SECONDS: float = 5.0  # Сколько после своего коммита пользователь читает с основной БД
+    
     # MongoDB
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DATABASE: str = "dating_bot"
@@ -50,13 +88,108 @@ class Settings(BaseSettings):
     DAILY_LIKES_LIMIT: int = 10
     DAILY_DISLIKES_LIMIT: int = 50
     REFERRAL_BONUS_LIKES: int = 5
+
+    # Candidate queue (очередь анкет для просмотра)
+    CANDIDATE_BATCH_SIZE: int = 50  # Сколько ID анкет подбирать за один раз
+    CANDIDATE_REFILL_THRESHOLD: int = 10  # При каком остатке запускать фоновое пополнение
+    PROFILE_PREFETCH_ENABLED: bool = True  # Готовить карточку следующей анкеты в фоне
+    PROFILE_PREFETCH_MAX_PARKED: int = 20000  # Сколько готовых карточек держать в памяти
+    CANDIDATE_QUEUE_MAX_USERS: int = 20000  # Для скольких пользователей держать очередь в памяти
+    CANDIDATE_QUEUE_IDLE_SECONDS: int = 1800  # Через сколько без свайпов забывать очередь и карточку
+    ADMIRER_SHARE: float = 0.2  # Макс. доля в пачке анкет тех, кто уже лайкнул пользователя
+    SEEN_SET_LOCAL_MAX_MB: int = 64  # Память под карты просмотренных анкет без Redis
     
+    # Geo matching (поиск по координатам)
+    GEO_MATCHING_ENABLED: bool = True
+    GEO_SEARCH_RADIUS_KM: float = 50.0
+    GEO_CELL_PRECISION: int = 4  # Длина geohash-ячейки (4 символа ~ 39x19 км)
+    GEO_MAX_CELLS: int = 64  # Больше ячеек - поиск по прямоугольнику координат
+    GEO_CANDIDATE_POOL: int = 1000  # Сколько ближайших анкет сортировать по расстоянию
+
+    # Ranking (взвешенная оценка кандидатов)
+    RANKING_ENABLED: bool = True
+    RANKING_POOL_SIZE: int = 2000  # Сколько анкет загружать в пул для оценки
+    RANK_WEIGHT_INTEREST: float = 4.0  # Пол анкеты подходит под интерес
+    RANK_WEIGHT_RECIPROCAL: float = 1.0  # Пользователь подходит под интерес анкеты
+    RANK_WEIGHT_CITY: float = 2.0
+    RANK_WEIGHT_DISTANCE: float = 2.0
+    RANK_WEIGHT_AGE: float = 1.0
+    RANK_WEIGHT_FRESHNESS: float = 0.5  # Новые анкеты
+    RANK_WEIGHT_VERIFIED: float = 0.5
+    RANK_WEIGHT_BOOST: float = 3.0
+    RANK_WEIGHT_POPULARITY: float = 0.5
+    RANK_DISTANCE_SCALE_KM: float = 25.0  # Затухание оценки по расстоянию
+    RANK_AGE_SCALE_YEARS: float = 5.0  # Затухание оценки по разнице в возрасте
+    RANK_FRESHNESS_DAYS: float = 14.0  # Затухание бонуса новой анкеты
+
+    # Profile snapshot (колоночный снимок анкет в памяти)
+    SNAPSHOT_ENABLED: bool = True
+    SNAPSHOT_REFRESH_SECONDS: int = 30  # Инкрементальное обновление по users.updated_at
+    SNAPSHOT_FULL_REBUILD_SECONDS: int = 3600  # Полная перестройка (убирает удаленные анкеты)
+
+    # Boost registry (активные boost в памяти)
+    BOOST_REGISTRY_SYNC_SECONDS: int = 300  # Как часто сверять реестр с таблицей boosts
+
+    # Swipe buffer (отложенная пакетная запись дизлайков через Redis Stream)
+    SWIPE_BUFFER_ENABLED: bool = True
+    SWIPE_BUFFER_BATCH_SIZE: int = 500
+    SWIPE_BUFFER_FLUSH_SECONDS: float = 1.0
+    SWIPE_BUFFER_CLAIM_IDLE_SECONDS: int = 60  # Когда забирать события упавшего воркера
+    SWIPE_BUFFER_PENDING_TTL_SECONDS: int = 86400  # Срок множества незаписанных дизлайков пользователя
+
+    # Telegram outbound limits (исходящие запросы бота)
+    TELEGRAM_GLOBAL_RATE: float = 30.0  # Сообщений в секунду на бота
+    TELEGRAM_CHAT_RATE: float = 1.0  # Сообщений в секунду в один чат
+    TELEGRAM_CHAT_BURST: float = 3.0  # Запас сообщений в чат сверх скорости
+    TELEGRAM_MAX_RETRIES: int = 3  # Повторов после flood wait
+    TELEGRAM_MAX_RETRY_AFTER: int = 60  # Дольше этого не ждем, отдаем ошибку вызывающему
+
+    # Notifications (очередь уведомлений с повторами и dead-letter)
+    NOTIFY_WORKERS: int = 4
+    NOTIFY_MAX_ATTEMPTS: int = 8
+    NOTIFY_BACKOFF_BASE_SECONDS: float = 1.0
+    NOTIFY_BACKOFF_MAX_SECONDS: float = 300.0
+    NOTIFY_DEAD_LETTER_LIMIT: int = 10000
+
+    # Broadcasts (рассылки администратора)
+    BROADCAST_BATCH_SIZE: int = 500  # Получателей на страницу (курсор сохраняется после каждой)
+    BROADCAST_WORKERS: int = 20  # Конкурентных отправок; темп задает TELEGRAM_GLOBAL_RATE
+    BROADCAST_PROGRESS_SECONDS: float = 5.0  # Как часто обновлять прогресс у админа
+    BROADCAST_SCHEDULER_SECONDS: int = 30  # Как часто проверять запланированные рассылки
+    ACTIVITY_TOUCH_SECONDS: int = 300  # Не чаще раза в N секунд обновлять users.last_active_at
+
+    # User context (анкета текущего пользователя в обработчиках)
+    USER_CACHE_TTL_SECONDS: int = 30  # TTL кеша по telegram_id (0 - без кеша)
+
+    # Like digest (сводка уведомлений о лайках; 0 - отправлять каждый лайк сразу)
+    LIKE_DIGEST_WINDOW_SECONDS: int = 60
+
+    # Reconciliation (фоновая сверка после конкурентных записей)
+    RECONCILE_INTERVAL_SECONDS: int = 300
+    RECONCILE_LOOKBACK_MINUTES: int = 60  # Какие недавние лайки проверять на взаимность
+    RECONCILE_COUNTERS_SECONDS: int = 86400  # Пересчет total_likes / total_dislikes
+
     @property
     def admin_ids(self) -> List[int]:
         if not self.ADMIN_USER_IDS:
             return []
         return [int(uid.strip()) for uid in self.ADMIN_USER_IDS.split(",")]
     
+    @property
+    def db_engine_options(self) -> Dict[str, Any]:
+        """Параметры пула соединений: профиль DB_PROFILE с переопределениями DB_*"""
+        options = dict(DB_ENGINE_PROFILES[self.DB_PROFILE])
+        overrides = {
+            "pool_size": self.DB_POOL_SIZE,
+            "max_overflow": self.DB_MAX_OVERFLOW,
+            "pool_timeout": self.DB_POOL_TIMEOUT,
+            "pool_pre_ping": self.DB_POOL_PRE_PING,
+            "pool_recycle": self.DB_POOL_RECYCLE,
+            "statement_cache_size": self.DB_STATEMENT_CACHE_SIZE,
+        }
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return options
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,9 +1,12 @@
 import asyncio
+from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import event
+from sqlalchemy.orm import Session, declarative_base
 from config import settings
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
+from typing import Any, Dict, Optional
+from database.pool_metrics import pool_metrics, InstrumentedQueuePool, InstrumentedNullPool
 
 Base = declarative_base()
 
@@ -42,11 +45,33 @@ async def close_mongodb():
 # SQLite подключение (для обратной совместимости)
 database_url = settings.DATABASE_URL if settings.DATABASE_URL else "sqlite+aiosqlite:///./test_bot.db"
 
-engine = create_async_engine(
-    database_url,
-    echo=True,
-    future=True
-)
+
+def engine_kwargs(url: str) -> Dict[str, Any]:
+    """Параметры create_async_engine по профилю DB_PROFILE (см. config.DB_ENGINE_PROFILES)"""
+    options = settings.db_engine_options
+    kwargs: Dict[str, Any] = {"echo": settings.DB_ECHO, "future": True}
+    if url.startswith("sqlite"):
+        # Для SQLite в памяти оставляем пул диалекта (одно общее соединение),
+        # для файла соединение открывается на сессию - размеры пула неприменимы
+        if ":memory:" not in url and "mode=memory" not in url:
+            kwargs["poolclass"] = InstrumentedNullPool
+        return kwargs
+
+    kwargs.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=options["pool_size"],
+        max_overflow=options["max_overflow"],
+        pool_timeout=options["pool_timeout"],
+        pool_pre_ping=options["pool_pre_ping"],
+        pool_recycle=options["pool_recycle"],
+    )
+    if url.startswith("postgresql+asyncpg"):
+        kwargs["connect_args"] = {"prepared_statement_cache_size": options["statement_cache_size"]}
+    return kwargs
+
+
+engine = create_async_engine(database_url, **engine_kwargs(database_url))
+pool_metrics.attach(engine.sync_engine.pool)
 
 async_session_maker = async_sessionmaker(
     engine,
@@ -54,6 +79,56 @@ async_session_maker = async_sessionmaker(
     expire_on_commit=False
 )
 
+
+class ReplicaSession(Session):
+    """Сессия реплики: только чтение"""
+
+
+@event.listens_for(ReplicaSession, "before_flush")
+def _forbid_replica_flush(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        raise RuntimeError("Запись через сессию реплики: обработчик помечен read_only, но меняет данные")
+
+
+@event.listens_for(ReplicaSession, "do_orm_execute")
+def _forbid_replica_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        raise RuntimeError("Запись через сессию реплики: обработчик помечен read_only, но меняет данные")
+
+
+# Реплика для чтения (необязательно). Без DATABASE_REPLICA_URL сессии "для
+# чтения" открываются в основной БД, и код не различает эти случаи
+replica_engine = None
+replica_session_maker = async_session_maker
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        settings.DATABASE_REPLICA_URL, **engine_kwargs(settings.DATABASE_REPLICA_URL)
+    )
+    pool_metrics.attach(replica_engine.sync_engine.pool)
+    replica_session_maker = async_sessionmaker(
+        replica_engine,
+        class_=AsyncSession,
+        sync_session_class=ReplicaSession,
+        expire_on_commit=False,
+        info={"replica": True}
+    )
+
+@asynccontextmanager
+async def primary_session(session: Optional[AsyncSession] = None):
+    """
+    Сессия основной БД для данных, которые кешируются надолго
+
+    Переданная сессия используется, если это не сессия реплики; иначе
+    открывается своя. Кеш, заполненный с отстающей реплики, остался бы
+    устаревшим после того, как реплика догонит основную БД.
+    """
+    if session is not None and not session.info.get("replica"):
+        yield session
+        return
+    async with async_session_maker() as own_session:
+        yield own_session
+
+
 async def get_session():
     async with async_session_maker() as session:
         yield session
@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Text, 
-    ForeignKey, Float, JSON, Enum as SQLEnum
+    ForeignKey, Float, JSON, Index, Enum as SQLEnum
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -52,6 +52,12 @@ class User(Base):
     city = Column(String(255), nullable=True)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
+    geo_cell = Column(String(12), nullable=True, index=True)  # geohash-ячейка для геопоиска
+    
+    # Search filters (кого показывать в ленте)
+    search_age_min = Column(Integer, nullable=True)
+    search_age_max = Column(Integer, nullable=True)
+    search_max_distance_km = Column(Float, nullable=True)
     description = Column(Text, nullable=True)
     photos = Column(JSON, default=list)  # List of file_ids
     videos = Column(JSON, default=list)  # List of file_ids
@@ -68,6 +74,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_banned = Column(Boolean, default=False)
     is_hidden = Column(Boolean, default=False)
+    is_reachable = Column(Boolean, default=True)  # False - бот заблокирован пользователем
     ban_reason = Column(Text, nullable=True)
     
     # Subscription
@@ -92,6 +99,7 @@ class User(Base):
     # Timestamps
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    last_active_at = Column(DateTime, nullable=True)  # Обновляется с троттлингом (middleware/activity.py)
     
     # Relationships
     likes_given = relationship("Like", foreign_keys="Like.from_user_id", back_populates="from_user")
@@ -100,6 +108,18 @@ class User(Base):
     event_participants = relationship("EventParticipant", back_populates="user")
     complaints_received = relationship("Complaint", foreign_keys="Complaint.reported_user_id", back_populates="reported_user")
     complaints_made = relationship("Complaint", foreign_keys="Complaint.reporter_id", back_populates="reporter")
+    
+    __table_args__ = (
+        # Подбор кандидатов: флаги видимости, пол, город и диапазон возраста
+        Index("ix_users_search", "is_active", "is_banned", "is_hidden", "gender", "city", "age"),
+        Index("ix_users_search_age", "is_active", "is_banned", "is_hidden", "gender", "age"),
+        # Рефералы пользователя за период
+        Index("ix_users_referred_by_created_at", "referred_by", "created_at"),
+        # Аудитория рассылки: получатели, город, пол (services/broadcast.py)
+        Index("ix_users_audience", "is_active", "is_banned", "is_reachable", "city", "gender"),
+        # Сегмент рассылки по последней активности (вместе с условиями получателей)
+        Index("ix_users_last_active_at", "is_active", "is_banned", "is_reachable", "last_active_at"),
+    )
 
 
 class Like(Base):
@@ -117,6 +137,13 @@ class Like(Base):
     # Relationships
     from_user = relationship("User", foreign_keys=[from_user_id], back_populates="likes_given")
     to_user = relationship("User", foreign_keys=[to_user_id], back_populates="likes_received")
+    
+    __table_args__ = (
+        # Один лайк на пару; ключ для INSERT ... ON CONFLICT в record_like
+        Index("uq_likes_from_user_to_user", "from_user_id", "to_user_id", unique=True),
+        # Кто лайкнул пользователя (лента "Вы понравились")
+        Index("ix_likes_to_user_from_user", "to_user_id", "from_user_id"),
+    )
 
 
 class Dislike(Base):
@@ -126,6 +153,11 @@ class Dislike(Base):
     from_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     to_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        # Один дизлайк на пару; дизлайки пользователя (seen_set)
+        Index("uq_dislikes_from_user_to_user", "from_user_id", "to_user_id", unique=True),
+    )
 
 
 class Event(Base):
@@ -143,6 +175,13 @@ class Event(Base):
     # Relationships
     creator = relationship("User", back_populates="events_created")
     participants = relationship("EventParticipant", back_populates="event")
+    
+    __table_args__ = (
+        # События города / ближайшие события / события создателя
+        Index("ix_events_city_event_date", "city", "event_date"),
+        Index("ix_events_event_date", "event_date"),
+        Index("ix_events_creator_id_event_date", "creator_id", "event_date"),
+    )
 
 
 class EventParticipant(Base):
@@ -156,6 +195,13 @@ class EventParticipant(Base):
     # Relationships
     event = relationship("Event", back_populates="participants")
     user = relationship("User", back_populates="event_participants")
+    
+    __table_args__ = (
+        # Одно участие на пару; участники события
+        Index("uq_event_participants_event_user", "event_id", "user_id", unique=True),
+        # События, в которых участвует пользователь
+        Index("ix_event_participants_user_id", "user_id"),
+    )
 
 
 class Complaint(Base):
@@ -172,6 +218,11 @@ class Complaint(Base):
     # Relationships
     reporter = relationship("User", foreign_keys=[reporter_id], back_populates="complaints_made")
     reported_user = relationship("User", foreign_keys=[reported_user_id], back_populates="complaints_received")
+    
+    __table_args__ = (
+        # Нерассмотренные жалобы (админка)
+        Index("ix_complaints_is_resolved", "is_resolved"),
+    )
 
 
 class Payment(Base):
@@ -194,6 +245,11 @@ class Payment(Base):
     status = Column(String(50), default="pending")  # pending, completed, failed, expired
     created_at = Column(DateTime, default=func.now())
     completed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Платежи по статусу (ожидающие оплаты, сверка)
+        Index("ix_payments_status_created_at", "status", "created_at"),
+    )
 
 
 class Boost(Base):
@@ -203,6 +259,11 @@ class Boost(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        # Активные boost (реестр boost)
+        Index("ix_boosts_expires_at_user_id", "expires_at", "user_id"),
+    )
 
 
 class AdminMessage(Base):
@@ -217,6 +278,32 @@ class AdminMessage(Base):
     sent_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=func.now())
     sent_at = Column(DateTime, nullable=True)
+    
+    # Состояние отправки (services/broadcast.py)
+    status = Column(String(20), default="draft")  # draft, scheduled, sending, done, cancelled
+    segment = Column(JSON, nullable=True)  # Фильтры аудитории, None - все получатели
+    scheduled_at = Column(DateTime, nullable=True)  # UTC
+    cursor_user_id = Column(Integer, default=0)  # users.id, до которого получатели обработаны
+    failed_count = Column(Integer, default=0)
+    blocked_count = Column(Integer, default=0)
+    report_chat_id = Column(Integer, nullable=True)  # Сообщение с прогрессом у админа
+    report_message_id = Column(Integer, nullable=True)
+
+
+class BroadcastDelivery(Base):
+    __tablename__ = "broadcast_deliveries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    admin_message_id = Column(Integer, ForeignKey("admin_messages.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String(20), nullable=False)  # sent, blocked, failed
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        # Одна доставка на получателя; ключ для INSERT ... ON CONFLICT при возобновлении
+        Index("uq_broadcast_deliveries_message_user", "admin_message_id", "user_id", unique=True),
+    )
 
 
 class SupportChat(Base):
@@ -228,6 +315,11 @@ class SupportChat(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        # Активный чат поддержки пользователя
+        Index("ix_support_chats_user_id_is_active", "user_id", "is_active"),
+    )
 
 
 class SupportMessage(Base):
@@ -241,4 +333,8 @@ class SupportMessage(Base):
     photo = Column(String(255), nullable=True)
     video = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index("ix_support_messages_chat_id", "chat_id"),
+    )
 
@@ -0,0 +1,114 @@
+"""
+Метрики пула соединений SQLAlchemy
+
+Пул подменяется наследником, который замеряет ожидание соединения (_do_get -
+сюда входит и ожидание освобождения соединения при исчерпанном пуле, и
+открытие нового) и считает соединения сверх pool_size, а выдача/возврат
+соединений считаются по событиям пула.
+Исчерпание видно по росту задержки выдачи, overflow-соединениям и таймаутам;
+долгие ожидания и таймауты дополнительно пишутся в лог.
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Счетчики и задержки выдачи соединений"""
+
+    LATENCY_WINDOW = 1000  # Сколько последних выдач учитывать в перцентилях
+    WARN_INTERVAL_SECONDS = 10.0
+
+    def __init__(self):
+        self.checkouts = 0
+        self.overflows = 0  # Открыто соединений сверх pool_size
+        self.timeouts = 0  # Не дождались соединения за pool_timeout
+        self.in_use = 0
+        self.peak_in_use = 0
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._pools: List[Pool] = []
+        self._warned_at = float("-inf")
+
+    def attach(self, pool: Pool) -> None:
+        """Подключает пул (основной БД или реплики; метрики у них общие)"""
+        self._pools.append(pool)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    def timed_get(self, pool: Pool, get: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            connection = get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            logger.warning(
+                f"Пул соединений исчерпан: нет свободного соединения за "
+                f"{time.perf_counter() - started:.1f} с (занято {self.in_use}, {pool.status()})"
+            )
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._latencies.append(elapsed_ms)
+        if elapsed_ms >= settings.DB_POOL_SLOW_CHECKOUT_MS:
+            now = time.monotonic()
+            if now - self._warned_at >= self.WARN_INTERVAL_SECONDS:
+                self._warned_at = now
+                logger.warning(
+                    f"Долгое ожидание соединения из пула: {elapsed_ms:.0f} мс "
+                    f"(занято {self.in_use}, {pool.status()})"
+                )
+        return connection
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self.in_use = max(self.in_use - 1, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения метрик (задержки - по последним LATENCY_WINDOW выдачам, мс)"""
+        latencies = sorted(self._latencies)
+        sizes = [pool.size() for pool in self._pools if hasattr(pool, "size")]
+        return {
+            "pool_size": sum(sizes) if sizes else None,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "checkouts": self.checkouts,
+            "overflows": self.overflows,
+            "timeouts": self.timeouts,
+            "checkout_avg_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+            "checkout_p95_ms": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            "checkout_max_ms": latencies[-1] if latencies else 0.0,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул для PostgreSQL и других серверных БД"""
+
+    def _do_get(self):
+        return pool_metrics.timed_get(self, super()._do_get)
+
+    def _create_connection(self):
+        # _do_get увеличивает счетчик overflow до открытия соединения
+        if self.overflow() > 0:
+            pool_metrics.overflows += 1
+        return super()._create_connection()
+
+
+class InstrumentedNullPool(NullPool):
+    """Без пула (файловая SQLite): соединение открывается на каждую сессию"""
+
+    def _do_get(self):
+        return pool_metrics.timed_get(self, super()._do_get)
@@ -1,5 +1,45 @@
+import logging
+import time
+from typing import Optional
+
 import redis.asyncio as redis
 from config import settings
 
+logger = logging.getLogger(__name__)
+
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Клиент без декодирования ответов - для бинарных значений (битовые карты)
+redis_binary_client = redis.from_url(settings.REDIS_URL, decode_responses=False)
+
+_REDIS_CHECK_INTERVAL = 30  # секунд между повторными проверками
+_redis_available: Optional[bool] = None
+_redis_checked_at = 0.0
+
+
+async def is_redis_available() -> bool:
+    """Проверяет доступность Redis (результат кешируется на 30 секунд)"""
+    global _redis_available, _redis_checked_at
+    now = time.monotonic()
+    if _redis_available is not None and now - _redis_checked_at < _REDIS_CHECK_INTERVAL:
+        return _redis_available
+
+    try:
+        await redis_client.ping()
+        available = True
+    except Exception as e:
+        available = False
+        if _redis_available is not False:
+            logger.warning(f"Redis недоступен ({e}), используются in-process структуры")
+
+    _redis_available = available
+    _redis_checked_at = now
+    return available
+
 
+def mark_redis_unavailable(error: Exception) -> None:
+    """Помечает Redis недоступным после ошибки (до следующей проверки)"""
+    global _redis_available, _redis_checked_at
+    if _redis_available is not False:
+        logger.warning(f"Ошибка Redis ({error}), временно используются in-process структуры")
+    _redis_available = False
+    _redis_checked_at = time.monotonic()
@@ -47,7 +47,33 @@ async def cmd_admin(message: Message, session: AsyncSession):
     await message.answer(text, reply_markup=keyboard)
 
 
-@router.callback_query(F.data == "admin_stats")
+@router.message(F.text == "/rebuild_seen")
+async def cmd_rebuild_seen(message: Message):
+    """Перестройка индекса просмотренных анкет из таблиц likes/dislikes (в фоне)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("Доступ запрещен!")
+        return
+    
+    from services.seen_set import seen_set
+    status = await message.answer("⏳ Перестраиваю индекс просмотренных анкет...")
+    if not seen_set.start_rebuild(message.bot, status.chat.id, status.message_id):
+        await status.edit_text("⏳ Индекс уже перестраивается")
+
+
+@router.message(F.text == "/retry_notifications")
+async def cmd_retry_notifications(message: Message):
+    """Повторная отправка уведомлений из dead-letter"""
+    if not is_admin(message.from_user.id):
+        await message.answer("Доступ запрещен!")
+        return
+
+    from services.notifications import notification_dispatcher
+    requeued = await notification_dispatcher.retry_dead()
+    left = await notification_dispatcher.dead_count()
+    await message.answer(f"✅ Поставлено в очередь повторно: {requeued}\nОсталось недоставленных: {left}")
+
+
+@router.callback_query(F.data == "admin_stats", flags={"read_only": True})
 async def callback_admin_stats(callback: CallbackQuery, session: AsyncSession):
     """Статистика для админа"""
     if not is_admin(callback.from_user.id):
@@ -73,6 +99,15 @@ async def callback_admin_stats(callback: CallbackQuery, session: AsyncSession):
 🎉 Событий: {total_events.scalar()}
 🚫 Жалоб на модерации: {pending_complaints.scalar()}"""
     
+    from database.pool_metrics import pool_metrics
+    pool = pool_metrics.snapshot()
+    text += f"""
+
+🗄 Пул соединений БД
+Занято: {pool['in_use']} (пик {pool['peak_in_use']}, размер {pool['pool_size'] or '-'})
+Ожидание соединения: {pool['checkout_avg_ms']:.1f} / p95 {pool['checkout_p95_ms']:.1f} / max {pool['checkout_max_ms']:.1f} мс
+Сверх пула: {pool['overflows']}, таймаутов: {pool['timeouts']}"""
+    
     await callback.message.edit_text(text, reply_markup=get_back_keyboard())
     await callback.answer()
 
@@ -133,7 +168,36 @@ async def process_broadcast_buttons(message: Message, state: FSMContext, session
                 text, url = line.split("|", 1)
                 buttons.append({"text": text.strip(), "url": url.strip()})
     
+    await state.update_data(buttons=buttons if buttons else None)
+    
+    await message.answer(
+        "Кому отправить? Фильтры аудитории, каждый с новой строки (формат: Поле: значение):\n"
+        "Город: Москва\n"
+        "Пол: male / female\n"
+        "Интерес: male / female / all\n"
+        "Подписка: active / expired / cancelled\n"
+        "Верификация: да / нет\n"
+        "Активность, дней: 7\n\n"
+        "Или /skip - всем пользователям"
+    )
+    await state.set_state(AdminBroadcast.segment)
+
+
+@router.message(AdminBroadcast.segment)
+async def process_broadcast_segment(message: Message, state: FSMContext, session: AsyncSession):
+    """Обработка аудитории рассылки"""
+    from services.broadcast import parse_segment, describe_segment, count_recipients
+    
+    segment = None
+    if message.text and message.text != "/skip":
+        try:
+            segment = parse_segment(message.text) or None
+        except ValueError as e:
+            await message.answer(f"❌ {e}\n\nПопробуйте еще раз или /skip")
+            return
+    
     data = await state.get_data()
+    buttons = data.get("buttons")
     
     # Сохраняем рассылку
     admin_msg = AdminMessage(
@@ -141,11 +205,15 @@ async def process_broadcast_buttons(message: Message, state: FSMContext, session
         message_text=data.get("text"),
         photo=data.get("photo"),
         video=data.get("video"),
-        buttons=buttons if buttons else None
+        buttons=buttons,
+        segment=segment
     )
     session.add(admin_msg)
     await session.commit()
     
+    # Размер аудитории считается теми же условиями, что и отбор получателей
+    audience = await count_recipients(session, segment)
+    
     # Показываем превью
     preview_text = "📢 Превью рассылки:\n\n"
     if data.get("text"):
@@ -154,9 +222,12 @@ async def process_broadcast_buttons(message: Message, state: FSMContext, session
         preview_text += "Кнопки:\n"
         for btn in buttons:
             preview_text += f"• {btn['text']}\n"
+        preview_text += "\n"
+    preview_text += f"👥 Аудитория: {describe_segment(segment)}\nПолучателей: {audience}"
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Отправить", callback_data=f"broadcast_send_{admin_msg.id}")],
+        [InlineKeyboardButton(text="🕒 Запланировать", callback_data=f"broadcast_schedule_{admin_msg.id}")],
         [InlineKeyboardButton(text="❌ Отменить", callback_data="admin_broadcast")]
     ])
     
@@ -185,59 +256,103 @@ async def callback_broadcast_send(callback: CallbackQuery, session: AsyncSession
         await callback.answer("Рассылка не найдена!", show_alert=True)
         return
     
-    # Получаем всех активных пользователей
-    users_result = await session.execute(
-        select(User).where(User.is_active == True, User.is_banned == False)
-    )
-    users = users_result.scalars().all()
+    from services.broadcast import broadcast_engine
     
-    sent_count = 0
-    for user in users:
-        try:
-            # Создаем клавиатуру с кнопками
-            keyboard = None
-            if admin_msg.buttons:
-                inline_buttons = []
-                for btn in admin_msg.buttons:
-                    inline_buttons.append([InlineKeyboardButton(
-                        text=btn["text"],
-                        url=btn["url"]
-                    )])
-                keyboard = InlineKeyboardMarkup(inline_keyboard=inline_buttons)
-            
-            # Отправляем сообщение
-            if admin_msg.photo:
-                await callback.bot.send_photo(
-                    user.telegram_id,
-                    admin_msg.photo,
-                    caption=admin_msg.message_text,
-                    reply_markup=keyboard
-                )
-            elif admin_msg.video:
-                await callback.bot.send_video(
-                    user.telegram_id,
-                    admin_msg.video,
-                    caption=admin_msg.message_text,
-                    reply_markup=keyboard
-                )
-            else:
-                await callback.bot.send_message(
-                    user.telegram_id,
-                    admin_msg.message_text,
-                    reply_markup=keyboard
-                )
-            sent_count += 1
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Ошибка отправки пользователю {user.telegram_id}: {e}")
-    
-    admin_msg.sent_count = sent_count
-    admin_msg.sent_at = func.now()
+    if admin_msg.status == "sending" or broadcast_engine.is_running(admin_msg.id):
+        await callback.answer("Рассылка уже отправляется!", show_alert=True)
+        return
+    if admin_msg.status in ("done", "cancelled"):
+        await callback.answer("Рассылка уже была отправлена!", show_alert=True)
+        return
+    if admin_msg.status == "scheduled":
+        await callback.answer("Рассылка запланирована - сначала отмените ее", show_alert=True)
+        return
+    
+    # Прогресс показывается отдельным сообщением: превью может быть фото или видео
+    report = await callback.message.answer(f"⏳ Рассылка #{admin_msg.id} запускается...")
+    admin_msg.status = "sending"
+    admin_msg.report_chat_id = report.chat.id
+    admin_msg.report_message_id = report.message_id
     await session.commit()
     
-    await callback.answer(f"Рассылка отправлена {sent_count} пользователям!")
-    await callback.message.edit_text(f"✅ Рассылка отправлена {sent_count} пользователям!")
+    broadcast_engine.start(callback.bot, admin_msg.id)
+    await callback.answer("Рассылка запущена!")
+
+
+@router.callback_query(F.data.startswith("broadcast_schedule_"))
+async def callback_broadcast_schedule(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Планирование рассылки"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Доступ запрещен!", show_alert=True)
+        return
+    
+    admin_msg_id = int(callback.data.split("_")[2])
+    admin_msg = await session.get(AdminMessage, admin_msg_id)
+    if not admin_msg or admin_msg.status not in (None, "draft"):
+        await callback.answer("Рассылку уже нельзя запланировать", show_alert=True)
+        return
+    
+    await state.update_data(admin_msg_id=admin_msg_id)
+    await callback.message.answer("Когда отправить? Формат: ДД.ММ.ГГГГ ЧЧ:ММ (UTC)")
+    await state.set_state(AdminBroadcast.schedule)
+    await callback.answer()
+
+
+@router.message(AdminBroadcast.schedule)
+async def process_broadcast_schedule(message: Message, state: FSMContext, session: AsyncSession):
+    """Обработка времени запланированной рассылки"""
+    from datetime import datetime
+    
+    try:
+        scheduled_at = datetime.strptime(message.text.strip(), "%d.%m.%Y %H:%M")
+    except (ValueError, AttributeError):
+        await message.answer("Неверный формат! Используйте: ДД.ММ.ГГГГ ЧЧ:ММ")
+        return
+    if scheduled_at <= datetime.utcnow():
+        await message.answer("Время уже прошло! Укажите время в будущем (UTC)")
+        return
+    
+    data = await state.get_data()
+    admin_msg = await session.get(AdminMessage, data.get("admin_msg_id"))
+    await state.clear()
+    if not admin_msg or admin_msg.status not in (None, "draft"):
+        await message.answer("Рассылку уже нельзя запланировать")
+        return
+    
+    # Это же сообщение потом показывает прогресс отправки
+    report = await message.answer(
+        f"🕒 Рассылка #{admin_msg.id} запланирована на {scheduled_at.strftime('%d.%m.%Y %H:%M')} UTC",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="❌ Отменить", callback_data=f"broadcast_cancel_{admin_msg.id}")
+        ]])
+    )
+    admin_msg.status = "scheduled"
+    admin_msg.scheduled_at = scheduled_at
+    admin_msg.report_chat_id = report.chat.id
+    admin_msg.report_message_id = report.message_id
+    await session.commit()
+
+
+@router.callback_query(F.data.startswith("broadcast_cancel_"))
+async def callback_broadcast_cancel(callback: CallbackQuery, session: AsyncSession):
+    """Остановка рассылки"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Доступ запрещен!", show_alert=True)
+        return
+    
+    admin_msg_id = int(callback.data.split("_")[2])
+    admin_msg = await session.get(AdminMessage, admin_msg_id)
+    if not admin_msg or admin_msg.status not in ("scheduled", "sending"):
+        await callback.answer("Рассылка не отправляется", show_alert=True)
+        return
+    
+    # Движок проверяет статус перед каждой страницей получателей
+    was_scheduled = admin_msg.status == "scheduled"
+    admin_msg.status = "cancelled"
+    await session.commit()
+    if was_scheduled:
+        await callback.message.edit_text(f"❌ Запланированная рассылка #{admin_msg.id} отменена")
+    await callback.answer("Рассылка будет остановлена")
 
 
 @router.callback_query(F.data == "admin_moderation")
@@ -333,12 +448,20 @@ async def callback_complaint_ban(callback: CallbackQuery, session: AsyncSession)
         complaint.is_resolved = True
         await session.commit()
         
+        from middleware.user_context import user_cache
+        from services.candidate_queue import candidate_queue
+        from services.profile_prefetch import profile_prefetch
+        candidate_queue.discard(reported_user.id)
+        user_cache.invalidate(reported_user.telegram_id)
+        profile_prefetch.discard_profile(reported_user.id)
+        
+        from services.notifications import notification_dispatcher
         try:
-            await callback.bot.send_message(
+            await notification_dispatcher.enqueue(
                 reported_user.telegram_id,
                 f"Ваша анкета была заблокирована по причине: {complaint.reason.value}"
             )
-        except:
+        except Exception:
             pass
     
     await callback.answer("Пользователь забанен!")
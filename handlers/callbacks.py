@@ -1,3 +1,4 @@
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
@@ -7,28 +8,33 @@ from database.models import User, Like, Dislike, Event, EventParticipant, Compla
 from database.connection import get_session
 from keyboards.common import *
 from utils.helpers import (
-    can_like, can_dislike, check_mutual_like, get_next_profile, 
-    format_profile_text, reset_daily_limits
+    can_like, can_dislike, record_like, mutual_like_notice, increment_user_counters,
+    format_profile_text, format_filters_text, reset_daily_limits
 )
 from utils.locales import get_text
+from utils.geo import distance_between
 from datetime import datetime, timedelta
 from services.telegram_payments import telegram_payment_service
 from services.crypto_payments import crypto_payment_service
+from services.candidate_queue import candidate_queue
+from services.seen_set import seen_set
+from services.swipe_buffer import swipe_buffer
+from services.notifications import notification_dispatcher
+from services.like_digest import like_digest
+from services.boost_registry import boost_registry
+from services.profile_prefetch import profile_prefetch
+from utils.profile_card import send_profile_card
 from aiogram.types import LabeledPrice
 from aiogram import Bot
 from config import settings
-from handlers.states import ProfileCreation, EventCreation, SuperLike, CryptoPayment
+from handlers.states import ProfileCreation, EventCreation, SuperLike, CryptoPayment, SearchFilters
 
 router = Router()
 
 
-@router.callback_query(F.data == "view_profiles")
-async def callback_view_profiles(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+@router.callback_query(F.data == "view_profiles", flags={"read_only": True})
+async def callback_view_profiles(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Просмотр анкет"""
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user or not user.name:
         await callback.answer("Сначала заполни анкету!", show_alert=True)
         return
@@ -37,70 +43,33 @@ async def callback_view_profiles(callback: CallbackQuery, session: AsyncSession,
         await callback.answer("Твоя анкета отключена. Включи её в настройках!", show_alert=True)
         return
     
-    next_profile = await get_next_profile(session, user)
+    card = await profile_prefetch.next_card(session, user)
     
     lang = user.language or 'ru'
     
-    if not next_profile:
+    if not card:
         await callback.message.edit_text(
             get_text(lang, 'no_profiles'),
             reply_markup=get_pause_menu_keyboard(lang)
         )
         return
     
-    text = format_profile_text(next_profile)
-    
     # Сохраняем ID текущего профиля в состояние для жалоб
-    await state.update_data(last_viewed_user_id=next_profile.id)
-    
-    keyboard = get_profile_view_keyboard(lang)
-    # Добавляем ID профиля в callback_data
-    keyboard.inline_keyboard[0][0].callback_data = f"like_{next_profile.id}"
-    keyboard.inline_keyboard[0][1].callback_data = f"dislike_{next_profile.id}"
-    keyboard.inline_keyboard[0][2].callback_data = f"super_like_{next_profile.id}"
-    keyboard.inline_keyboard[1][0].callback_data = f"next_profile"
+    await state.update_data(last_viewed_user_id=card.profile_id)
     
-    # Приоритет: сначала видео, потом фото
-    if next_profile.videos and len(next_profile.videos) > 0:
-        try:
-            await callback.message.delete()
-        except:
-            pass
-        try:
-            await callback.message.answer_video(next_profile.videos[0], caption=text, reply_markup=keyboard, parse_mode="HTML")
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Не удалось отправить видео профиля: {e}. Пробуем фото.")
-            # Если видео не отправилось, пробуем фото
-            if next_profile.photos and len(next_profile.photos) > 0:
-                try:
-                    await callback.message.answer_photo(next_profile.photos[0], caption=text, reply_markup=keyboard, parse_mode="HTML")
-                except:
-                    await callback.message.answer(text, reply_markup=keyboard, parse_mode="HTML")
-            else:
-                await callback.message.answer(text, reply_markup=keyboard, parse_mode="HTML")
-    elif next_profile.photos and len(next_profile.photos) > 0:
-        try:
-            await callback.message.delete()
-        except:
-            pass
-        try:
-            await callback.message.answer_photo(next_profile.photos[0], caption=text, reply_markup=keyboard, parse_mode="HTML")
-        except Exception as e:
-            # Если file_id невалиден (например, от старого бота), отправляем только текст
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Не удалось отправить фото профиля: {e}. Отправляем текст без фото.")
-            await callback.message.answer(text, reply_markup=keyboard, parse_mode="HTML")
-    else:
-        await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await send_profile_card(callback.message, card, replace=True)
+    try:
+        await callback.answer()
+    except Exception:
+        # На callback уже ответил вызывающий обработчик (лайк, дизлайк)
+        pass
     
-    await callback.answer()
+    # Пока пользователь смотрит анкету, готовим следующую
+    profile_prefetch.schedule(user.id)
 
 
 @router.callback_query(F.data.startswith("like_"))
-async def callback_like(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+async def callback_like(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Лайк"""
     import logging
     logger = logging.getLogger(__name__)
@@ -123,9 +92,6 @@ async def callback_like(callback: CallbackQuery, session: AsyncSession, state: F
             return
         logger.info(f"ID целевого пользователя из состояния: {target_user_id}")
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     result_target = await session.execute(select(User).where(User.id == target_user_id))
     target_user = result_target.scalar_one_or_none()
     
@@ -145,93 +111,58 @@ async def callback_like(callback: CallbackQuery, session: AsyncSession, state: F
         await callback.answer(error_msg, show_alert=True)
         return
     
-    # Проверяем, не лайкали ли уже
-    existing_like = await session.execute(
-        select(Like).where(Like.from_user_id == user.id, Like.to_user_id == target_user_id)
-    )
-    if existing_like.scalar_one_or_none():
-        logger.info(f"Пользователь {user_id} уже лайкнул {target_user_id}")
-        await callback.answer("Вы уже лайкнули этого пользователя!", show_alert=True)
-        return
-    
     logger.info(f"Создание лайка: пользователь {user_id} (id={user.id}) лайкает {target_user_id} (id={target_user.id})")
     
     try:
-        # Создаем лайк
-        like = Like(from_user_id=user.id, to_user_id=target_user_id)
-        session.add(like)
+        # Вставка и проверка взаимности - два запроса в одной транзакции
+        created, is_mutual = await record_like(session, user.id, target_user_id)
+        if not created:
+            await session.rollback()
+            logger.info(f"Пользователь {user_id} уже лайкнул {target_user_id}")
+            await callback.answer("Вы уже лайкнули этого пользователя!", show_alert=True)
+            return
         
-        # Обновляем счетчики (убрано daily_likes_used, так как лимиты отключены)
-        user.total_likes += 1
-        target_user.total_likes += 1
+        # Счетчики total_likes обновлены в record_like
+        await session.commit()
+        await seen_set.add(user.id, target_user_id)
+        logger.info(f"Лайк успешно сохранен: пользователь {user_id} лайкнул {target_user_id}")
         
-        # Проверяем взаимную симпатию
-        is_mutual = await check_mutual_like(session, user.id, target_user_id)
         if is_mutual:
-            like.is_mutual = True
-            # Обновляем предыдущий лайк
-            prev_like = await session.execute(
-                select(Like).where(Like.from_user_id == target_user_id, Like.to_user_id == user.id)
-            )
-            prev_like_obj = prev_like.scalar_one_or_none()
-            if prev_like_obj:
-                prev_like_obj.is_mutual = True
-            
             # Показываем взаимную симпатию с именем, username и кнопкой
-            target_name = target_user.name or target_user.first_name or "Пользователь"
-            target_username = target_user.username or ""
-            
-            from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-            mutual_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="👤 Посмотреть анкету", callback_data=f"view_profile_{target_user.id}")
-            ]])
-            
-            mutual_text = f"💕 Взаимная симпатия!\n\n"
-            mutual_text += f"👤 {target_name}"
-            if target_username:
-                mutual_text += f" (@{target_username})"
-            mutual_text += f"\n\nВы понравились друг другу!"
-            
+            mutual_text, mutual_keyboard = mutual_like_notice(target_user)
             await callback.message.answer(
                 mutual_text,
                 reply_markup=mutual_keyboard
             )
         
-        await session.commit()
-        logger.info(f"Лайк успешно сохранен: пользователь {user_id} лайкнул {target_user_id}")
+        await callback.answer("❤️ Лайк поставлен!")
+        
+        # Сначала показываем следующую анкету (обычно уже предзагружена), потом уведомляем
+        try:
+            await callback_view_profiles(callback, session, state, user)
+        except Exception as e:
+            logger.error(f"Ошибка при показе следующего профиля после лайка: {e}", exc_info=True)
+            # Не показываем ошибку пользователю, просто логируем
         
         # УВЕДОМЛЯЕМ пользователя, которому поставили лайк (для всех, включая бесплатных)
         try:
             liker_name = user.name or user.first_name or "Кто-то"
             liker_username = user.username or ""
             
-            from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-            notification_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="👤 Посмотреть анкету", callback_data=f"view_profile_{user.id}")
-            ]])
-            
-            notification_text = f"❤️ Вам поставили лайк!\n\n"
-            notification_text += f"👤 {liker_name}"
-            if liker_username:
-                notification_text += f" (@{liker_username})"
-            
-            # Отправляем уведомление
-            await callback.bot.send_message(
-                target_user.telegram_id,
-                notification_text,
-                reply_markup=notification_keyboard
-            )
-        except Exception as e:
-            logger.warning(f"Не удалось отправить уведомление о лайке пользователю {target_user.telegram_id}: {e}")
-        
-        # Показываем следующую анкету
-        try:
-            await callback_view_profiles(callback, session, state)
+            if is_mutual:
+                # Взаимная симпатия уходит сразу, мимо окна сводки
+                notification_text, notification_keyboard = mutual_like_notice(user)
+                await notification_dispatcher.enqueue(
+                    target_user.telegram_id,
+                    notification_text,
+                    reply_markup=notification_keyboard
+                )
+            else:
+                # Обычные лайки копятся и приходят одной сводкой
+                await like_digest.add(target_user.telegram_id, user.id, liker_name, liker_username)
         except Exception as e:
-            logger.error(f"Ошибка при показе следующего профиля после лайка: {e}", exc_info=True)
-            # Не показываем ошибку пользователю, просто логируем
+            logger.warning(f"Не удалось поставить уведомление о лайке пользователю {target_user.telegram_id}: {e}")
         
-        await callback.answer("❤️ Лайк поставлен!")
     except Exception as e:
         logger.error(f"Ошибка при сохранении лайка: {e}", exc_info=True)
         await session.rollback()
@@ -240,10 +171,8 @@ async def callback_like(callback: CallbackQuery, session: AsyncSession, state: F
 
 
 @router.callback_query(F.data.startswith("dislike"))
-async def callback_dislike(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+async def callback_dislike(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Дизлайк"""
-    user_id = callback.from_user.id
-    
     # Получаем ID целевого пользователя из callback_data или из состояния
     if "_" in callback.data:
         target_user_id = int(callback.data.split("_")[1])
@@ -255,9 +184,6 @@ async def callback_dislike(callback: CallbackQuery, session: AsyncSession, state
             await callback.answer("Ошибка! Профиль не найден.", show_alert=True)
             return
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -267,34 +193,27 @@ async def callback_dislike(callback: CallbackQuery, session: AsyncSession, state
         await callback.answer(error_msg, show_alert=True)
         return
     
-    # Проверяем, не дизлайкали ли уже
-    existing_dislike = await session.execute(
-        select(Dislike).where(Dislike.from_user_id == user.id, Dislike.to_user_id == target_user_id)
-    )
-    if existing_dislike.scalar_one_or_none():
+    # Проверяем, не оценивали ли уже (seen-set видит и еще не записанные дизлайки)
+    if await seen_set.contains(session, user.id, target_user_id):
         await callback.answer("Следующая анкета", show_alert=False)
-        await callback_view_profiles(callback, session, state)
+        await callback_view_profiles(callback, session, state, user)
         return
     
-    # Создаем дизлайк
-    dislike = Dislike(from_user_id=user.id, to_user_id=target_user_id)
-    session.add(dislike)
-    
-    user.daily_dislikes_used += 1
-    user.total_dislikes += 1
+    # Дизлайк пишется в БД пачкой в фоне (total_dislikes обновляется там же)
+    await swipe_buffer.add_dislike(session, user.id, target_user_id)
+    await increment_user_counters(session, [user.id], daily_dislikes_used=1)
     
     await session.commit()
+    await seen_set.add(user.id, target_user_id)
     await callback.answer("👎🏼 Дизлайк")
     
     # Показываем следующую анкету
-    await callback_view_profiles(callback, session, state)
+    await callback_view_profiles(callback, session, state, user)
 
 
 @router.callback_query(F.data.startswith("super_like"))
-async def callback_super_like(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def callback_super_like(callback: CallbackQuery, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Суперлайк"""
-    user_id = callback.from_user.id
-    
     # Получаем ID целевого пользователя из callback_data или из состояния
     if "_" in callback.data and callback.data.count("_") >= 2:
         target_user_id = int(callback.data.split("_")[2])
@@ -306,9 +225,6 @@ async def callback_super_like(callback: CallbackQuery, state: FSMContext, sessio
             await callback.answer("Ошибка! Профиль не найден.", show_alert=True)
             return
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -325,8 +241,8 @@ async def callback_super_like(callback: CallbackQuery, state: FSMContext, sessio
     await callback.answer()
 
 
-@router.callback_query(F.data == "next_profile")
-async def callback_next_profile(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+@router.callback_query(F.data == "next_profile", flags={"read_only": True})
+async def callback_next_profile(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Следующая анкета"""
     try:
         await callback.answer()  # Отвечаем на callback сразу, чтобы избежать ошибок
@@ -337,7 +253,7 @@ async def callback_next_profile(callback: CallbackQuery, session: AsyncSession,
     
     # Вызываем функцию просмотра анкет
     try:
-        await callback_view_profiles(callback, session, state)
+        await callback_view_profiles(callback, session, state, user)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -357,7 +273,7 @@ async def callback_edit_profile(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("complaint_"))
-async def callback_complaint(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+async def callback_complaint(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Обработка жалобы"""
     from database.models import ComplaintReason
     reason_map = {
@@ -379,10 +295,6 @@ async def callback_complaint(callback: CallbackQuery, session: AsyncSession, sta
         await callback.answer("Ошибка! Пользователь не найден.", show_alert=True)
         return
     
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -419,15 +331,12 @@ async def callback_event_create(callback: CallbackQuery, state: FSMContext):
 async def callback_buy_subscription(
     callback: CallbackQuery, 
     session: AsyncSession,
-    bot: Bot
+    bot: Bot,
+    user: Optional[User]
 ):
     """Покупка подписки"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -489,13 +398,12 @@ async def callback_buy_super_like(
     callback: CallbackQuery, 
     session: AsyncSession,
     bot: Bot,
-    state: FSMContext
+    state: FSMContext,
+    user: Optional[User]
 ):
     """Покупка суперлайка"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     
-    user_id = callback.from_user.id
-    
     # Получаем ID целевого пользователя из callback_data (если есть)
     target_user_id = None
     if "_" in callback.data:
@@ -510,8 +418,6 @@ async def callback_buy_super_like(
     if target_user_id:
         await state.update_data(super_like_target=target_user_id)
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     lang = user.language if user else 'ru'
     
     # Показываем выбор способа оплаты
@@ -565,31 +471,29 @@ async def callback_buy_super_like(
 
 
 @router.callback_query(F.data == "boost")
-async def callback_boost(callback: CallbackQuery, session: AsyncSession):
+async def callback_boost(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Boost анкеты"""
     user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
     
     # Проверяем, есть ли активный boost
-    existing_boost = await session.execute(
-        select(Boost).where(Boost.user_id == user.id, Boost.expires_at > datetime.utcnow())
-    )
-    if existing_boost.scalar_one_or_none():
+    await boost_registry.ensure_loaded(session)
+    if boost_registry.is_active(user.id):
         await callback.answer("У вас уже есть активный boost!", show_alert=True)
         return
     
     # Создаем boost на 24 часа
+    expires_at = datetime.utcnow() + timedelta(hours=24)
     boost = Boost(
         user_id=user.id,
-        expires_at=datetime.utcnow() + timedelta(hours=24)
+        expires_at=expires_at
     )
     session.add(boost)
     await session.commit()
+    boost_registry.add(user.id, expires_at)
     
     await callback.answer("💎 Ваша анкета поднята в топ на 24 часа!")
 
@@ -609,7 +513,7 @@ async def callback_interest(callback: CallbackQuery, state: FSMContext):
     """Выбор интереса"""
     interest = callback.data
     await state.update_data(interest=interest)
-    await callback.message.answer("Из какого ты города?", reply_markup=None)
+    await callback.message.answer("Из какого ты города?", reply_markup=get_city_keyboard())
     await state.set_state(ProfileCreation.city)
     await callback.answer()
 
@@ -639,13 +543,9 @@ async def callback_city_manual(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "confirm_yes")
-async def callback_confirm_yes(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def callback_confirm_yes(callback: CallbackQuery, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Подтверждение анкеты"""
     data = await state.get_data()
-    user_id = callback.from_user.id
-    
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if user:
         # Обновляем данные
@@ -655,6 +555,8 @@ async def callback_confirm_yes(callback: CallbackQuery, state: FSMContext, sessi
         user.city = data.get("city")
         user.photos = data.get("photos", [])
         user.videos = data.get("videos", [])
+        from utils.geo import apply_location
+        apply_location(user, data.get("latitude"), data.get("longitude"))
         
         if data.get("gender") == "gender_male":
             from database.models import Gender
@@ -674,6 +576,9 @@ async def callback_confirm_yes(callback: CallbackQuery, state: FSMContext, sessi
             user.interest = Interest.ALL
         
         await session.commit()
+        
+        # Анкета и фильтры изменились - подбираем кандидатов заново
+        candidate_queue.invalidate(user.id)
     
     # После подтверждения анкеты запрашиваем верификацию
     from handlers.states import Verification
@@ -711,16 +616,15 @@ async def callback_pause_confirm(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "pause_yes")
-async def callback_pause_yes(callback: CallbackQuery, session: AsyncSession):
+async def callback_pause_yes(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Отключение анкеты"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if user:
         user.is_active = False
         await session.commit()
+        candidate_queue.discard(user.id)
+        profile_prefetch.discard_profile(user.id)
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="🚀 Смотреть анкеты", callback_data="view_profiles")
@@ -766,36 +670,59 @@ async def callback_edit_text(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "filters")
-async def callback_filters(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+async def callback_filters(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Фильтры"""
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Сначала создай анкету!", show_alert=True)
         return
     
-    text = f"""⚙️ Фильтры поиска
+    await callback.message.answer(format_filters_text(user), reply_markup=get_filters_keyboard())
+    await callback.answer()
 
-Текущие настройки:
-• Пол: {user.gender.value if user.gender else 'Не указан'}
-• Интерес: {user.interest.value if user.interest else 'Не указан'}
-• Город: {user.city or 'Не указан'}
 
-Изменить фильтры можно при редактировании анкеты."""
-    
-    await callback.message.answer(text, reply_markup=get_back_keyboard())
+@router.callback_query(F.data == "filter_age")
+async def callback_filter_age(callback: CallbackQuery, state: FSMContext):
+    """Фильтр по возрасту"""
+    await callback.message.answer(
+        "🎂 Напиши диапазон возраста, например: 20-30\n\n"
+        "Можно указать только нижнюю границу (25-) или верхнюю (-35)."
+    )
+    await state.set_state(SearchFilters.age_range)
     await callback.answer()
 
 
+@router.callback_query(F.data == "filter_distance")
+async def callback_filter_distance(callback: CallbackQuery, state: FSMContext):
+    """Фильтр по расстоянию"""
+    await callback.message.answer(
+        "📍 Напиши максимальное расстояние в километрах, например: 30\n\n"
+        "Фильтр работает, если в анкете отправлена геолокация. 0 - без ограничения."
+    )
+    await state.set_state(SearchFilters.max_distance)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "filter_reset")
+async def callback_filter_reset(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
+    """Сброс фильтров поиска"""
+    if not user:
+        await callback.answer("Сначала создай анкету!", show_alert=True)
+        return
+    
+    user.search_age_min = None
+    user.search_age_max = None
+    user.search_max_distance_km = None
+    await session.commit()
+    candidate_queue.invalidate(user.id)
+    await state.clear()
+    
+    await callback.message.answer(format_filters_text(user), reply_markup=get_filters_keyboard())
+    await callback.answer("Фильтры сброшены")
+
+
 @router.callback_query(F.data == "subscription")
-async def callback_subscription(callback: CallbackQuery, session: AsyncSession):
+async def callback_subscription(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Меню подписки"""
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -816,7 +743,7 @@ async def callback_subscription(callback: CallbackQuery, session: AsyncSession):
 
 
 @router.callback_query(F.data == "my_profile")
-async def callback_my_profile(callback: CallbackQuery, session: AsyncSession):
+async def callback_my_profile(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Моя анкета через callback"""
     from handlers.commands import cmd_my_profile
     # Создаем фиктивный message объект из callback
@@ -827,17 +754,13 @@ async def callback_my_profile(callback: CallbackQuery, session: AsyncSession):
             self.text = None
     
     fake_message = FakeMessage(callback)
-    await cmd_my_profile(fake_message, session)
+    await cmd_my_profile(fake_message, session, state, user)
     await callback.answer()
 
 
 @router.callback_query(F.data == "invite_friends")
-async def callback_invite_friends(callback: CallbackQuery, session: AsyncSession):
+async def callback_invite_friends(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Пригласить друзей через callback"""
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Сначала создай анкету!", show_alert=True)
         return
@@ -899,14 +822,11 @@ async def callback_event_edit(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("event_delete_"))
-async def callback_event_delete(callback: CallbackQuery, session: AsyncSession):
+async def callback_event_delete(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Удаление события"""
     event_id = int(callback.data.split("_")[2])
     user_id = callback.from_user.id
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -936,7 +856,7 @@ async def callback_event_delete(callback: CallbackQuery, session: AsyncSession):
 
 
 @router.callback_query(F.data.startswith("crypto_pay_subscription_"))
-async def callback_crypto_pay_subscription(callback: CallbackQuery, session: AsyncSession):
+async def callback_crypto_pay_subscription(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Обработка выбора криптоплатежа для подписки"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from database.models import Payment
@@ -944,9 +864,6 @@ async def callback_crypto_pay_subscription(callback: CallbackQuery, session: Asy
     network = callback.data.split("_")[-1]  # BEP20, ERC20, TRC20, POLYGON
     user_id = callback.from_user.id
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -1000,7 +917,7 @@ async def callback_crypto_pay_subscription(callback: CallbackQuery, session: Asy
 
 
 @router.callback_query(F.data.startswith("crypto_pay_super_like_"))
-async def callback_crypto_pay_super_like(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+async def callback_crypto_pay_super_like(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Обработка выбора криптоплатежа для суперлайка"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from database.models import Payment
@@ -1011,9 +928,6 @@ async def callback_crypto_pay_super_like(callback: CallbackQuery, session: Async
     
     user_id = callback.from_user.id
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -1175,6 +1089,10 @@ async def callback_check_crypto_payment(callback: CallbackQuery, session: AsyncS
                 )
         
         await session.commit()
+        # Подписка меняет анкету вне ее обработчиков - сбрасываем кеш анкеты
+        if user:
+            from middleware.user_context import user_cache
+            user_cache.invalidate(user.telegram_id)
         await callback.answer("✅ Платеж подтвержден!", show_alert=True)
         
         # Обновляем сообщение
@@ -1313,6 +1231,10 @@ async def process_transaction_hash(message: Message, session: AsyncSession, stat
                 )
         
         await session.commit()
+        # Подписка меняет анкету вне ее обработчиков - сбрасываем кеш анкеты
+        if user:
+            from middleware.user_context import user_cache
+            user_cache.invalidate(user.telegram_id)
         await message.answer(
             f"✅ <b>Платеж подтвержден!</b>\n\n"
             f"Транзакция: <code>{payment.transaction_hash}</code>\n"
@@ -1333,7 +1255,7 @@ async def process_transaction_hash(message: Message, session: AsyncSession, stat
 
 
 @router.callback_query(F.data.startswith("view_profile_"))
-async def callback_view_profile(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+async def callback_view_profile(callback: CallbackQuery, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Просмотр конкретного профиля по ID"""
     try:
         target_user_id = int(callback.data.split("_")[2])
@@ -1341,10 +1263,6 @@ async def callback_view_profile(callback: CallbackQuery, session: AsyncSession,
         await callback.answer("Ошибка! Профиль не найден.", show_alert=True)
         return
     
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка! Начните с /start", show_alert=True)
         return
@@ -1360,7 +1278,7 @@ async def callback_view_profile(callback: CallbackQuery, session: AsyncSession,
     # Сохраняем ID в состояние
     await state.update_data(last_viewed_user_id=target_user.id)
     
-    text = format_profile_text(target_user)
+    text = format_profile_text(target_user, distance_between(user, target_user))
     lang = user.language or 'ru'
     keyboard = get_profile_view_keyboard(lang)
     keyboard.inline_keyboard[0][0].callback_data = f"like_{target_user.id}"
@@ -1397,6 +1315,31 @@ async def callback_view_profile(callback: CallbackQuery, session: AsyncSession,
     await callback.answer()
 
 
+@router.callback_query(F.data == "likes_list")
+async def callback_likes_list(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
+    """Список тех, кто лайкнул пользователя (из сводки лайков)"""
+    from utils.helpers import get_admirer_ids
+    
+    if not user:
+        await callback.answer("Ошибка! Начните с /start", show_alert=True)
+        return
+    
+    # Те, кому пользователь еще не ответил, - сначала новые
+    admirer_ids = await get_admirer_ids(session, user, limit=10)
+    if not admirer_ids:
+        await callback.answer("Новых лайков нет - вы уже всем ответили!", show_alert=True)
+        return
+    
+    admirers_result = await session.execute(select(User).where(User.id.in_(admirer_ids)))
+    admirers = {admirer.id: admirer for admirer in admirers_result.scalars().all()}
+    
+    await callback.message.answer(
+        "💞 Вас лайкнули:",
+        reply_markup=get_likes_list_keyboard([admirers[i] for i in admirer_ids if i in admirers])
+    )
+    await callback.answer()
+
+
 @router.callback_query(F.data == "back")
 async def callback_back(callback: CallbackQuery):
     """Назад"""
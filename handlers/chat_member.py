@@ -0,0 +1,19 @@
+from aiogram import Router, F
+from aiogram.filters import ChatMemberUpdatedFilter, KICKED, MEMBER
+from aiogram.types import ChatMemberUpdated
+from services.reachability import reachability
+
+router = Router()
+router.my_chat_member.filter(F.chat.type == "private")
+
+
+@router.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def on_bot_blocked(event: ChatMemberUpdated):
+    """Пользователь заблокировал бота - исключаем его из уведомлений и рассылок"""
+    await reachability.mark_unreachable([event.from_user.id])
+
+
+@router.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def on_bot_unblocked(event: ChatMemberUpdated):
+    """Пользователь разблокировал бота"""
+    await reachability.mark_reachable(event.from_user.id)
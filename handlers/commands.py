@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
@@ -18,17 +19,13 @@ logger = logging.getLogger(__name__)
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, session: AsyncSession, state: FSMContext):
+async def cmd_start(message: Message, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Обработчик команды /start"""
     # Очищаем состояние при /start
     await state.clear()
     
     user_id = message.from_user.id
     
-    # Проверяем, существует ли пользователь
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         # Создаем нового пользователя
         referral_code = generate_referral_code()
@@ -52,6 +49,9 @@ async def cmd_start(message: Message, session: AsyncSession, state: FSMContext):
                 user.referred_by = ref_user.id
                 ref_user.referral_bonus_likes += 5  # Бонус за реферала
                 await session.commit()
+                
+                from middleware.user_context import user_cache
+                user_cache.invalidate(ref_user.telegram_id)
         
         lang = user.language or 'ru'
         # Объединяем приветствие и вопрос в одно сообщение
@@ -62,6 +62,16 @@ async def cmd_start(message: Message, session: AsyncSession, state: FSMContext):
         )
         await state.set_state(ProfileCreation.age)
     else:
+        if user.is_reachable == False:
+            # Пользователь снова запустил бота после блокировки
+            from services.reachability import reachability
+            from sqlalchemy.orm.attributes import set_committed_value
+            await reachability.mark_reachable(user.telegram_id, session=session)
+            await session.commit()
+            # UPDATE не обновляет загруженную анкету - иначе UserContextMiddleware
+            # снова закеширует is_reachable=False
+            set_committed_value(user, "is_reachable", True)
+        
         lang = user.language or 'ru'
         if not user.name or not user.age:
             # Анкета не заполнена
@@ -81,12 +91,8 @@ async def cmd_start(message: Message, session: AsyncSession, state: FSMContext):
 
 @router.message(Command("myprofile"))
 @router.message(F.text == "👤 Моя анкета")
-async def cmd_my_profile(message: Message, session: AsyncSession, state: FSMContext):
+async def cmd_my_profile(message: Message, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Просмотр своей анкеты"""
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user or not user.name:
         await message.answer("Твоя анкета еще не заполнена. Давайте создадим её!")
         await message.answer("Сколько тебе лет?", reply_markup=None)
@@ -195,14 +201,10 @@ async def cmd_events(message: Message):
     )
 
 
-@router.message(Command("stats"))
-@router.message(F.text == "📊 Статистика")
-async def cmd_stats(message: Message, session: AsyncSession):
+@router.message(Command("stats"), flags={"read_only": True})
+@router.message(F.text == "📊 Статистика", flags={"read_only": True})
+async def cmd_stats(message: Message, session: AsyncSession, user: Optional[User]):
     """Статистика пользователя"""
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await message.answer("Сначала создай анкету!")
         return
@@ -236,13 +238,11 @@ async def cmd_stats(message: Message, session: AsyncSession):
 
 @router.message(Command("support"))
 @router.message(F.text == "💬 Поддержка")
-async def cmd_support(message: Message, session: AsyncSession, state: FSMContext):
+async def cmd_support(message: Message, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Поддержка"""
     from sqlalchemy import select
     
     user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await message.answer("Сначала создай анкету!")
@@ -285,14 +285,10 @@ async def cmd_cancel(message: Message, state: FSMContext):
 
 @router.message(Command("invite"))
 @router.message(F.text == "👥 Пригласи друзей")
-async def cmd_invite(message: Message, session: AsyncSession):
+async def cmd_invite(message: Message, session: AsyncSession, user: Optional[User]):
     """Приглашение друзей"""
     from sqlalchemy import func
     
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await message.answer("Сначала создай анкету!")
         return
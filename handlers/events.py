@@ -1,3 +1,4 @@
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
@@ -11,13 +12,9 @@ from utils.helpers import format_profile_text
 router = Router()
 
 
-@router.callback_query(F.data == "event_all")
-async def callback_event_all(callback: CallbackQuery, session: AsyncSession):
+@router.callback_query(F.data == "event_all", flags={"read_only": True})
+async def callback_event_all(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Просмотр всех событий"""
-    user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user or not user.city:
         await callback.answer("Сначала заполни анкету и укажи город!", show_alert=True)
         return
@@ -44,12 +41,10 @@ async def callback_event_all(callback: CallbackQuery, session: AsyncSession):
     await callback.answer()
 
 
-@router.callback_query(F.data == "event_my")
-async def callback_event_my(callback: CallbackQuery, session: AsyncSession):
+@router.callback_query(F.data == "event_my", flags={"read_only": True})
+async def callback_event_my(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Мои события"""
     user_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
@@ -127,14 +122,11 @@ async def show_event(callback: CallbackQuery, event: Event, session: AsyncSessio
 
 
 @router.callback_query(F.data.startswith("event_join_"))
-async def callback_event_join(callback: CallbackQuery, session: AsyncSession):
+async def callback_event_join(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Участие в событии"""
     event_id = int(callback.data.split("_")[2])
     user_id = callback.from_user.id
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -170,14 +162,11 @@ async def callback_event_join(callback: CallbackQuery, session: AsyncSession):
 
 
 @router.callback_query(F.data.startswith("event_leave_"))
-async def callback_event_leave(callback: CallbackQuery, session: AsyncSession):
+async def callback_event_leave(callback: CallbackQuery, session: AsyncSession, user: Optional[User]):
     """Отмена участия в событии"""
     event_id = int(callback.data.split("_")[2])
     user_id = callback.from_user.id
     
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if not user:
         await callback.answer("Ошибка!", show_alert=True)
         return
@@ -1,3 +1,4 @@
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import Message, PhotoSize, Video
 from aiogram.fsm.context import FSMContext
@@ -5,22 +6,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database.models import User, Event, EventParticipant
 from keyboards.common import *
-from utils.helpers import format_profile_text
+from utils.helpers import format_profile_text, format_filters_text
 from utils.locales import get_text
+from utils.profile_card import send_profile_card
+from services.profile_prefetch import profile_prefetch
+from services.candidate_queue import candidate_queue
 from datetime import datetime
 import re
-from handlers.states import ProfileCreation, EventCreation, SuperLike, Support
+from handlers.states import ProfileCreation, EventCreation, SuperLike, Support, SearchFilters
 
 router = Router()
 
 
 @router.message(F.text == "❤️ Смотреть анкеты")
-async def message_view_profiles(message: Message, session: AsyncSession, state: FSMContext):
+async def message_view_profiles(message: Message, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Просмотр анкет через кнопку"""
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     lang = user.language if user else 'ru'
     
     if not user or not user.name:
@@ -31,53 +31,22 @@ async def message_view_profiles(message: Message, session: AsyncSession, state:
         await message.answer(get_text(lang, 'profile_disabled'))
         return
     
-    from utils.helpers import get_next_profile
-    next_profile = await get_next_profile(session, user)
+    card = await profile_prefetch.next_card(session, user)
     
-    if not next_profile:
+    if not card:
         await message.answer(
             get_text(lang, 'no_profiles'),
             reply_markup=get_pause_menu_keyboard(lang)
         )
         return
     
-    text = format_profile_text(next_profile)
     # Сохраняем ID профиля для жалоб
-    await state.update_data(last_viewed_user_id=next_profile.id)
+    await state.update_data(last_viewed_user_id=card.profile_id)
     
-    keyboard = get_profile_view_keyboard(lang)
-    keyboard.inline_keyboard[0][0].callback_data = f"like_{next_profile.id}"
-    keyboard.inline_keyboard[0][1].callback_data = f"dislike_{next_profile.id}"
-    keyboard.inline_keyboard[0][2].callback_data = f"super_like_{next_profile.id}"
-    keyboard.inline_keyboard[1][0].callback_data = f"next_profile"
+    await send_profile_card(message, card)
     
-    # Приоритет: сначала видео, потом фото
-    if next_profile.videos and len(next_profile.videos) > 0:
-        try:
-            await message.answer_video(next_profile.videos[0], caption=text, reply_markup=keyboard, parse_mode="HTML")
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Не удалось отправить видео профиля: {e}. Пробуем фото.")
-            # Если видео не отправилось, пробуем фото
-            if next_profile.photos and len(next_profile.photos) > 0:
-                try:
-                    await message.answer_photo(next_profile.photos[0], caption=text, reply_markup=keyboard, parse_mode="HTML")
-                except:
-                    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
-            else:
-                await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
-    elif next_profile.photos and len(next_profile.photos) > 0:
-        try:
-            await message.answer_photo(next_profile.photos[0], caption=text, reply_markup=keyboard, parse_mode="HTML")
-        except Exception as e:
-            # Если file_id невалиден (например, от старого бота), отправляем только текст
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Не удалось отправить фото профиля: {e}. Отправляем текст без фото.")
-            await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
-    else:
-        await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+    # Пока пользователь смотрит анкету, готовим следующую
+    profile_prefetch.schedule(user.id)
 
 
 @router.message(ProfileCreation.age)
@@ -98,7 +67,34 @@ async def process_age(message: Message, state: FSMContext, session: AsyncSession
         await message.answer("Пожалуйста, введите число")
 
 
-@router.message(ProfileCreation.city)
+@router.message(ProfileCreation.city, F.location)
+async def process_city_location(message: Message, state: FSMContext):
+    """Обработка геолокации"""
+    from aiogram.types import ReplyKeyboardRemove
+    from services.google_maps import google_maps_service
+    
+    latitude = message.location.latitude
+    longitude = message.location.longitude
+    await state.update_data(latitude=latitude, longitude=longitude)
+    
+    city = await google_maps_service.get_city_name(latitude, longitude)
+    if not city:
+        # Координаты сохранены, но город определить не удалось - спрашиваем текстом
+        await message.answer(
+            "📍 Геолокация сохранена!\n\nНапиши название своего города:",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await state.set_state(ProfileCreation.city_manual)
+        return
+    
+    await state.update_data(city=city)
+    await message.answer(f"📍 Твой город: {city}", reply_markup=ReplyKeyboardRemove())
+    await message.answer("Как мне тебя называть?")
+    await state.set_state(ProfileCreation.name)
+
+
+@router.message(ProfileCreation.city, F.text)
+@router.message(ProfileCreation.city_manual, F.text)
 async def process_city(message: Message, state: FSMContext):
     """Обработка города"""
     city = message.text.strip()
@@ -107,9 +103,6 @@ async def process_city(message: Message, state: FSMContext):
     await state.set_state(ProfileCreation.name)
 
 
-# Обработка геолокации убрана - теперь только текстовый ввод города
-
-
 @router.message(ProfileCreation.name)
 async def process_name(message: Message, state: FSMContext):
     """Обработка имени"""
@@ -165,13 +158,9 @@ async def process_video(message: Message, state: FSMContext):
 
 
 @router.message(ProfileCreation.photo, F.text == "/done")
-async def process_done(message: Message, state: FSMContext, session: AsyncSession):
+async def process_done(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Завершение создания анкеты"""
     data = await state.get_data()
-    user_id = message.from_user.id
-    
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await message.answer("Ошибка! Начните с /start")
@@ -186,8 +175,8 @@ async def process_done(message: Message, state: FSMContext, session: AsyncSessio
     user.city = data.get("city")
     user.photos = data.get("photos", [])
     user.videos = data.get("videos", [])
-    user.latitude = data.get("latitude")
-    user.longitude = data.get("longitude")
+    from utils.geo import apply_location
+    apply_location(user, data.get("latitude"), data.get("longitude"))
     
     if data.get("gender") == "gender_male":
         user.gender = Gender.MALE
@@ -203,6 +192,9 @@ async def process_done(message: Message, state: FSMContext, session: AsyncSessio
     
     await session.commit()
     
+    # Анкета и фильтры изменились - подбираем кандидатов заново
+    candidate_queue.invalidate(user.id)
+    
     # Показываем анкету для подтверждения
     text = "Так выглядит твоя анкета:\n\n"
     text += format_profile_text(user)
@@ -232,15 +224,11 @@ async def process_event_title(message: Message, state: FSMContext):
 
 
 @router.message(EventCreation.description)
-async def process_event_description(message: Message, state: FSMContext, session: AsyncSession):
+async def process_event_description(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Обработка описания события"""
     description = message.text.strip()
     await state.update_data(description=description)
     
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if user and user.city:
         await message.answer(f"Город: {user.city}\n\nИли введи другой город:")
         await state.set_state(EventCreation.city)
@@ -272,27 +260,23 @@ async def process_event_date(message: Message, state: FSMContext):
 
 
 @router.message(EventCreation.photo, F.photo)
-async def process_event_photo(message: Message, state: FSMContext, session: AsyncSession):
+async def process_event_photo(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Обработка фото события"""
     photo = message.photo[-1]
     file_id = photo.file_id
     await state.update_data(photo=file_id)
-    await create_event(message, state, session)
+    await create_event(message, state, session, user)
 
 
 @router.message(EventCreation.photo, F.text == "/skip")
-async def process_event_photo_skip(message: Message, state: FSMContext, session: AsyncSession):
+async def process_event_photo_skip(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Пропуск фото события"""
-    await create_event(message, state, session)
+    await create_event(message, state, session, user)
 
 
-async def create_event(message: Message, state: FSMContext, session: AsyncSession):
+async def create_event(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Создание события"""
     data = await state.get_data()
-    user_id = message.from_user.id
-    
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await message.answer("Ошибка!")
@@ -320,9 +304,8 @@ async def create_event(message: Message, state: FSMContext, session: AsyncSessio
 
 
 @router.message(SuperLike.message)
-async def process_super_like_message(message: Message, state: FSMContext, session: AsyncSession):
+async def process_super_like_message(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Обработка сообщения для суперлайка"""
-    user_id = message.from_user.id
     data = await state.get_data()
     target_user_id = data.get("target_user_id")
     
@@ -331,10 +314,7 @@ async def process_super_like_message(message: Message, state: FSMContext, sessio
         await state.clear()
         return
     
-    # Получаем пользователей
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
+    # Получаем анкету, которой ставим суперлайк
     result_target = await session.execute(select(User).where(User.id == target_user_id))
     target_user = result_target.scalar_one_or_none()
     
@@ -344,62 +324,47 @@ async def process_super_like_message(message: Message, state: FSMContext, sessio
         return
     
     # Создаем суперлайк
-    from database.models import Like
-    like = Like(
-        from_user_id=user.id,
-        to_user_id=target_user_id,
-        is_super_like=True
-    )
-    
+    like_message = None
+    like_video = None
     if message.text:
-        like.message = message.text
-        await message.answer("💌 Суперлайк отправлен!")
+        like_message = message.text
     elif message.video:
         if message.video.duration and message.video.duration > 15:
             await message.answer("Видео должно быть не более 15 секунд!")
             return
-        like.video = message.video.file_id
-        await message.answer("💌 Суперлайк с видео отправлен!")
+        like_video = message.video.file_id
     else:
         await message.answer("Отправьте текст или видео!")
         return
     
-    session.add(like)
-    user.total_likes += 1
-    target_user.total_likes += 1
+    # Вставка (или превращение обычного лайка в суперлайк) и проверка взаимности
+    from utils.helpers import record_like, mutual_like_notice
+    created, is_mutual = await record_like(
+        session, user.id, target_user_id,
+        is_super_like=True, message=like_message, video=like_video
+    )
+    if not created:
+        await session.rollback()
+        await message.answer("Вы уже отправили суперлайк этому пользователю!")
+        await state.clear()
+        return
+    
+    await session.commit()
+    
+    if like_video:
+        await message.answer("💌 Суперлайк с видео отправлен!")
+    else:
+        await message.answer("💌 Суперлайк отправлен!")
     
-    # Проверяем взаимную симпатию
-    from utils.helpers import check_mutual_like
-    is_mutual = await check_mutual_like(session, user.id, target_user_id)
     if is_mutual:
-        like.is_mutual = True
-        prev_like = await session.execute(
-            select(Like).where(Like.from_user_id == target_user_id, Like.to_user_id == user.id)
-        )
-        prev_like_obj = prev_like.scalar_one_or_none()
-        if prev_like_obj:
-            prev_like_obj.is_mutual = True
-        
-        target_name = target_user.name or target_user.first_name or "Пользователь"
-        target_username = target_user.username or ""
-        
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-        mutual_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="👤 Посмотреть анкету", callback_data=f"view_profile_{target_user.id}")
-        ]])
-        
-        mutual_text = f"💕 Взаимная симпатия!\n\n"
-        mutual_text += f"👤 {target_name}"
-        if target_username:
-            mutual_text += f" (@{target_username})"
-        mutual_text += f"\n\nВы понравились друг другу!"
-        
+        mutual_text, mutual_keyboard = mutual_like_notice(target_user)
         await message.answer(
             mutual_text,
             reply_markup=mutual_keyboard
         )
     
-    await session.commit()
+    from services.seen_set import seen_set
+    await seen_set.add(user.id, target_user_id)
     
     # УВЕДОМЛЯЕМ пользователя о суперлайке (для всех, включая бесплатных)
     try:
@@ -419,38 +384,87 @@ async def process_super_like_message(message: Message, state: FSMContext, sessio
         if message.text:
             notification_text += f"\n\n💬 Сообщение: {message.text}"
         
-        # Отправляем уведомление
-        if message.video:
-            await message.bot.send_video(
-                target_user.telegram_id,
-                message.video.file_id,
-                caption=notification_text,
-                reply_markup=notification_keyboard
-            )
-        else:
-            await message.bot.send_message(
-                target_user.telegram_id,
-                notification_text,
-                reply_markup=notification_keyboard
-            )
+        # Ставим уведомление в очередь (отправят воркеры)
+        from services.notifications import notification_dispatcher
+        await notification_dispatcher.enqueue(
+            target_user.telegram_id,
+            notification_text,
+            reply_markup=notification_keyboard,
+            video=message.video.file_id if message.video else None
+        )
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
-        logger.warning(f"Не удалось отправить уведомление о суперлайке пользователю {target_user.telegram_id}: {e}")
+        logger.warning(f"Не удалось поставить уведомление о суперлайке пользователю {target_user.telegram_id}: {e}")
     
     await state.clear()
 
 
+@router.message(SearchFilters.age_range, F.text)
+async def process_filter_age(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
+    """Обработка диапазона возраста"""
+    match = re.fullmatch(r"\s*(\d{2})?\s*-?\s*(\d{2})?\s*", message.text)
+    age_min = int(match.group(1)) if match and match.group(1) else None
+    age_max = int(match.group(2)) if match and match.group(2) else None
+    if not match or (age_min is None and age_max is None):
+        await message.answer("Пожалуйста, напиши диапазон в формате 20-30")
+        return
+    if "-" not in message.text and age_min is not None:
+        # Одно число без дефиса - точный возраст
+        age_max = age_min
+    if any(age is not None and not 18 <= age <= 100 for age in (age_min, age_max)):
+        await message.answer("Возраст должен быть от 18 до 100 лет")
+        return
+    if age_min is not None and age_max is not None and age_min > age_max:
+        age_min, age_max = age_max, age_min
+    
+    if not user:
+        await message.answer("Ошибка! Начните с /start")
+        await state.clear()
+        return
+    
+    user.search_age_min = age_min
+    user.search_age_max = age_max
+    await session.commit()
+    candidate_queue.invalidate(user.id)
+    await state.clear()
+    
+    await message.answer(format_filters_text(user), reply_markup=get_filters_keyboard())
+
+
+@router.message(SearchFilters.max_distance, F.text)
+async def process_filter_distance(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
+    """Обработка максимального расстояния"""
+    try:
+        distance = float(message.text.replace(",", ".").replace("км", "").strip())
+    except ValueError:
+        await message.answer("Пожалуйста, введите число километров")
+        return
+    if distance < 0 or distance > 20000:
+        await message.answer("Расстояние должно быть от 0 до 20000 км")
+        return
+    
+    if not user:
+        await message.answer("Ошибка! Начните с /start")
+        await state.clear()
+        return
+    
+    user.search_max_distance_km = distance or None
+    await session.commit()
+    candidate_queue.invalidate(user.id)
+    await state.clear()
+    
+    await message.answer(format_filters_text(user), reply_markup=get_filters_keyboard())
+
+
 @router.message(Support.waiting_message)
-async def process_support_message(message: Message, session: AsyncSession, state: FSMContext):
+async def process_support_message(message: Message, session: AsyncSession, state: FSMContext, user: Optional[User]):
     """Обработка сообщений в поддержку"""
     from database.models import SupportChat, SupportMessage
     from sqlalchemy import select
     from config import settings
     
     user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await message.answer("Ошибка! Начните с /start")
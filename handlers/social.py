@@ -1,3 +1,4 @@
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
@@ -27,7 +28,7 @@ async def callback_social_instagram(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(SocialNetwork.instagram)
-async def process_instagram(message: Message, state: FSMContext, session: AsyncSession):
+async def process_instagram(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Обработка Instagram"""
     username = message.text.strip()
     
@@ -49,10 +50,6 @@ async def process_instagram(message: Message, state: FSMContext, session: AsyncS
         await message.answer("Неверный формат username! Введи только username без @ и ссылок:")
         return
     
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if user:
         user.instagram = username
         await session.commit()
@@ -74,7 +71,7 @@ async def callback_social_vk(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(SocialNetwork.vk)
-async def process_vk(message: Message, state: FSMContext, session: AsyncSession):
+async def process_vk(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Обработка VK"""
     vk_input = message.text.strip()
     
@@ -94,10 +91,6 @@ async def process_vk(message: Message, state: FSMContext, session: AsyncSession)
         await message.answer("Неверный формат! Введи username или ID:")
         return
     
-    user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
-    
     if user:
         user.vk = vk_input
         await session.commit()
@@ -14,6 +14,11 @@ class ProfileCreation(StatesGroup):
     confirm = State()
 
 
+class SearchFilters(StatesGroup):
+    age_range = State()
+    max_distance = State()
+
+
 class EventCreation(StatesGroup):
     title = State()
     description = State()
@@ -31,6 +36,8 @@ class AdminBroadcast(StatesGroup):
     message = State()
     photo = State()
     buttons = State()
+    segment = State()
+    schedule = State()
     confirm = State()
 
 
@@ -1,3 +1,4 @@
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
@@ -14,6 +15,7 @@ logger = logging.getLogger(__name__)
 
 
 from handlers.states import Verification
+from services.notifications import notification_dispatcher
 
 
 @router.callback_query(F.data == "verify")
@@ -34,13 +36,11 @@ async def callback_verify(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(Verification.photo, F.photo)
-async def process_verification_photo(message: Message, state: FSMContext, session: AsyncSession):
+async def process_verification_photo(message: Message, state: FSMContext, session: AsyncSession, user: Optional[User]):
     """Обработка фото для верификации"""
     logger.info(f"Получено фото для верификации от пользователя {message.from_user.id}")
     
     user_id = message.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == user_id))
-    user = result.scalar_one_or_none()
     
     if not user:
         await message.answer("Ошибка! Начните с /start")
@@ -142,15 +142,18 @@ async def callback_verify_approve(callback: CallbackQuery, session: AsyncSession
     user.is_verified = True
     await session.commit()
     
+    from middleware.user_context import user_cache
+    user_cache.invalidate(user.telegram_id)
+    
     # Уведомляем пользователя
     try:
-        await callback.bot.send_message(
+        await notification_dispatcher.enqueue(
             user.telegram_id,
             "✅ Ваша верификация одобрена!\n\n"
             "Теперь ваша анкета отмечена как верифицированная."
         )
     except Exception as e:
-        logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+        logger.error(f"Ошибка постановки уведомления пользователю {user_id}: {e}")
     
     await callback.answer("✅ Верификация одобрена!")
     await callback.message.edit_caption(
@@ -180,15 +183,18 @@ async def callback_verify_reject(callback: CallbackQuery, session: AsyncSession)
     user.is_verified = False
     await session.commit()
     
+    from middleware.user_context import user_cache
+    user_cache.invalidate(user.telegram_id)
+    
     # Уведомляем пользователя
     try:
-        await callback.bot.send_message(
+        await notification_dispatcher.enqueue(
             user.telegram_id,
             "❌ Ваша верификация отклонена.\n\n"
             "Пожалуйста, отправьте новое фото для верификации с четким жестом 🤚🏼."
         )
     except Exception as e:
-        logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+        logger.error(f"Ошибка постановки уведомления пользователю {user_id}: {e}")
     
     await callback.answer("❌ Верификация отклонена")
     await callback.message.edit_caption(
@@ -138,6 +138,30 @@ def get_super_like_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def get_filters_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура фильтров поиска"""
+    builder = InlineKeyboardBuilder()
+    builder.add(InlineKeyboardButton(text="🎂 Возраст", callback_data="filter_age"))
+    builder.add(InlineKeyboardButton(text="📍 Расстояние", callback_data="filter_distance"))
+    builder.add(InlineKeyboardButton(text="♻️ Сбросить фильтры", callback_data="filter_reset"))
+    builder.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back"))
+    builder.adjust(2, 1, 1)
+    return builder.as_markup()
+
+
+def get_likes_list_keyboard(users: list) -> InlineKeyboardMarkup:
+    """Список лайкнувших: кнопка на каждую анкету"""
+    builder = InlineKeyboardBuilder()
+    for user in users:
+        title = user.name or user.first_name or "Пользователь"
+        if user.age:
+            title += f", {user.age}"
+        builder.add(InlineKeyboardButton(text=f"👤 {title}", callback_data=f"view_profile_{user.id}"))
+    builder.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back"))
+    builder.adjust(1)
+    return builder.as_markup()
+
+
 def get_back_keyboard() -> InlineKeyboardMarkup:
     """Кнопка назад"""
     builder = InlineKeyboardBuilder()
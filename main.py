@@ -8,7 +8,7 @@ from aiogram.enums import ParseMode
 from config import settings
 from database.connection import engine, init_mongodb, close_mongodb
 from database.models import Base
-from handlers import commands, callbacks, messages, admin, events, verification, social, payments
+from handlers import commands, callbacks, messages, admin, events, verification, social, payments, chat_member
 from middleware.database import DatabaseMiddleware
 from database.redis_client import redis_client
 
@@ -31,6 +31,47 @@ async def create_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
+def setup_dispatcher(dp: Dispatcher) -> None:
+    """Регистрация middleware и роутеров (порядок роутеров важен)"""
+    # Регистрация middleware для обработки ошибок (первым!)
+    from middleware.error_handler import ErrorHandlerMiddleware
+    dp.message.middleware(ErrorHandlerMiddleware())
+    dp.callback_query.middleware(ErrorHandlerMiddleware())
+    dp.edited_message.middleware(ErrorHandlerMiddleware())
+    
+    # Регистрация middleware для dependency injection сессии БД
+    dp.message.middleware(DatabaseMiddleware())
+    dp.callback_query.middleware(DatabaseMiddleware())
+    dp.edited_message.middleware(DatabaseMiddleware())
+    
+    # Анкета текущего пользователя (user) - после сессии БД
+    from middleware.user_context import UserContextMiddleware
+    user_context_middleware = UserContextMiddleware()
+    dp.message.middleware(user_context_middleware)
+    dp.callback_query.middleware(user_context_middleware)
+    dp.edited_message.middleware(user_context_middleware)
+    
+    # Отметка активности пользователей (сегменты рассылок по активности)
+    from middleware.activity import ActivityMiddleware
+    activity_middleware = ActivityMiddleware()
+    dp.message.middleware(activity_middleware)
+    dp.callback_query.middleware(activity_middleware)
+    
+    # Регистрация роутеров
+    # Важно: verification должен быть раньше messages, чтобы перехватывать фото для верификации,
+    # admin - чтобы команды и шаги рассылки не забирал общий обработчик сообщений
+    # payments должен быть раньше других для перехвата платежных событий
+    dp.include_router(payments.router)  # Обработка платежей
+    dp.include_router(commands.router)
+    dp.include_router(callbacks.router)
+    dp.include_router(verification.router)  # Регистрируем раньше messages
+    dp.include_router(admin.router)  # Раньше messages: там обработчик всех остальных сообщений
+    dp.include_router(messages.router)
+    dp.include_router(events.router)
+    dp.include_router(social.router)
+    dp.include_router(chat_member.router)  # Блокировка/разблокировка бота пользователем
+
+
 async def main():
     """Главная функция"""
     # Инициализация MongoDB
@@ -45,6 +86,10 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
+    # Лимиты исходящих запросов: общий и по чатам, с приоритетами и повтором после flood wait
+    from middleware.outbound import OutboundRateLimitMiddleware
+    bot.session.middleware(OutboundRateLimitMiddleware())
+    
     # Инициализация диспетчера
     # Проверяем доступность Redis перед использованием
     try:
@@ -60,28 +105,7 @@ async def main():
     
     dp = Dispatcher(storage=storage)
     
-    # Регистрация middleware для обработки ошибок (первым!)
-    from middleware.error_handler import ErrorHandlerMiddleware
-    dp.message.middleware(ErrorHandlerMiddleware())
-    dp.callback_query.middleware(ErrorHandlerMiddleware())
-    dp.edited_message.middleware(ErrorHandlerMiddleware())
-    
-    # Регистрация middleware для dependency injection сессии БД
-    dp.message.middleware(DatabaseMiddleware())
-    dp.callback_query.middleware(DatabaseMiddleware())
-    dp.edited_message.middleware(DatabaseMiddleware())
-    
-    # Регистрация роутеров
-    # Важно: verification должен быть раньше messages, чтобы перехватывать фото для верификации
-    # payments должен быть раньше других для перехвата платежных событий
-    dp.include_router(payments.router)  # Обработка платежей
-    dp.include_router(commands.router)
-    dp.include_router(callbacks.router)
-    dp.include_router(verification.router)  # Регистрируем раньше messages
-    dp.include_router(messages.router)
-    dp.include_router(admin.router)
-    dp.include_router(events.router)
-    dp.include_router(social.router)
+    setup_dispatcher(dp)
     
     # Проверка подключения к Telegram API
     try:
@@ -105,12 +129,67 @@ async def main():
         logger.error(f"❌ Ошибка при создании таблиц: {e}")
         logger.warning("Продолжаем работу, но возможны проблемы с БД")
     
+    # Загрузка активных boost в память
+    try:
+        from database.connection import async_session_maker
+        from services.boost_registry import boost_registry
+        async with async_session_maker() as session:
+            await boost_registry.load(session)
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить активные boost: {e}")
+    
+    # Кеш пользователей, заблокировавших бота
+    try:
+        from database.connection import async_session_maker
+        from services.reachability import reachability
+        async with async_session_maker() as session:
+            unreachable = await reachability.load(session)
+        logger.info(f"Пользователей, заблокировавших бота: {unreachable}")
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить список заблокировавших бота: {e}")
+    
+    # Фоновое обновление снимка анкет для подбора кандидатов
+    background_tasks = []
+    if settings.SNAPSHOT_ENABLED:
+        from services.profile_snapshot import profile_snapshot
+        background_tasks.append(asyncio.create_task(profile_snapshot.run_periodic_refresh()))
+    
+    # Пакетная запись дизлайков из буфера (включая недописанные до перезапуска)
+    if settings.SWIPE_BUFFER_ENABLED:
+        from services.swipe_buffer import swipe_buffer
+        background_tasks.append(asyncio.create_task(swipe_buffer.run_flusher()))
+    
+    # Воркеры отправки уведомлений (недоставленные до перезапуска - снова в очередь)
+    from services.notifications import notification_dispatcher
+    await notification_dispatcher.recover()
+    background_tasks.extend(notification_dispatcher.start(bot))
+    
+    # Рассылки, прерванные перезапуском, продолжаются с сохраненного курсора
+    from services.broadcast import broadcast_engine
+    try:
+        await broadcast_engine.resume(bot)
+    except Exception as e:
+        logger.warning(f"Не удалось возобновить рассылки: {e}")
+    background_tasks.append(asyncio.create_task(broadcast_engine.run_scheduler(bot)))
+    
+    # Сводки уведомлений о лайках
+    from services.like_digest import like_digest
+    background_tasks.append(asyncio.create_task(like_digest.run_periodic()))
+    
+    # Сверка взаимных лайков, пропущенных при конкурентной записи
+    from services.reconciliation import reconciliation
+    background_tasks.append(asyncio.create_task(reconciliation.run_periodic()))
+    
     # Запуск бота
     logger.info("🚀 Бот запущен и готов к работе!")
     try:
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
         logger.error(f"❌ Критическая ошибка при работе бота: {e}", exc_info=True)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        broadcast_engine.cancel_tasks()
 
 
 if __name__ == "__main__":
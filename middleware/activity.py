@@ -0,0 +1,66 @@
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import update
+
+from config import settings
+from database.connection import async_session_maker
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Middleware отметки активности пользователя (users.last_active_at)
+
+    Запись идет не чаще раза в ACTIVITY_TOUCH_SECONDS на пользователя и уже
+    после обработчика, в отдельной сессии - ответ пользователю не ждет UPDATE.
+    """
+
+    MAX_TRACKED = 100000
+
+    def __init__(self):
+        # telegram_id -> время последней записи (monotonic)
+        self._touched: Dict[int, float] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            from_user = data.get("event_from_user")
+            if from_user is not None:
+                await self._touch(from_user.id)
+
+    async def _touch(self, telegram_id: int) -> None:
+        now = time.monotonic()
+        if now - self._touched.get(telegram_id, float("-inf")) < settings.ACTIVITY_TOUCH_SECONDS:
+            return
+        if len(self._touched) >= self.MAX_TRACKED:
+            self._touched = {
+                user_id: touched for user_id, touched in self._touched.items()
+                if now - touched < settings.ACTIVITY_TOUCH_SECONDS
+            }
+        self._touched[telegram_id] = now
+        try:
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(User)
+                    .where(User.telegram_id == telegram_id)
+                    # updated_at не трогаем: по нему снимок анкет (profile_snapshot)
+                    # перечитывает измененные анкеты, а активность анкету не меняет
+                    .values(last_active_at=datetime.utcnow(), updated_at=User.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Не удалось отметить активность {telegram_id}: {e}")
@@ -1,26 +1,105 @@
+import time
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import TelegramObject
-from database.connection import async_session_maker, get_mongodb
+from config import settings
+from database.connection import async_session_maker, replica_session_maker, replica_engine, get_mongodb
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session):
+    session.info["committed"] = True
+
+
+class PrimaryPins:
+    """
+    Пользователи, которые недавно писали в основную БД
+
+    Реплика отстает от основной БД, поэтому после своего коммита пользователь
+    REPLICA_PIN_SECONDS читает с основной - и видит свои изменения
+    (read-your-writes). Хранится в памяти процесса, как и сами сессии.
+    """
+
+    MAX_PINNED = 100000
+
+    def __init__(self):
+        # telegram_id -> до какого момента (monotonic) читать с основной БД
+        self._pinned: Dict[int, float] = {}
+
+    def pin(self, telegram_id: int) -> None:
+        now = time.monotonic()
+        if len(self._pinned) >= self.MAX_PINNED:
+            self._pinned = {
+                user_id: until for user_id, until in self._pinned.items() if until > now
+            }
+        self._pinned[telegram_id] = now + settings.REPLICA_PIN_SECONDS
+
+    def is_pinned(self, telegram_id: int) -> bool:
+        until = self._pinned.get(telegram_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._pinned.pop(telegram_id, None)
+            return False
+        return True
+
+
+primary_pins = PrimaryPins()
 
 
 class DatabaseMiddleware(BaseMiddleware):
-    """Middleware для инъекции сессии БД в обработчики"""
-    
+    """
+    Middleware для инъекции сессии БД в обработчики
+
+    Сессия создается, только если обработчик принимает session или user
+    (user резолвит UserContextMiddleware через эту же сессию), MongoDB - только
+    для обработчиков с параметром database. Соединение из пула сессия берет при
+    первом запросе, поэтому обработчик, которому пользователь достался из кеша
+    и который ничего не пишет, к БД не обращается.
+
+    Обработчики с флагом read_only (flags={"read_only": True}) получают сессию
+    реплики, если она настроена и пользователь не писал в основную БД последние
+    REPLICA_PIN_SECONDS.
+    """
+
+    SESSION_PARAMS = {"session", "user"}
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        # Инжектим и SQLite сессию (для обратной совместимости) и MongoDB
-        async with async_session_maker() as session:
+        handler_object = data.get("handler")
+        wants_all = handler_object is None or handler_object.varkw
+        params = set() if wants_all else handler_object.params
+
+        if wants_all or "database" in params:
+            data["database"] = await get_mongodb()  # MongoDB база данных
+        if not wants_all and not params & self.SESSION_PARAMS:
+            return await handler(event, data)
+
+        from_user = data.get("event_from_user")
+        session_maker = async_session_maker
+        if (
+            replica_engine is not None
+            and get_flag(data, "read_only")
+            and not (from_user and primary_pins.is_pinned(from_user.id))
+        ):
+            session_maker = replica_session_maker
+
+        async with session_maker() as session:
             try:
                 data["session"] = session  # SQLAlchemy сессия
-                data["database"] = await get_mongodb()  # MongoDB база данных
                 return await handler(event, data)
             except Exception as e:
                 # Откатываем транзакцию при ошибке
                 await session.rollback()
                 raise
+            finally:
+                if from_user and session.info.get("committed"):
+                    primary_pins.pin(from_user.id)
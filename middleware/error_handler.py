@@ -20,7 +20,8 @@ class ErrorHandlerMiddleware(BaseMiddleware):
         try:
             return await handler(event, data)
         except TelegramRetryAfter as e:
-            # Обработка flood wait - ждем указанное время
+            # Короткие flood wait уже повторены в OutboundRateLimitMiddleware,
+            # сюда доходят только слишком долгие или повторяющиеся
             logger.warning(f"Flood wait: {e.retry_after} секунд")
             # Не отправляем сообщение пользователю, просто логируем
             return None
@@ -0,0 +1,211 @@
+"""Ограничение исходящих запросов к Telegram API"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, AnswerCallbackQuery, GetUpdates
+from aiogram.methods.base import Response, TelegramType
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SendPriority(IntEnum):
+    """Классы приоритета отправки (меньше - раньше)"""
+    INTERACTIVE = 0  # Ответы пользователю в обработчиках
+    NOTIFICATION = 1  # Уведомления из фоновых воркеров
+    BROADCAST = 2  # Рассылки
+
+
+# Приоритет запросов текущей задачи; по умолчанию - ответ пользователю
+send_priority: ContextVar[SendPriority] = ContextVar("send_priority", default=SendPriority.INTERACTIVE)
+
+# Повторять ли запрос после flood wait внутри вызова. Воркеры уведомлений
+# откладывают повтор сами и не должны простаивать на паузе Telegram
+flood_wait_retry: ContextVar[bool] = ContextVar("flood_wait_retry", default=True)
+
+
+@contextmanager
+def outbound_priority(priority: SendPriority):
+    """Выполняет блок с заданным приоритетом исходящих запросов"""
+    token = send_priority.set(priority)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class PriorityTokenBucket:
+    """Token bucket, который раздает токены ожидающим в порядке приоритета"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if now <= self._updated:
+            # Пауза (flood wait): токены не копятся до ее окончания
+            return
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Не выдает токены seconds секунд (общий flood wait)"""
+        self._tokens = 0
+        self._updated = max(self._updated, time.monotonic() + seconds)
+
+    async def acquire(self, priority: int) -> None:
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        """Выдает токены по мере пополнения: сначала высокий приоритет"""
+        while self._waiters:
+            self._refill()
+            if self._tokens < 1:
+                pause = max(self._updated - time.monotonic(), 0)
+                await asyncio.sleep(pause + (1 - self._tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Ожидающий отменен - токен не тратим
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+
+
+class ChatBuckets:
+    """Token bucket на каждый чат (без приоритетов)"""
+
+    MAX_CHATS = 10000
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        # chat_id -> (токены, время обновления)
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+
+    def reserve(self, chat_id: int) -> float:
+        """Забирает токен чата; возвращает, сколько секунд нужно подождать"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(chat_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+        self._buckets[chat_id] = (tokens, now)
+        if len(self._buckets) > self.MAX_CHATS:
+            self._prune(now)
+        if tokens >= 0:
+            return 0.0
+        return -tokens / self.rate
+
+    def is_busy(self, chat_id: int) -> bool:
+        """В чат недавно отправляли (бакет еще не восстановился полностью)"""
+        if chat_id not in self._buckets:
+            return False
+        tokens, updated = self._buckets[chat_id]
+        return tokens + (time.monotonic() - updated) * self.rate < self.burst
+
+    def block(self, chat_id: int, seconds: float) -> None:
+        """Запрещает отправку в чат на seconds секунд (flood wait)"""
+        self._buckets[chat_id] = (-seconds * self.rate, time.monotonic())
+
+    def _prune(self, now: float) -> None:
+        """Удаляет чаты с полностью восстановленными бакетами"""
+        for chat_id, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del self._buckets[chat_id]
+
+
+class OutboundRateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов бота
+
+    Общий token bucket (~30 сообщений/с) раздает токены по приоритету
+    (send_priority): ответы пользователю, затем уведомления, затем рассылки.
+    Для всех отправок в чат дополнительно действует bucket чата (~1 сообщение/с
+    с небольшим запасом; ответы обработчика обычно укладываются в запас).
+
+    При TelegramRetryAfter на указанную сервером паузу блокируется чат, если в
+    него недавно отправляли (лимит чата), иначе - общий bucket: лимит бота
+    превышен, и остальные чаты тоже получили бы flood wait. Запрос повторяется
+    после паузы, если вызывающий не отключил повторы (flood_wait_retry), -
+    тогда ошибка сразу уходит к нему.
+    """
+
+    # Служебные запросы без лимитов на сообщения
+    UNLIMITED_METHODS = (GetUpdates, AnswerCallbackQuery)
+
+    def __init__(self):
+        self.global_bucket = PriorityTokenBucket(
+            settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_GLOBAL_RATE
+        )
+        self.chat_buckets = ChatBuckets(settings.TELEGRAM_CHAT_RATE, settings.TELEGRAM_CHAT_BURST)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if isinstance(method, self.UNLIMITED_METHODS):
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int):
+            chat_id = None
+
+        attempt = 0
+        while True:
+            chat_busy = False
+            if chat_id is not None:
+                chat_busy = self.chat_buckets.is_busy(chat_id)
+                delay = self.chat_buckets.reserve(chat_id)
+                if delay:
+                    await asyncio.sleep(delay)
+            await self.global_bucket.acquire(priority)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                # У групп свои лимиты в минуту - их flood wait всегда относится к чату
+                if chat_id is not None and (chat_busy or chat_id < 0):
+                    self.chat_buckets.block(chat_id, e.retry_after)
+                else:
+                    logger.warning(f"Flood wait {e.retry_after} с по лимиту бота: пауза всех отправок")
+                    self.global_bucket.pause(e.retry_after)
+                if (
+                    not flood_wait_retry.get()
+                    or attempt > settings.TELEGRAM_MAX_RETRIES
+                    or e.retry_after > settings.TELEGRAM_MAX_RETRY_AFTER
+                ):
+                    raise
+                logger.warning(
+                    f"Flood wait {e.retry_after} с для {type(method).__name__} "
+                    f"(чат {chat_id}), повтор {attempt}"
+                )
+                await asyncio.sleep(e.retry_after)
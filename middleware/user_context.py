@@ -0,0 +1,133 @@
+import copy
+import logging
+import time
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import select, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from config import settings
+from database.connection import async_session_maker
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    TTL-кеш анкет пользователей по telegram_id
+
+    Хранятся отсоединенные копии без несохраненных изменений; в сессию
+    обработчика копия добавляется через merge(load=False), без SELECT.
+    Код, меняющий чужую анкету (бан, верификация, оплата, блокировка бота),
+    сбрасывает запись через invalidate.
+    """
+
+    MAX_USERS = 50000
+
+    def __init__(self):
+        # telegram_id -> (время истечения, копия анкеты)
+        self._users: Dict[int, Tuple[float, User]] = {}
+
+    def get(self, telegram_id: int) -> Optional[User]:
+        entry = self._users.get(telegram_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self._users.pop(telegram_id, None)
+            return None
+        return user
+
+    def put(self, user: User) -> None:
+        """Кеширует состояние анкеты, если оно полностью загружено и сохранено"""
+        if settings.USER_CACHE_TTL_SECONDS <= 0:
+            return
+        state = inspect(user)
+        columns = state.mapper.column_attrs
+        if state.deleted or state.was_deleted or state.modified or state.key is None:
+            self.invalidate(user.telegram_id)
+            return
+        if any(column.key in state.unloaded for column in columns):
+            self.invalidate(user.telegram_id)
+            return
+
+        snapshot = User()
+        for column in columns:
+            # JSON-поля (фото, видео) копируются: обработчики могут менять списки на месте
+            setattr(snapshot, column.key, copy.deepcopy(state.dict[column.key]))
+        make_transient_to_detached(snapshot)
+
+        now = time.monotonic()
+        if len(self._users) >= self.MAX_USERS:
+            self._users = {
+                telegram_id: entry for telegram_id, entry in self._users.items() if entry[0] >= now
+            }
+        self._users[snapshot.telegram_id] = (now + settings.USER_CACHE_TTL_SECONDS, snapshot)
+
+    def invalidate(self, *telegram_ids: int) -> None:
+        for telegram_id in telegram_ids:
+            self._users.pop(telegram_id, None)
+
+
+user_cache = UserCache()
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Middleware для инъекции анкеты текущего пользователя (user) в обработчики
+
+    Анкета резолвится один раз на апдейт: из кеша или одним SELECT по
+    telegram_id. Если анкеты еще нет, передается None. После обработчика
+    актуальное состояние анкеты снова кладется в кеш.
+    Обработчику с сессией реплики анкета при промахе кеша читается с основной
+    БД (и кешируется) - как и у пользователей, закрепленных за основной БД
+    после своей записи, она не отстает от их изменений.
+    Регистрируется после DatabaseMiddleware.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        session = data.get("session")
+        handler_object = data.get("handler")
+        wants_user = handler_object is None or handler_object.varkw or "user" in handler_object.params
+        if from_user is None or session is None or not wants_user:
+            return await handler(event, data)
+
+        cached = user_cache.get(from_user.id)
+        if cached is None and session.info.get("replica"):
+            cached = await self._load_from_primary(from_user.id)
+        if cached is not None:
+            user = await session.merge(cached, load=False)
+        else:
+            result = await session.execute(select(User).where(User.telegram_id == from_user.id))
+            user = result.scalar_one_or_none()
+        data["user"] = user
+
+        result = await handler(event, data)
+
+        # Анкета могла быть создана обработчиком (/start) - в кеш она попадет на следующем апдейте.
+        # В сессии реплики анкета не менялась (запись там запрещена) и уже в кеше
+        if user is not None and not session.info.get("replica"):
+            try:
+                user_cache.put(user)
+            except Exception as e:
+                logger.warning(f"Не удалось закешировать анкету {from_user.id}: {e}")
+        return result
+
+    @staticmethod
+    async def _load_from_primary(telegram_id: int) -> Optional[User]:
+        """Отсоединенная анкета из основной БД (заодно кладется в кеш)"""
+        async with async_session_maker() as primary:
+            result = await primary.execute(select(User).where(User.telegram_id == telegram_id))
+            user = result.scalar_one_or_none()
+        if user is not None:
+            user_cache.put(user)
+        return user
@@ -0,0 +1,91 @@
+"""
+Реестр активных boost
+
+Активные boost хранятся в памяти процесса: словарь user_id -> expires_at для
+проверки за O(1) и min-heap по времени истечения для вытеснения истекших
+записей. Реестр загружается из таблицы boosts при старте, обновляется при
+покупке boost и периодически сверяется с БД.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.models import Boost
+
+logger = logging.getLogger(__name__)
+
+
+class BoostRegistryService:
+    """Активные boost в памяти с вытеснением по времени истечения"""
+
+    def __init__(self):
+        self._expires: Dict[int, datetime] = {}
+        self._heap: List[Tuple[datetime, int]] = []
+        self._ids_cache: Optional[np.ndarray] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        """Загружает реестр, если он пуст или давно не сверялся с БД"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.BOOST_REGISTRY_SYNC_SECONDS:
+            await self.load(session)
+
+    async def load(self, session: AsyncSession) -> None:
+        """Полностью перечитывает активные boost из БД"""
+        async with self._lock:
+            result = await session.execute(
+                select(Boost.user_id, func.max(Boost.expires_at))
+                .where(Boost.expires_at > datetime.utcnow())
+                .group_by(Boost.user_id)
+            )
+            self._expires = {user_id: expires_at for user_id, expires_at in result.all()}
+            self._heap = [(expires_at, user_id) for user_id, expires_at in self._expires.items()]
+            heapq.heapify(self._heap)
+            self._ids_cache = None
+            self._loaded_at = time.monotonic()
+
+    def add(self, user_id: int, expires_at: datetime) -> None:
+        """Регистрирует купленный boost"""
+        if expires_at <= self._expires.get(user_id, datetime.min):
+            return
+        self._expires[user_id] = expires_at
+        heapq.heappush(self._heap, (expires_at, user_id))
+        self._ids_cache = None
+
+    def _evict(self) -> None:
+        """Убирает истекшие boost с вершины кучи"""
+        now = datetime.utcnow()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, user_id = heapq.heappop(self._heap)
+            # В куче могут остаться устаревшие записи после продления boost
+            if self._expires.get(user_id) == expires_at:
+                del self._expires[user_id]
+                self._ids_cache = None
+
+    def is_active(self, user_id: int) -> bool:
+        """Есть ли у пользователя активный boost"""
+        self._evict()
+        return user_id in self._expires
+
+    def expires_at(self, user_id: int) -> Optional[datetime]:
+        """Время окончания активного boost"""
+        self._evict()
+        return self._expires.get(user_id)
+
+    def active_ids(self) -> np.ndarray:
+        """Отсортированный массив ID пользователей с активным boost (для np.isin)"""
+        self._evict()
+        if self._ids_cache is None:
+            self._ids_cache = np.sort(np.fromiter(self._expires.keys(), dtype=np.int64, count=len(self._expires)))
+        return self._ids_cache
+
+
+boost_registry = BoostRegistryService()
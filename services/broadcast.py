@@ -0,0 +1,394 @@
+"""
+Рассылки администратора
+
+Получатели читаются страницами по users.id (keyset: id > cursor_user_id), а не
+загружаются целиком. Страницу отправляют BROADCAST_WORKERS конкурентных
+воркеров; темп задает общий лимит исходящих запросов (middleware/outbound.py),
+в котором рассылка имеет низший приоритет. После каждой страницы в одной
+транзакции записываются доставки (broadcast_deliveries), счетчики и курсор,
+поэтому прерванная рассылка продолжается с места остановки при следующем
+запуске бота (получатели страницы, не успевшей сохраниться, могут получить
+сообщение повторно - не больше BROADCAST_BATCH_SIZE).
+
+Пользователи, заблокировавшие бота, помечаются недоступными
+(services/reachability.py) и в следующие рассылки не попадают.
+
+Аудиторию можно сузить сегментом (AdminMessage.segment): город, пол, интерес,
+статус подписки, верификация, активность за N дней. Превью аудитории (COUNT)
+и отбор получателей используют одни и те же условия, покрытые индексами
+ix_users_audience и ix_users_last_active_at. Рассылку можно запланировать
+(scheduled_at, UTC) - ее запустит run_scheduler.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select, exists, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.models import (
+    User, AdminMessage, BroadcastDelivery, Gender, Interest, SubscriptionStatus
+)
+from services.reachability import reachability
+
+logger = logging.getLogger(__name__)
+
+
+# Поле сегмента -> (подпись для админа, разбор значения)
+SEGMENT_FIELDS = {
+    "city": ("Город", str),
+    "gender": ("Пол", lambda value: Gender(value.lower()).value),
+    "interest": ("Интерес", lambda value: Interest(value.lower()).value),
+    "subscription": ("Подписка", lambda value: SubscriptionStatus(value.lower()).value),
+    "verified": ("Верификация", lambda value: _parse_bool(value)),
+    "active_days": ("Активность, дней", lambda value: _parse_days(value)),
+}
+
+
+def _parse_bool(value: str) -> bool:
+    value = value.strip().lower()
+    if value in ("да", "yes", "true", "1"):
+        return True
+    if value in ("нет", "no", "false", "0"):
+        return False
+    raise ValueError(value)
+
+
+def _parse_days(value: str) -> int:
+    days = int(value)
+    if days <= 0:
+        raise ValueError(value)
+    return days
+
+
+def parse_segment(text: str) -> Dict[str, Any]:
+    """
+    Разбирает сегмент из текста админа: строки "поле: значение"
+
+    Raises:
+        ValueError: Неизвестное поле или неверное значение (текст для админа)
+    """
+    labels = {label.lower(): field for field, (label, _) in SEGMENT_FIELDS.items()}
+    segment: Dict[str, Any] = {}
+    for line in text.strip().split("\n"):
+        if not line.strip():
+            continue
+        if ":" not in line:
+            raise ValueError(f"Строка без двоеточия: {line}")
+        name, value = (part.strip() for part in line.split(":", 1))
+        field = name.lower() if name.lower() in SEGMENT_FIELDS else labels.get(name.lower())
+        if field is None:
+            raise ValueError(f"Неизвестное поле: {name}")
+        try:
+            segment[field] = SEGMENT_FIELDS[field][1](value)
+        except ValueError:
+            raise ValueError(f"Неверное значение для «{SEGMENT_FIELDS[field][0]}»: {value}")
+    return segment
+
+
+def describe_segment(segment: Optional[Dict[str, Any]]) -> str:
+    """Сегмент в виде текста для админа"""
+    if not segment:
+        return "все пользователи"
+    parts = []
+    for field, value in segment.items():
+        if isinstance(value, bool):
+            value = "да" if value else "нет"
+        parts.append(f"{SEGMENT_FIELDS[field][0]}: {value}")
+    return ", ".join(parts)
+
+
+def recipient_conditions(segment: Optional[Dict[str, Any]] = None) -> list:
+    """Условия отбора получателей рассылки (и для COUNT-превью, и для отправки)"""
+    conditions = [
+        User.is_active == True,
+        User.is_banned == False,
+        User.is_reachable == True,
+    ]
+    segment = segment or {}
+    if "city" in segment:
+        conditions.append(User.city == segment["city"])
+    if "gender" in segment:
+        conditions.append(User.gender == Gender(segment["gender"]))
+    if "interest" in segment:
+        conditions.append(User.interest == Interest(segment["interest"]))
+    if "subscription" in segment:
+        conditions.append(User.subscription_status == SubscriptionStatus(segment["subscription"]))
+    if "verified" in segment:
+        conditions.append(User.is_verified == segment["verified"])
+    if "active_days" in segment:
+        conditions.append(User.last_active_at >= datetime.utcnow() - timedelta(days=segment["active_days"]))
+    return conditions
+
+
+async def count_recipients(session: AsyncSession, segment: Optional[Dict[str, Any]] = None) -> int:
+    """Размер аудитории рассылки"""
+    result = await session.execute(
+        select(func.count(User.id)).where(*recipient_conditions(segment))
+    )
+    return result.scalar()
+
+
+class BroadcastEngine:
+    """Фоновая отправка рассылок с сохранением прогресса"""
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        # admin_message_id -> задача отправки
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def is_running(self, admin_message_id: int) -> bool:
+        task = self._tasks.get(admin_message_id)
+        return task is not None and not task.done()
+
+    def start(self, bot: Bot, admin_message_id: int) -> None:
+        """Запускает отправку рассылки (статус sending уже сохранен вызывающим)"""
+        self._bot = bot
+        if self.is_running(admin_message_id):
+            return
+        self._tasks[admin_message_id] = asyncio.create_task(self._run(admin_message_id))
+
+    async def resume(self, bot: Bot) -> List[int]:
+        """Продолжает рассылки, прерванные перезапуском"""
+        from database.connection import async_session_maker
+
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(AdminMessage.id).where(AdminMessage.status == "sending")
+            )
+            ids = list(result.scalars().all())
+        for admin_message_id in ids:
+            logger.info(f"Возобновление рассылки #{admin_message_id}")
+            self.start(bot, admin_message_id)
+        return ids
+
+    async def run_scheduler(self, bot: Bot) -> None:
+        """Фоновая задача запуска запланированных рассылок"""
+        from database.connection import async_session_maker
+
+        while True:
+            try:
+                async with async_session_maker() as session:
+                    result = await session.execute(
+                        select(AdminMessage).where(
+                            AdminMessage.status == "scheduled",
+                            AdminMessage.scheduled_at <= datetime.utcnow(),
+                        )
+                    )
+                    due = result.scalars().all()
+                    for admin_msg in due:
+                        admin_msg.status = "sending"
+                    await session.commit()
+                for admin_msg in due:
+                    logger.info(f"Запуск запланированной рассылки #{admin_msg.id}")
+                    self.start(bot, admin_msg.id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Ошибка запуска запланированных рассылок: {e}")
+            await asyncio.sleep(settings.BROADCAST_SCHEDULER_SECONDS)
+
+    def cancel_tasks(self) -> None:
+        """Останавливает задачи при остановке бота (статус остается sending)"""
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def _run(self, admin_message_id: int) -> None:
+        from database.connection import async_session_maker
+        from middleware.outbound import send_priority, SendPriority
+
+        send_priority.set(SendPriority.BROADCAST)
+        try:
+            async with async_session_maker() as session:
+                admin_msg = await session.get(AdminMessage, admin_message_id)
+                if admin_msg is None:
+                    return
+                keyboard = self._build_keyboard(admin_msg)
+                remaining = await session.execute(
+                    select(func.count(User.id)).where(
+                        *recipient_conditions(admin_msg.segment), User.id > (admin_msg.cursor_user_id or 0)
+                    )
+                )
+                total = self._processed(admin_msg) + remaining.scalar()
+
+                last_report = 0.0
+                while True:
+                    await session.refresh(admin_msg)
+                    if admin_msg.status != "sending":
+                        break
+
+                    recipients = await self._next_page(session, admin_msg)
+                    if not recipients:
+                        admin_msg.status = "done"
+                        admin_msg.sent_at = datetime.utcnow()
+                        await session.commit()
+                        break
+
+                    results = await self._send_page(admin_msg, keyboard, recipients)
+                    await self._save_page(session, admin_msg, recipients, results)
+
+                    if time.monotonic() - last_report >= settings.BROADCAST_PROGRESS_SECONDS:
+                        last_report = time.monotonic()
+                        await self._report(admin_msg, total)
+
+                await self._report(admin_msg, total)
+                logger.info(
+                    f"Рассылка #{admin_message_id} завершена ({admin_msg.status}): "
+                    f"отправлено {admin_msg.sent_count}, заблокировали {admin_msg.blocked_count}, "
+                    f"ошибок {admin_msg.failed_count}"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рассылки #{admin_message_id}: {e}", exc_info=True)
+        finally:
+            self._tasks.pop(admin_message_id, None)
+
+    async def _next_page(self, session: AsyncSession, admin_msg: AdminMessage) -> List[Tuple[int, int]]:
+        """Следующая страница получателей: (users.id, telegram_id)"""
+        # Доставки проверяются для страницы, прерванной до сохранения курсора
+        delivered = exists().where(
+            BroadcastDelivery.admin_message_id == admin_msg.id,
+            BroadcastDelivery.user_id == User.id,
+        )
+        result = await session.execute(
+            select(User.id, User.telegram_id)
+            .where(
+                *recipient_conditions(admin_msg.segment),
+                User.id > (admin_msg.cursor_user_id or 0),
+                ~delivered,
+            )
+            .order_by(User.id)
+            .limit(settings.BROADCAST_BATCH_SIZE)
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def _send_page(
+        self,
+        admin_msg: AdminMessage,
+        keyboard: Optional[InlineKeyboardMarkup],
+        recipients: List[Tuple[int, int]],
+    ) -> Dict[int, Tuple[str, Optional[str]]]:
+        """Отправляет страницу конкурентными воркерами; возвращает user_id -> (статус, ошибка)"""
+        results: Dict[int, Tuple[str, Optional[str]]] = {}
+        pending = iter(recipients)
+
+        async def worker():
+            for user_id, telegram_id in pending:
+                try:
+                    await self._send(admin_msg, keyboard, telegram_id)
+                    results[user_id] = ("sent", None)
+                except TelegramForbiddenError as e:
+                    results[user_id] = ("blocked", str(e))
+                except Exception as e:
+                    logger.warning(f"Ошибка отправки рассылки пользователю {telegram_id}: {e}")
+                    results[user_id] = ("failed", str(e))
+
+        await asyncio.gather(*(worker() for _ in range(settings.BROADCAST_WORKERS)))
+        return results
+
+    async def _send(self, admin_msg: AdminMessage, keyboard: Optional[InlineKeyboardMarkup], chat_id: int) -> None:
+        if admin_msg.photo:
+            await self._bot.send_photo(chat_id, admin_msg.photo, caption=admin_msg.message_text, reply_markup=keyboard)
+        elif admin_msg.video:
+            await self._bot.send_video(chat_id, admin_msg.video, caption=admin_msg.message_text, reply_markup=keyboard)
+        else:
+            await self._bot.send_message(chat_id, admin_msg.message_text, reply_markup=keyboard)
+
+    async def _save_page(
+        self,
+        session: AsyncSession,
+        admin_msg: AdminMessage,
+        recipients: List[Tuple[int, int]],
+        results: Dict[int, Tuple[str, Optional[str]]],
+    ) -> None:
+        """Сохраняет доставки, счетчики и курсор страницы одной транзакцией"""
+        if session.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        await session.execute(
+            insert(BroadcastDelivery)
+            .values([
+                {"admin_message_id": admin_msg.id, "user_id": user_id, "status": status, "error": error}
+                for user_id, (status, error) in results.items()
+            ])
+            .on_conflict_do_nothing(index_elements=["admin_message_id", "user_id"])
+        )
+
+        blocked = [
+            telegram_id for user_id, telegram_id in recipients
+            if results.get(user_id, ("",))[0] == "blocked"
+        ]
+        if blocked:
+            await reachability.mark_unreachable(blocked, session=session)
+
+        statuses = [status for status, _ in results.values()]
+        admin_msg.sent_count = (admin_msg.sent_count or 0) + statuses.count("sent")
+        admin_msg.blocked_count = (admin_msg.blocked_count or 0) + statuses.count("blocked")
+        admin_msg.failed_count = (admin_msg.failed_count or 0) + statuses.count("failed")
+        admin_msg.cursor_user_id = recipients[-1][0]
+        await session.commit()
+
+    async def _report(self, admin_msg: AdminMessage, total: int) -> None:
+        """Обновляет сообщение с прогрессом у админа"""
+        if not admin_msg.report_chat_id or not admin_msg.report_message_id:
+            return
+        from middleware.outbound import outbound_priority, SendPriority
+
+        titles = {
+            "scheduled": "🕒 Рассылка запланирована",
+            "sending": "⏳ Рассылка отправляется",
+            "done": "✅ Рассылка завершена",
+            "cancelled": "⏹ Рассылка остановлена",
+        }
+        text = (
+            f"{titles.get(admin_msg.status, '📢 Рассылка')} #{admin_msg.id}\n\n"
+            f"Обработано: {self._processed(admin_msg)} из {total}\n"
+            f"✅ Отправлено: {admin_msg.sent_count or 0}\n"
+            f"🚫 Заблокировали бота: {admin_msg.blocked_count or 0}\n"
+            f"⚠️ Ошибок: {admin_msg.failed_count or 0}"
+        )
+        keyboard = None
+        if admin_msg.status == "sending":
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="⏹ Остановить", callback_data=f"broadcast_cancel_{admin_msg.id}")
+            ]])
+        try:
+            # Отчет админу не должен ждать в очереди самой рассылки
+            with outbound_priority(SendPriority.NOTIFICATION):
+                await self._bot.edit_message_text(
+                    text,
+                    chat_id=admin_msg.report_chat_id,
+                    message_id=admin_msg.report_message_id,
+                    reply_markup=keyboard,
+                )
+        except TelegramBadRequest:
+            # Текст не изменился или сообщение удалено
+            pass
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки #{admin_msg.id}: {e}")
+
+    @staticmethod
+    def _processed(admin_msg: AdminMessage) -> int:
+        return (admin_msg.sent_count or 0) + (admin_msg.blocked_count or 0) + (admin_msg.failed_count or 0)
+
+    @staticmethod
+    def _build_keyboard(admin_msg: AdminMessage) -> Optional[InlineKeyboardMarkup]:
+        """Клавиатура рассылки - одна на всех получателей"""
+        if not admin_msg.buttons:
+            return None
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=btn["text"], url=btn["url"])]
+            for btn in admin_msg.buttons
+        ])
+
+
+broadcast_engine = BroadcastEngine()
@@ -0,0 +1,176 @@
+"""
+Очередь кандидатов для просмотра анкет
+
+Для каждого пользователя заранее подбирается пачка ID анкет, которые
+затем по одной выдаются при свайпах. Когда в очереди остается мало анкет,
+она пополняется в фоне отдельной сессией БД.
+
+Состояние хранится только для недавно свайпавших: пользователь без свайпов
+CANDIDATE_QUEUE_IDLE_SECONDS, а сверх CANDIDATE_QUEUE_MAX_USERS - давнее всех свайпавший,
+забывается вместе с припаркованной карточкой (profile_prefetch). Очередь
+при следующем свайпе собирается заново.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.connection import async_session_maker
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateQueueService:
+    """Сервис очередей кандидатов (in-process)"""
+
+    def __init__(self, batch_size: int, refill_threshold: int, max_users: int):
+        self.batch_size = batch_size
+        self.refill_threshold = refill_threshold
+        self.max_users = max_users
+        self._queues: Dict[int, Deque[int]] = {}
+        # Недавно выданные анкеты - чтобы фоновое пополнение не вернуло их повторно
+        self._recent: Dict[int, Deque[int]] = {}
+        # Поколение очереди: растет при инвалидации, устаревшие пополнения отбрасываются
+        self._generations: Dict[int, int] = {}
+        self._refill_tasks: Dict[int, asyncio.Task] = {}
+        # user_id -> время последнего свайпа (monotonic), от давних к недавним
+        self._last_used: "OrderedDict[int, float]" = OrderedDict()
+
+    async def pop(self, session: AsyncSession, user: User) -> Optional[int]:
+        """Выдает ID следующей анкеты из очереди пользователя"""
+        self._touch(user.id)
+        queue = self._queues.get(user.id)
+        if not queue:
+            queue = await self._build(session, user)
+
+        if not queue:
+            return None
+
+        candidate_id = queue.popleft()
+        self._recent.setdefault(user.id, deque(maxlen=self.batch_size)).append(candidate_id)
+
+        if len(queue) < self.refill_threshold:
+            self._schedule_refill(user.id)
+
+        return candidate_id
+
+    def generation(self, user_id: int) -> int:
+        """Текущее поколение очереди пользователя"""
+        return self._generations.get(user_id, 0)
+
+    def invalidate(self, user_id: int) -> None:
+        """Сбрасывает очередь (например, после изменения анкеты или фильтров)"""
+        if user_id not in self._last_used:
+            # Пользователь не свайпал или уже забыт - сбрасывать нечего
+            return
+        self._queues.pop(user_id, None)
+        self._recent.pop(user_id, None)
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        task = self._refill_tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+
+    def discard(self, candidate_id: int) -> None:
+        """Убирает анкету из всех очередей (бан, скрытие анкеты)"""
+        for queue in self._queues.values():
+            try:
+                queue.remove(candidate_id)
+            except ValueError:
+                pass
+
+    def clear(self) -> None:
+        """Полностью очищает все очереди"""
+        for user_id in list(self._queues.keys()):
+            self.invalidate(user_id)
+
+    def _touch(self, user_id: int) -> None:
+        """Отмечает свайп и забывает давно не свайпавших пользователей"""
+        now = time.monotonic()
+        self._last_used[user_id] = now
+        self._last_used.move_to_end(user_id)
+        while self._last_used:
+            oldest_id, last_used = next(iter(self._last_used.items()))
+            if len(self._last_used) <= self.max_users and now - last_used < settings.CANDIDATE_QUEUE_IDLE_SECONDS:
+                break
+            self._forget(oldest_id)
+
+    def _forget(self, user_id: int) -> None:
+        """Удаляет все состояние пользователя (поколение тоже - вместе с карточкой)"""
+        from services.profile_prefetch import profile_prefetch
+
+        self._last_used.pop(user_id, None)
+        self._queues.pop(user_id, None)
+        self._recent.pop(user_id, None)
+        self._generations.pop(user_id, None)
+        task = self._refill_tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+        profile_prefetch.forget(user_id)
+
+    async def _build(self, session: AsyncSession, user: User) -> Deque[int]:
+        """Синхронно собирает новую пачку кандидатов"""
+        recent = self._recent.get(user.id) or deque()
+        candidate_ids = await self._fetch(session, user, set(recent))
+        if not candidate_ids and recent:
+            # Все анкеты уже были показаны - начинаем круг заново
+            recent.clear()
+            candidate_ids = await self._fetch(session, user, set())
+
+        queue = deque(candidate_ids)
+        self._queues[user.id] = queue
+        return queue
+
+    async def _fetch(self, session: AsyncSession, user: User, exclude_ids: Set[int]) -> List[int]:
+        """Подбирает пачку кандидатов и отсеивает уже оцененные по seen-set"""
+        from utils.helpers import get_candidate_ids
+        from services.seen_set import seen_set
+
+        candidate_ids = await get_candidate_ids(session, user, self.batch_size, exclude_ids=exclude_ids)
+        return await seen_set.filter(session, user.id, candidate_ids)
+
+    def _schedule_refill(self, user_id: int) -> None:
+        """Запускает фоновое пополнение очереди, если оно еще не идет"""
+        task = self._refill_tasks.get(user_id)
+        if task and not task.done():
+            return
+        generation = self._generations.get(user_id, 0)
+        self._refill_tasks[user_id] = asyncio.create_task(self._refill(user_id, generation))
+
+    async def _refill(self, user_id: int, generation: int) -> None:
+        """Фоновое пополнение очереди"""
+        try:
+            async with async_session_maker() as session:
+                user = await session.get(User, user_id)
+                if not user:
+                    return
+                queue = self._queues.get(user_id) or deque()
+                exclude_ids = set(queue) | set(self._recent.get(user_id) or ())
+                candidate_ids = await self._fetch(session, user, exclude_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось пополнить очередь анкет пользователя {user_id}: {e}")
+            return
+        finally:
+            if self._refill_tasks.get(user_id) is asyncio.current_task():
+                self._refill_tasks.pop(user_id, None)
+
+        if self._generations.get(user_id, 0) != generation:
+            # Очередь была сброшена, пока шло пополнение
+            return
+
+        queue = self._queues.setdefault(user_id, deque())
+        known = set(queue)
+        queue.extend(cid for cid in candidate_ids if cid not in known)
+
+
+candidate_queue = CandidateQueueService(
+    batch_size=settings.CANDIDATE_BATCH_SIZE,
+    refill_threshold=settings.CANDIDATE_REFILL_THRESHOLD,
+    max_users=settings.CANDIDATE_QUEUE_MAX_USERS
+)
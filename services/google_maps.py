@@ -80,6 +80,42 @@ class GoogleMapsService:
         
         return None
     
+    async def get_city_name(self, latitude: float, longitude: float) -> Optional[str]:
+        """
+        Получает название города (locality) по координатам
+        
+        Args:
+            latitude: Широта
+            longitude: Долгота
+        
+        Returns:
+            str: Название города или None
+        """
+        if not self.api_key:
+            return None
+        
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(
+                    self.reverse_geocode_url,
+                    params={
+                        "latlng": f"{latitude},{longitude}",
+                        "key": self.api_key,
+                        "language": "ru",
+                        "result_type": "locality"
+                    }
+                ) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        if data.get("status") == "OK" and data.get("results"):
+                            for component in data["results"][0].get("address_components", []):
+                                if "locality" in component.get("types", []):
+                                    return component["long_name"]
+        except Exception as e:
+            print(f"Ошибка при определении города: {e}")
+        
+        return None
+    
     def get_map_url(self, latitude: float, longitude: float, zoom: int = 15) -> str:
         """
         Генерирует URL для отображения карты Google Maps
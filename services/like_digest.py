@@ -0,0 +1,133 @@
+"""
+Сводка уведомлений о лайках
+
+Популярной анкете не отправляется отдельное сообщение на каждый лайк: лайки
+копятся по получателю в окне LIKE_DIGEST_WINDOW_SECONDS, после чего уходит
+одно уведомление. Один лайк за окно - обычное "Вам поставили лайк!" с кнопкой
+анкеты, несколько - сводка "Новых лайков: N" с кнопкой списка лайков.
+Взаимные симпатии и суперлайки отправляются сразу, мимо окна.
+
+Окна хранятся в Redis (hash со счетчиком и последним лайкнувшим + ZSET со
+временем закрытия окна), без Redis - в памяти процесса.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import settings
+from database.redis_client import redis_client, is_redis_available, mark_redis_unavailable
+
+logger = logging.getLogger(__name__)
+
+# Забирает закрывшиеся окна: для каждого чата возвращает chat_id и поля hash
+_TAKE_DUE_SCRIPT = """
+local chats = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local result = {}
+for _, chat in ipairs(chats) do
+    redis.call('ZREM', KEYS[1], chat)
+    local key = ARGV[3] .. chat
+    result[#result + 1] = chat
+    result[#result + 1] = redis.call('HGETALL', key)
+    redis.call('DEL', key)
+end
+return result
+"""
+
+
+class LikeDigestService:
+    """Окна накопления уведомлений о лайках по получателю"""
+
+    KEY_PREFIX = "like_digest:"
+    DUE_KEY = "like_digest:due"
+
+    def __init__(self):
+        # In-process окна: chat_id -> (время закрытия, поля сводки)
+        self._local: Dict[int, Tuple[float, Dict[str, str]]] = {}
+
+    async def add(self, chat_id: int, liker_id: int, liker_name: str, liker_username: str = "") -> None:
+        """Учитывает лайк для получателя chat_id (уведомление уйдет по закрытии окна)"""
+        window = settings.LIKE_DIGEST_WINDOW_SECONDS
+        liker = {"liker_id": str(liker_id), "name": liker_name, "username": liker_username}
+        if window <= 0:
+            await self._send(chat_id, dict(liker, count="1"))
+            return
+
+        due_at = time.time() + window
+        if await is_redis_available():
+            try:
+                key = f"{self.KEY_PREFIX}{chat_id}"
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.hincrby(key, "count", 1)
+                pipe.hset(key, mapping=liker)
+                # Страховка на случай, если окно не будет забрано (ключ не должен жить вечно)
+                pipe.expire(key, window * 10)
+                pipe.zadd(self.DUE_KEY, {chat_id: due_at}, nx=True)
+                await pipe.execute()
+                return
+            except Exception as e:
+                mark_redis_unavailable(e)
+
+        opened_due_at, digest = self._local.get(chat_id, (due_at, {"count": "0"}))
+        digest = dict(digest, **liker, count=str(int(digest["count"]) + 1))
+        self._local[chat_id] = (opened_due_at, digest)
+
+    async def flush_due(self) -> int:
+        """Отправляет сводки по закрывшимся окнам; возвращает количество сводок"""
+        now = time.time()
+        due = [(chat_id, digest) for chat_id, (due_at, digest) in self._local.items() if due_at <= now]
+        for chat_id, _ in due:
+            self._local.pop(chat_id, None)
+
+        if await is_redis_available():
+            try:
+                result = await redis_client.eval(
+                    _TAKE_DUE_SCRIPT, 1, self.DUE_KEY, now, 500, self.KEY_PREFIX
+                )
+                for chat_id, fields in zip(result[::2], result[1::2]):
+                    digest = dict(zip(fields[::2], fields[1::2]))
+                    if digest:
+                        due.append((int(chat_id), digest))
+            except Exception as e:
+                mark_redis_unavailable(e)
+
+        for chat_id, digest in due:
+            try:
+                await self._send(chat_id, digest)
+            except Exception as e:
+                logger.warning(f"Не удалось поставить сводку лайков для {chat_id}: {e}")
+        return len(due)
+
+    async def run_periodic(self) -> None:
+        """Фоновая задача отправки сводок"""
+        while True:
+            try:
+                await self.flush_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Ошибка отправки сводок лайков: {e}")
+            await asyncio.sleep(1)
+
+    async def _send(self, chat_id: int, digest: Dict[str, str]) -> None:
+        from services.notifications import notification_dispatcher
+
+        count = int(digest.get("count", 1))
+        if count == 1:
+            text = f"❤️ Вам поставили лайк!\n\n👤 {digest['name']}"
+            if digest.get("username"):
+                text += f" (@{digest['username']})"
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="👤 Посмотреть анкету", callback_data=f"view_profile_{digest['liker_id']}")
+            ]])
+        else:
+            text = f"❤️ Новых лайков: {count}\n\nПоследний: 👤 {digest['name']}"
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="💞 Кто меня лайкнул", callback_data="likes_list")
+            ]])
+        await notification_dispatcher.enqueue(chat_id, text, reply_markup=keyboard)
+
+
+like_digest = LikeDigestService()
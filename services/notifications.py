@@ -0,0 +1,284 @@
+"""
+Асинхронная отправка уведомлений
+
+Обработчики не ждут Telegram API: уведомление (лайк, суперлайк, бан,
+результат верификации) кладется в очередь, а отправляют его фоновые воркеры.
+Очередь - Redis-список; взятое в работу уведомление перекладывается в список
+processing (BLMOVE) и удаляется из него только после отправки, поэтому после
+перезапуска недоставленное возвращается в очередь.
+
+Повторы: при TelegramRetryAfter и сетевых ошибках уведомление откладывается в
+ZSET с экспоненциальной задержкой (не меньше retry_after). Flood wait воркер не
+пережидает: OutboundRateLimitMiddleware в воркерах сразу отдает ошибку, и
+воркер берет следующее уведомление. После
+NOTIFY_MAX_ATTEMPTS попыток, а также при постоянных ошибках (бот заблокирован,
+чат не найден) уведомление попадает в dead-letter список. Получатели,
+заблокировавшие бота, помечаются недоступными (services/reachability.py), и
+уведомления для них в очередь больше не ставятся.
+
+Без Redis используется in-process очередь с теми же правилами (без сохранения
+между перезапусками).
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from config import settings
+from database.redis_client import redis_client, is_redis_available, mark_redis_unavailable
+
+logger = logging.getLogger(__name__)
+
+# Переносит наступившие отложенные уведомления в очередь (атомарно)
+_PROMOTE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('RPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+
+class NotificationDispatcher:
+    """Очередь уведомлений с воркерами, повторами и dead-letter"""
+
+    QUEUE_KEY = "notifications:queue"
+    PROCESSING_KEY = "notifications:processing"
+    DELAYED_KEY = "notifications:delayed"
+    DEAD_KEY = "notifications:dead"
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        # In-process очередь на случай недоступности Redis
+        self._local: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._local_dead: Deque[Dict[str, Any]] = deque(maxlen=settings.NOTIFY_DEAD_LETTER_LIMIT)
+
+    async def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        photo: Optional[str] = None,
+        video: Optional[str] = None,
+    ) -> None:
+        """
+        Ставит уведомление в очередь
+
+        Args:
+            chat_id: Telegram ID получателя
+            text: Текст (для фото и видео - подпись)
+            reply_markup: Inline-клавиатура
+            photo: file_id фото
+            video: file_id видео (приоритетнее фото)
+        """
+        from services.reachability import reachability
+
+        if not await reachability.is_reachable(chat_id):
+            return
+        job = {
+            "id": uuid.uuid4().hex,
+            "chat_id": chat_id,
+            "text": text,
+            "reply_markup": reply_markup.model_dump(exclude_none=True) if reply_markup else None,
+            "photo": photo,
+            "video": video,
+            "attempt": 0,
+        }
+        await self._push(job)
+
+    def start(self, bot: Bot) -> List[asyncio.Task]:
+        """Запускает воркеры; возвращает задачи для отмены при остановке"""
+        self._bot = bot
+        tasks = [asyncio.create_task(self._promote_delayed())]
+        tasks.extend(
+            asyncio.create_task(self._worker()) for _ in range(settings.NOTIFY_WORKERS)
+        )
+        return tasks
+
+    async def recover(self) -> int:
+        """Возвращает в очередь уведомления, взятые в работу до перезапуска"""
+        if not await is_redis_available():
+            return 0
+        recovered = 0
+        try:
+            while await redis_client.lmove(self.PROCESSING_KEY, self.QUEUE_KEY, "RIGHT", "LEFT"):
+                recovered += 1
+        except Exception as e:
+            mark_redis_unavailable(e)
+        if recovered:
+            logger.info(f"Возвращено в очередь недоставленных уведомлений: {recovered}")
+        return recovered
+
+    async def retry_dead(self, limit: int = 1000) -> int:
+        """Повторно ставит в очередь уведомления из dead-letter"""
+        requeued = 0
+        if await is_redis_available():
+            try:
+                while requeued < limit:
+                    raw = await redis_client.rpop(self.DEAD_KEY)
+                    if raw is None:
+                        break
+                    job = json.loads(raw)
+                    job["attempt"] = 0
+                    job.pop("error", None)
+                    await redis_client.rpush(self.QUEUE_KEY, json.dumps(job))
+                    requeued += 1
+                return requeued
+            except Exception as e:
+                mark_redis_unavailable(e)
+        while self._local_dead and requeued < limit:
+            job = self._local_dead.pop()
+            job["attempt"] = 0
+            job.pop("error", None)
+            self._local.put_nowait(job)
+            requeued += 1
+        return requeued
+
+    async def dead_count(self) -> int:
+        """Количество уведомлений в dead-letter"""
+        if await is_redis_available():
+            try:
+                return await redis_client.llen(self.DEAD_KEY)
+            except Exception as e:
+                mark_redis_unavailable(e)
+        return len(self._local_dead)
+
+    async def _push(self, job: Dict[str, Any]) -> None:
+        if await is_redis_available():
+            try:
+                await redis_client.rpush(self.QUEUE_KEY, json.dumps(job))
+                return
+            except Exception as e:
+                mark_redis_unavailable(e)
+        self._local.put_nowait(job)
+
+    async def _take(self) -> Optional[tuple]:
+        """Берет следующее уведомление: (job, raw) - raw есть только для Redis"""
+        try:
+            return self._local.get_nowait(), None
+        except asyncio.QueueEmpty:
+            pass
+        if await is_redis_available():
+            try:
+                raw = await redis_client.blmove(self.QUEUE_KEY, self.PROCESSING_KEY, 1, "LEFT", "RIGHT")
+                return (json.loads(raw), raw) if raw else None
+            except Exception as e:
+                mark_redis_unavailable(e)
+        try:
+            return await asyncio.wait_for(self._local.get(), timeout=1), None
+        except asyncio.TimeoutError:
+            return None
+
+    async def _worker(self) -> None:
+        from middleware.outbound import send_priority, flood_wait_retry, SendPriority
+
+        # Уведомления уступают ответам пользователям в общем лимите отправки
+        send_priority.set(SendPriority.NOTIFICATION)
+        # Повтор после flood wait - через отложенную очередь, а не внутри отправки
+        flood_wait_retry.set(False)
+        while True:
+            try:
+                taken = await self._take()
+                if not taken:
+                    continue
+                job, raw = taken
+                await self._deliver(job, raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера уведомлений: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _deliver(self, job: Dict[str, Any], raw: Optional[str]) -> None:
+        """Отправляет уведомление и решает судьбу при ошибке"""
+        try:
+            await self._send(job)
+        except TelegramRetryAfter as e:
+            await self._retry(job, raw, str(e), min_delay=e.retry_after)
+            return
+        except TelegramForbiddenError as e:
+            # Бот заблокирован - следующие уведомления этому получателю не отправляем
+            from services.reachability import reachability
+            await reachability.mark_unreachable([job["chat_id"]])
+            await self._dead(job, raw, str(e))
+            return
+        except TelegramBadRequest as e:
+            # Чат не найден, неверный file_id - повтор не поможет
+            await self._dead(job, raw, str(e))
+            return
+        except Exception as e:
+            await self._retry(job, raw, str(e))
+            return
+        if raw is not None:
+            await redis_client.lrem(self.PROCESSING_KEY, 1, raw)
+
+    async def _send(self, job: Dict[str, Any]) -> None:
+        reply_markup = (
+            InlineKeyboardMarkup.model_validate(job["reply_markup"]) if job.get("reply_markup") else None
+        )
+        if job.get("video"):
+            await self._bot.send_video(job["chat_id"], job["video"], caption=job["text"], reply_markup=reply_markup)
+        elif job.get("photo"):
+            await self._bot.send_photo(job["chat_id"], job["photo"], caption=job["text"], reply_markup=reply_markup)
+        else:
+            await self._bot.send_message(job["chat_id"], job["text"], reply_markup=reply_markup)
+
+    async def _retry(self, job: Dict[str, Any], raw: Optional[str], error: str, min_delay: float = 0) -> None:
+        job = dict(job, attempt=job["attempt"] + 1)
+        if job["attempt"] >= settings.NOTIFY_MAX_ATTEMPTS:
+            await self._dead(job, raw, error)
+            return
+
+        delay = min(
+            settings.NOTIFY_BACKOFF_MAX_SECONDS,
+            settings.NOTIFY_BACKOFF_BASE_SECONDS * 2 ** (job["attempt"] - 1)
+        )
+        delay = max(delay, min_delay)
+        logger.info(
+            f"Уведомление для {job['chat_id']} отложено на {delay:.1f} с "
+            f"(попытка {job['attempt']}): {error}"
+        )
+        if raw is None:
+            asyncio.get_running_loop().call_later(delay, self._local.put_nowait, job)
+            return
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.zadd(self.DELAYED_KEY, {json.dumps(job): time.time() + delay})
+        pipe.lrem(self.PROCESSING_KEY, 1, raw)
+        await pipe.execute()
+
+    async def _dead(self, job: Dict[str, Any], raw: Optional[str], error: str) -> None:
+        job = dict(job, error=error)
+        logger.warning(f"Уведомление для {job['chat_id']} не доставлено ({job['attempt']} попыток): {error}")
+        if raw is None:
+            self._local_dead.appendleft(job)
+            return
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.lpush(self.DEAD_KEY, json.dumps(job))
+        pipe.ltrim(self.DEAD_KEY, 0, settings.NOTIFY_DEAD_LETTER_LIMIT - 1)
+        pipe.lrem(self.PROCESSING_KEY, 1, raw)
+        await pipe.execute()
+
+    async def _promote_delayed(self) -> None:
+        """Переносит отложенные уведомления в очередь, когда подошло время"""
+        while True:
+            try:
+                if await is_redis_available():
+                    await redis_client.eval(
+                        _PROMOTE_SCRIPT, 2, self.DELAYED_KEY, self.QUEUE_KEY, time.time(), 100
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                mark_redis_unavailable(e)
+            await asyncio.sleep(1)
+
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,115 @@
+"""
+Предзагрузка следующей анкеты
+
+Пока пользователь смотрит анкету, в фоне подбирается следующая и собирается
+ее карточка (текст, клавиатура, file_id медиа). Следующий свайп отвечает
+готовой карточкой без запросов к БД.
+
+Карточки забываются вместе с очередью кандидатов пользователя (см.
+candidate_queue), число карточек дополнительно ограничено
+PROFILE_PREFETCH_MAX_PARKED.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.connection import async_session_maker
+from database.models import User
+from services.candidate_queue import candidate_queue
+from utils.profile_card import ProfileCard, build_profile_card
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilePrefetchService:
+    """Припаркованные карточки следующих анкет (in-process)"""
+
+    def __init__(self, max_parked: int):
+        self.max_parked = max_parked
+        # user_id -> (поколение очереди кандидатов, карточка)
+        self._parked: Dict[int, Tuple[int, ProfileCard]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def next_card(self, session: AsyncSession, user: User) -> Optional[ProfileCard]:
+        """Следующая карточка: припаркованная или подобранная сейчас"""
+        from services.seen_set import seen_set
+        from utils.helpers import get_next_profile
+
+        card = await self.take(user.id)
+        # За время ожидания анкету могли оценить другим путем (например, из уведомления)
+        if card and not await seen_set.contains(session, user.id, card.profile_id):
+            return card
+
+        profile = await get_next_profile(session, user)
+        if not profile:
+            return None
+        return build_profile_card(user, profile)
+
+    async def take(self, user_id: int) -> Optional[ProfileCard]:
+        """Забирает припаркованную карточку (дожидается идущей предзагрузки)"""
+        task = self._tasks.get(user_id)
+        if task and not task.done():
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+
+        parked = self._parked.pop(user_id, None)
+        if not parked:
+            return None
+        generation, card = parked
+        if generation != candidate_queue.generation(user_id):
+            # Очередь сброшена (изменилась анкета или фильтры) - карточка устарела
+            return None
+        return card
+
+    def schedule(self, user_id: int) -> None:
+        """Запускает фоновую предзагрузку следующей карточки"""
+        if not settings.PROFILE_PREFETCH_ENABLED or user_id in self._parked:
+            return
+        task = self._tasks.get(user_id)
+        if task and not task.done():
+            return
+        self._tasks[user_id] = asyncio.create_task(self._prefetch(user_id))
+
+    def forget(self, user_id: int) -> None:
+        """Удаляет карточку пользователя и отменяет ее предзагрузку"""
+        self._parked.pop(user_id, None)
+        task = self._tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+
+    def discard_profile(self, profile_id: int) -> None:
+        """Убирает припаркованные карточки анкеты (бан, скрытие анкеты)"""
+        for user_id, (_, card) in list(self._parked.items()):
+            if card.profile_id == profile_id:
+                self._parked.pop(user_id, None)
+
+    async def _prefetch(self, user_id: int) -> None:
+        from utils.helpers import get_next_profile
+
+        generation = candidate_queue.generation(user_id)
+        try:
+            async with async_session_maker() as session:
+                user = await session.get(User, user_id)
+                if not user:
+                    return
+                profile = await get_next_profile(session, user)
+                if profile:
+                    if len(self._parked) >= self.max_parked:
+                        # Словарь хранит порядок вставки - первой удаляется самая старая карточка
+                        self._parked.pop(next(iter(self._parked)), None)
+                    self._parked[user_id] = (generation, build_profile_card(user, profile))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось предзагрузить анкету для пользователя {user_id}: {e}")
+        finally:
+            if self._tasks.get(user_id) is asyncio.current_task():
+                self._tasks.pop(user_id, None)
+
+
+profile_prefetch = ProfilePrefetchService(max_parked=settings.PROFILE_PREFETCH_MAX_PARKED)
@@ -0,0 +1,268 @@
+"""
+Колоночный снимок пула анкет
+
+В памяти процесса хранятся только поля, нужные для отбора и ранжирования
+активных, незабаненных, нескрытых и заполненных анкет. Массивы отсортированы
+по users.id. Снимок обновляется инкрементально
+по users.updated_at (периодическая задача + ленивое обновление при запросе),
+раз в SNAPSHOT_FULL_REBUILD_SECONDS перестраивается целиком, чтобы убрать
+удаленные из БД анкеты.
+
+Память на одну анкету: id 8 + возраст 4 + пол 1 + интерес 1 + широта 4 +
+долгота 4 + дата регистрации 8 + верификация 1 + лайки 4 + код города 4 +
+заранее посчитанная часть оценки 4 = 43 байта, т.е. ~4.3 МБ на 100 тыс. анкет
+(плюс словарь городов и временные массивы на время обновления - до двух копий
+снимка).
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.models import User
+from services.ranking import CandidateColumns, GENDER_CODES, INTEREST_CODES, ranking_engine
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_COLUMNS = (
+    User.id, User.age, User.gender, User.interest, User.city, User.latitude, User.longitude,
+    User.created_at, User.is_verified, User.total_likes,
+    User.is_active, User.is_banned, User.is_hidden, User.name, User.updated_at,
+)
+
+
+def _is_eligible(row) -> bool:
+    """Анкета подходит для показа (те же условия, что visible_profile_conditions)"""
+    return bool(row.is_active) and not row.is_banned and not row.is_hidden and row.name is not None
+
+
+class ProfileSnapshot:
+    """Массивы полей анкет, отсортированные по ID"""
+
+    __slots__ = (
+        "ids", "ages", "genders", "interests", "latitudes", "longitudes",
+        "created_at", "is_verified", "total_likes", "city_codes",
+    )
+
+    def __init__(self, size: int = 0):
+        self.ids = np.zeros(size, dtype=np.int64)
+        self.ages = np.zeros(size, dtype=np.float32)  # NaN - возраст не указан
+        self.genders = np.zeros(size, dtype=np.int8)
+        self.interests = np.zeros(size, dtype=np.int8)
+        self.latitudes = np.zeros(size, dtype=np.float32)  # NaN - нет координат
+        self.longitudes = np.zeros(size, dtype=np.float32)
+        self.created_at = np.zeros(size, dtype=np.float64)  # unix time
+        self.is_verified = np.zeros(size, dtype=np.bool_)
+        self.total_likes = np.zeros(size, dtype=np.float32)
+        self.city_codes = np.zeros(size, dtype=np.int32)  # 0 - город не указан
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def take(self, index: np.ndarray) -> "ProfileSnapshot":
+        subset = ProfileSnapshot()
+        for name in self.__slots__:
+            setattr(subset, name, getattr(self, name)[index])
+        return subset
+
+    @classmethod
+    def concat(cls, parts: List["ProfileSnapshot"]) -> "ProfileSnapshot":
+        """Склеивает части и сортирует результат по ID"""
+        merged = cls()
+        for name in cls.__slots__:
+            setattr(merged, name, np.concatenate([getattr(part, name) for part in parts]))
+        order = np.argsort(merged.ids, kind="stable")
+        return merged.take(order)
+
+
+class ProfileSnapshotService:
+    """Снимок пула анкет с инкрементальным обновлением"""
+
+    def __init__(self):
+        self._snapshot = ProfileSnapshot()
+        self._static_scores = np.zeros(0, dtype=np.float32)
+        self._city_codes: Dict[str, int] = {}
+        self._watermark: Optional[datetime] = None
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def city_code(self, city: Optional[str]) -> int:
+        """Код города (0 - не указан или не встречается в снимке)"""
+        if not city:
+            return 0
+        return self._city_codes.get(city, 0)
+
+    def _intern_city(self, city: Optional[str]) -> int:
+        if not city:
+            return 0
+        code = self._city_codes.get(city)
+        if code is None:
+            code = len(self._city_codes) + 1
+            self._city_codes[city] = code
+        return code
+
+    def _build(self, rows: list) -> ProfileSnapshot:
+        """Строит часть снимка из строк запроса"""
+        part = ProfileSnapshot(len(rows))
+        for i, row in enumerate(rows):
+            part.ids[i] = row.id
+            part.ages[i] = row.age if row.age is not None else np.nan
+            part.genders[i] = GENDER_CODES.get(row.gender, 0)
+            part.interests[i] = INTEREST_CODES.get(row.interest, 0)
+            part.latitudes[i] = row.latitude if row.latitude is not None else np.nan
+            part.longitudes[i] = row.longitude if row.longitude is not None else np.nan
+            part.created_at[i] = row.created_at.timestamp() if row.created_at else 0.0
+            part.is_verified[i] = bool(row.is_verified)
+            part.total_likes[i] = row.total_likes or 0
+            part.city_codes[i] = self._intern_city(row.city)
+        return part
+
+    async def ensure_fresh(self, session: AsyncSession) -> ProfileSnapshot:
+        """Ленивое обновление: обновляет снимок, если он старше интервала"""
+        if time.monotonic() - self._refreshed_at >= settings.SNAPSHOT_REFRESH_SECONDS:
+            await self.refresh(session)
+        return self._snapshot
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """
+        Инкрементальное обновление (или полная перестройка по расписанию)
+
+        Читает только основную БД: с отстающей реплики водяной знак updated_at
+        ушел бы вперед, и пропущенные анкеты не попали бы в снимок до полной
+        перестройки.
+        """
+        from database.connection import primary_session
+
+        async with self._lock, primary_session(session) as session:
+            now = time.monotonic()
+            if self._watermark is None or now - self._rebuilt_at >= settings.SNAPSHOT_FULL_REBUILD_SECONDS:
+                await self._rebuild(session)
+            else:
+                await self._apply_changes(session)
+            # Новизна и популярность от зрителя не зависят - считаем один раз на обновление
+            self._static_scores = ranking_engine.static_scores(self._snapshot, time.time())
+            self._refreshed_at = time.monotonic()
+
+    async def _rebuild(self, session: AsyncSession) -> None:
+        """Полная загрузка снимка"""
+        from utils.helpers import visible_profile_conditions
+
+        started = time.perf_counter()
+        conditions = visible_profile_conditions()
+        self._city_codes = {}
+        watermark = None
+        parts = []
+        result = await session.stream(
+            select(*_SNAPSHOT_COLUMNS).where(*conditions).execution_options(yield_per=10000)
+        )
+        async for partition in result.partitions():
+            parts.append(self._build(partition))
+            batch_max = max((row.updated_at for row in partition if row.updated_at), default=None)
+            if batch_max and (watermark is None or batch_max > watermark):
+                watermark = batch_max
+
+        self._snapshot = ProfileSnapshot.concat(parts) if parts else ProfileSnapshot()
+        self._watermark = watermark or datetime(1970, 1, 1)
+        self._rebuilt_at = time.monotonic()
+        logger.info(
+            f"Снимок анкет перестроен: {len(self._snapshot)} анкет, "
+            f"{self._snapshot.nbytes / 1024 / 1024:.1f} МБ, {time.perf_counter() - started:.2f} с"
+        )
+
+    async def _apply_changes(self, session: AsyncSession) -> None:
+        """Применяет анкеты, измененные после последнего обновления"""
+        # Перекрытие в секунду: записи с той же меткой времени могли появиться после
+        # прошлого чтения, а SQLite хранит func.now() без долей секунды
+        result = await session.execute(
+            select(*_SNAPSHOT_COLUMNS).where(User.updated_at >= self._watermark - timedelta(seconds=1))
+        )
+        rows = result.all()
+        if not rows:
+            return
+
+        changed_ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+        eligible_rows = [row for row in rows if _is_eligible(row)]
+
+        snapshot = self._snapshot
+        keep = ~np.isin(snapshot.ids, changed_ids)
+        parts = [snapshot.take(keep)]
+        if eligible_rows:
+            parts.append(self._build(eligible_rows))
+        self._snapshot = ProfileSnapshot.concat(parts)
+        self._watermark = max((row.updated_at for row in rows if row.updated_at), default=None) or self._watermark
+
+    def candidate_columns(
+        self,
+        viewer: User,
+        seen_bitmap: bytes = b"",
+        exclude_ids: Optional[Set[int]] = None
+    ) -> Tuple[CandidateColumns, np.ndarray]:
+        """
+        Кандидаты для зрителя в формате для ранжирования
+
+        Колонки ссылаются на массивы снимка без копирования, допустимые строки
+        задаются маской.
+
+        Args:
+            viewer: Пользователь, который смотрит анкеты
+            seen_bitmap: Битовая карта оцененных анкет из seen-set
+            exclude_ids: Дополнительно исключаемые ID
+
+        Returns:
+            Tuple[CandidateColumns, np.ndarray]: Колонки и маска допустимых строк
+        """
+        snapshot = self._snapshot
+        mask = snapshot.ids != viewer.id
+
+        if seen_bitmap:
+            # Бит с номером users.id выставлен, если анкета уже оценена
+            seen_bits = np.unpackbits(np.frombuffer(seen_bitmap, dtype=np.uint8)).view(np.bool_)
+            in_range = snapshot.ids < len(seen_bits)
+            mask[in_range] &= ~seen_bits[snapshot.ids[in_range]]
+
+        if exclude_ids:
+            mask &= ~np.isin(snapshot.ids, np.fromiter(exclude_ids, dtype=np.int64, count=len(exclude_ids)))
+
+        columns = CandidateColumns(0)
+        columns.ids = snapshot.ids
+        columns.ages = snapshot.ages
+        columns.genders = snapshot.genders
+        columns.interests = snapshot.interests
+        columns.latitudes = snapshot.latitudes
+        columns.longitudes = snapshot.longitudes
+        columns.created_at = snapshot.created_at
+        columns.is_verified = snapshot.is_verified
+        columns.total_likes = snapshot.total_likes
+        viewer_city = self.city_code(viewer.city)
+        columns.same_city = (snapshot.city_codes == viewer_city) if viewer_city else np.zeros(len(snapshot), dtype=np.bool_)
+        columns.boosted = np.zeros(len(snapshot), dtype=np.bool_)
+        columns.static_scores = self._static_scores
+        return columns, mask
+
+    async def run_periodic_refresh(self) -> None:
+        """Фоновая задача периодического обновления снимка"""
+        from database.connection import async_session_maker
+
+        while True:
+            try:
+                async with async_session_maker() as session:
+                    await self.refresh(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось обновить снимок анкет: {e}")
+            await asyncio.sleep(settings.SNAPSHOT_REFRESH_SECONDS)
+
+
+profile_snapshot = ProfileSnapshotService()
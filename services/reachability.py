@@ -0,0 +1,123 @@
+"""
+Доступность пользователей для сообщений бота
+
+Источник истины - users.is_reachable: False, если пользователь заблокировал
+бота (my_chat_member со статусом kicked или TelegramForbiddenError при
+отправке). Telegram ID недоступных пользователей кешируются в Redis-множестве
+(без Redis - в памяти процесса), чтобы очередь уведомлений отсекала их без
+запроса к БД. Множество перестраивается из таблицы при запуске бота.
+Доступность восстанавливается, когда пользователь снова запускает бота
+(/start или my_chat_member со статусом member).
+"""
+import logging
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import User
+from database.redis_client import redis_client, is_redis_available, mark_redis_unavailable
+
+logger = logging.getLogger(__name__)
+
+
+class ReachabilityService:
+    """Флаг is_reachable и его кеш"""
+
+    UNREACHABLE_KEY = "users:unreachable"
+
+    def __init__(self):
+        # In-process кеш на случай недоступности Redis
+        self._local: Set[int] = set()
+
+    async def load(self, session: AsyncSession) -> int:
+        """Перестраивает кеш по таблице users; возвращает число недоступных"""
+        result = await session.execute(
+            select(User.telegram_id).where(User.is_reachable == False)
+        )
+        telegram_ids = set(result.scalars().all())
+        self._local = set(telegram_ids)
+        if await is_redis_available():
+            try:
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.delete(self.UNREACHABLE_KEY)
+                if telegram_ids:
+                    pipe.sadd(self.UNREACHABLE_KEY, *telegram_ids)
+                await pipe.execute()
+            except Exception as e:
+                mark_redis_unavailable(e)
+        return len(telegram_ids)
+
+    async def is_reachable(self, telegram_id: int) -> bool:
+        if await is_redis_available():
+            try:
+                return not await redis_client.sismember(self.UNREACHABLE_KEY, telegram_id)
+            except Exception as e:
+                mark_redis_unavailable(e)
+        return telegram_id not in self._local
+
+    async def filter_reachable(self, telegram_ids: Iterable[int]) -> List[int]:
+        """Оставляет только доступных получателей (порядок сохраняется)"""
+        telegram_ids = list(telegram_ids)
+        if not telegram_ids:
+            return []
+        if await is_redis_available():
+            try:
+                flags = await redis_client.smismember(self.UNREACHABLE_KEY, telegram_ids)
+                return [telegram_id for telegram_id, flag in zip(telegram_ids, flags) if not flag]
+            except Exception as e:
+                mark_redis_unavailable(e)
+        return [telegram_id for telegram_id in telegram_ids if telegram_id not in self._local]
+
+    async def mark_unreachable(self, telegram_ids: Iterable[int], session: Optional[AsyncSession] = None) -> None:
+        """
+        Помечает пользователей заблокировавшими бота
+
+        С переданной сессией UPDATE выполняется в ней (коммит - за вызывающим
+        кодом), без сессии - в отдельной транзакции.
+        """
+        await self._set(list(telegram_ids), False, session)
+
+    async def mark_reachable(self, telegram_id: int, session: Optional[AsyncSession] = None) -> None:
+        """Снимает отметку о блокировке (пользователь снова запустил бота)"""
+        await self._set([telegram_id], True, session)
+
+    async def _set(self, telegram_ids: List[int], reachable: bool, session: Optional[AsyncSession]) -> None:
+        if not telegram_ids:
+            return
+        statement = (
+            update(User)
+            .where(User.telegram_id.in_(telegram_ids))
+            .values(is_reachable=reachable)
+            .execution_options(synchronize_session=False)
+        )
+        if session is not None:
+            await session.execute(statement)
+        else:
+            from database.connection import async_session_maker
+            async with async_session_maker() as own_session:
+                await own_session.execute(statement)
+                await own_session.commit()
+
+        from middleware.user_context import user_cache
+        user_cache.invalidate(*telegram_ids)
+
+        if reachable:
+            self._local.difference_update(telegram_ids)
+        else:
+            self._local.update(telegram_ids)
+        if await is_redis_available():
+            try:
+                if reachable:
+                    await redis_client.srem(self.UNREACHABLE_KEY, *telegram_ids)
+                else:
+                    await redis_client.sadd(self.UNREACHABLE_KEY, *telegram_ids)
+            except Exception as e:
+                mark_redis_unavailable(e)
+        logger.info(
+            f"Пользователи {'снова доступны' if reachable else 'заблокировали бота'}: {telegram_ids[:10]}"
+            + (f" и еще {len(telegram_ids) - 10}" if len(telegram_ids) > 10 else "")
+        )
+
+
+reachability = ReachabilityService()
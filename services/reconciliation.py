@@ -0,0 +1,181 @@
+"""
+Сверка данных после конкурентных записей
+
+Основная защита от гонок - в местах записи (см. record_like и
+increment_user_counters). Здесь собраны периодические проходы, которые
+исправляют то, что все же разошлось: взаимные лайки, записанные без
+advisory-блокировки (с запоздалым сообщением о взаимной симпатии), и счетчики
+total_likes / total_dislikes.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Set, Tuple
+
+from sqlalchemy import select, update, exists, and_, or_, func
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.models import User, Like, Dislike
+
+logger = logging.getLogger(__name__)
+
+
+class ReconciliationService:
+    """Периодическая сверка производных полей с исходными данными"""
+
+    async def reconcile_mutual_likes(
+        self,
+        session: AsyncSession,
+        since: Optional[datetime] = None,
+    ) -> int:
+        """
+        Отмечает взаимными встречные лайки, у которых is_mutual не выставлен
+
+        Обработчик лайка, не увидевший встречный лайк, сообщение о взаимной
+        симпатии не отправлял - после коммита оно ставится в очередь обоим
+        пользователям каждой исправленной пары (один раз на пару).
+
+        Args:
+            since: Проверять только пары, в которых хотя бы один лайк создан
+                   после этого момента (None - все лайки)
+
+        Returns:
+            Количество исправленных записей
+        """
+        reverse = aliased(Like)
+        reverse_conditions = [
+            reverse.from_user_id == Like.to_user_id,
+            reverse.to_user_id == Like.from_user_id,
+        ]
+        if since is not None:
+            # Старая половина пары тоже исправляется, если встречный лайк свежий
+            reverse_conditions.append(or_(Like.created_at >= since, reverse.created_at >= since))
+
+        result = await session.execute(
+            update(Like)
+            .where(Like.is_mutual == False, exists().where(and_(*reverse_conditions)))
+            .values(is_mutual=True)
+            .returning(Like.from_user_id, Like.to_user_id)
+            .execution_options(synchronize_session=False)
+        )
+        fixed = result.all()
+        await session.commit()
+
+        pairs = {tuple(sorted(row)) for row in fixed}
+        if pairs:
+            await self._notify_mutual(session, pairs)
+        return len(fixed)
+
+    async def _notify_mutual(self, session: AsyncSession, pairs: Set[Tuple[int, int]]) -> None:
+        """Сообщение о взаимной симпатии обоим пользователям каждой пары"""
+        from services.notifications import notification_dispatcher
+        from utils.helpers import mutual_like_notice
+
+        user_ids = {user_id for pair in pairs for user_id in pair}
+        result = await session.execute(select(User).where(User.id.in_(user_ids)))
+        users = {user.id: user for user in result.scalars().all()}
+        for first_id, second_id in pairs:
+            first, second = users.get(first_id), users.get(second_id)
+            if first is None or second is None:
+                continue
+            for recipient, partner in ((first, second), (second, first)):
+                text, keyboard = mutual_like_notice(partner)
+                try:
+                    await notification_dispatcher.enqueue(recipient.telegram_id, text, reply_markup=keyboard)
+                except Exception as e:
+                    logger.warning(
+                        f"Не удалось поставить уведомление о взаимной симпатии пользователю {recipient.telegram_id}: {e}"
+                    )
+
+    async def reconcile_counters(self, session: AsyncSession) -> int:
+        """
+        Пересчитывает total_likes и total_dislikes из таблиц likes/dislikes
+
+        total_likes - лайки, поставленные пользователем и полученные им (так
+        счетчик ведет record_like), total_dislikes - поставленные дизлайки.
+        Агрегаты считаются GROUP BY по всей таблице, обновляются только
+        разошедшиеся строки. Дизлайки, еще не записанные из swipe_buffer,
+        добавятся к счетчику при записи пачки.
+
+        Returns:
+            Количество исправленных пользователей
+        """
+        likes_given = (
+            select(Like.from_user_id.label("user_id"), func.count().label("count"))
+            .group_by(Like.from_user_id)
+            .subquery()
+        )
+        likes_received = (
+            select(Like.to_user_id.label("user_id"), func.count().label("count"))
+            .group_by(Like.to_user_id)
+            .subquery()
+        )
+        dislikes_given = (
+            select(Dislike.from_user_id.label("user_id"), func.count().label("count"))
+            .group_by(Dislike.from_user_id)
+            .subquery()
+        )
+        counts = (
+            select(
+                User.id.label("user_id"),
+                (func.coalesce(likes_given.c.count, 0) + func.coalesce(likes_received.c.count, 0)).label("total_likes"),
+                func.coalesce(dislikes_given.c.count, 0).label("total_dislikes"),
+            )
+            .outerjoin(likes_given, likes_given.c.user_id == User.id)
+            .outerjoin(likes_received, likes_received.c.user_id == User.id)
+            .outerjoin(dislikes_given, dislikes_given.c.user_id == User.id)
+            .subquery()
+        )
+
+        result = await session.execute(
+            update(User)
+            .where(
+                User.id == counts.c.user_id,
+                or_(
+                    User.total_likes.is_distinct_from(counts.c.total_likes),
+                    User.total_dislikes.is_distinct_from(counts.c.total_dislikes),
+                )
+            )
+            .values(total_likes=counts.c.total_likes, total_dislikes=counts.c.total_dislikes)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return result.rowcount or 0
+
+    async def run_periodic(self) -> None:
+        """Фоновая задача сверки"""
+        from database.connection import async_session_maker
+
+        next_counters_at = 0.0
+        while True:
+            await asyncio.sleep(settings.RECONCILE_INTERVAL_SECONDS)
+            since = datetime.utcnow() - timedelta(minutes=settings.RECONCILE_LOOKBACK_MINUTES)
+            try:
+                async with async_session_maker() as session:
+                    fixed = await self.reconcile_mutual_likes(session, since=since)
+                if fixed:
+                    logger.warning(f"Сверка: исправлено взаимных лайков без отметки: {fixed}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось выполнить сверку взаимных лайков: {e}")
+
+            # Пересчет счетчиков читает таблицы целиком - выполняется реже
+            if time.monotonic() < next_counters_at:
+                continue
+            next_counters_at = time.monotonic() + settings.RECONCILE_COUNTERS_SECONDS
+            try:
+                async with async_session_maker() as session:
+                    fixed = await self.reconcile_counters(session)
+                if fixed:
+                    logger.warning(f"Сверка: пересчитаны счетчики лайков/дизлайков у {fixed} пользователей")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось пересчитать счетчики лайков/дизлайков: {e}")
+
+
+reconciliation = ReconciliationService()
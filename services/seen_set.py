@@ -0,0 +1,277 @@
+"""
+Индекс просмотренных анкет (seen-set)
+
+Для каждого пользователя хранится битовая карта, где бит с номером users.id
+выставлен, если анкета уже лайкнута или дизлайкнута. Основное хранилище -
+Redis (SETBIT/GETBIT), при недоступности Redis - bytearray в памяти процесса
+с той же раскладкой битов. In-process карты ограничены по суммарному размеру
+(SEEN_SET_LOCAL_MAX_MB): давно не использованные вытесняются и при следующем
+обращении строятся заново. Карта лениво заполняется из таблиц likes/dislikes
+(и еще не записанных дизлайков из swipe_buffer) при первом обращении и может
+быть полностью перестроена командой /rebuild_seen (в фоне, с прогрессом).
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.connection import primary_session
+from database.models import Like, Dislike
+from database.redis_client import (
+    redis_binary_client, is_redis_available, mark_redis_unavailable
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _set_bit(bitmap: bytearray, position: int) -> None:
+    """Выставляет бит в bytearray (порядок битов как в Redis: старший бит первым)"""
+    byte_index = position >> 3
+    if byte_index >= len(bitmap):
+        bitmap.extend(bytes(byte_index - len(bitmap) + 1))
+    bitmap[byte_index] |= 0x80 >> (position & 7)
+
+
+def _get_bit(bitmap: bytes, position: int) -> bool:
+    byte_index = position >> 3
+    if byte_index >= len(bitmap):
+        return False
+    return bool(bitmap[byte_index] & (0x80 >> (position & 7)))
+
+
+class SeenSetService:
+    """Битовые карты просмотренных анкет"""
+
+    KEY_PREFIX = "seen:"
+    PROGRESS_INTERVAL_SECONDS = 5.0  # Как часто обновлять прогресс /rebuild_seen
+
+    def __init__(self, max_local_bytes: int):
+        self.max_local_bytes = max_local_bytes
+        # In-process хранилище на случай недоступности Redis (от давних к недавним)
+        self._local: "OrderedDict[int, bytearray]" = OrderedDict()
+        self._local_bytes = 0
+        self._rebuild_task: Optional[asyncio.Task] = None
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+    def _loaded_key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}{user_id}:loaded"
+
+    async def add(self, user_id: int, target_id: int) -> None:
+        """Отмечает анкету как просмотренную (лайк или дизлайк)"""
+        if await is_redis_available():
+            try:
+                await redis_binary_client.setbit(self._key(user_id), target_id, 1)
+                return
+            except Exception as e:
+                mark_redis_unavailable(e)
+        bitmap = self._local.get(user_id)
+        if bitmap is not None:
+            size = len(bitmap)
+            _set_bit(bitmap, target_id)
+            self._local_bytes += len(bitmap) - size
+            self._local.move_to_end(user_id)
+            self._evict_local()
+
+    async def contains(self, session: AsyncSession, user_id: int, target_id: int) -> bool:
+        """Проверяет, оценивал ли пользователь анкету"""
+        return (await self.contains_many(session, user_id, [target_id]))[0]
+
+    async def contains_many(self, session: AsyncSession, user_id: int, target_ids: List[int]) -> List[bool]:
+        """Проверяет список анкет, возвращает флаги в том же порядке"""
+        if not target_ids:
+            return []
+        if await is_redis_available():
+            try:
+                await self._ensure_loaded_redis(session, user_id)
+                pipe = redis_binary_client.pipeline(transaction=False)
+                for target_id in target_ids:
+                    pipe.getbit(self._key(user_id), target_id)
+                return [bool(bit) for bit in await pipe.execute()]
+            except Exception as e:
+                mark_redis_unavailable(e)
+        bitmap = await self._ensure_loaded_local(session, user_id)
+        return [_get_bit(bitmap, target_id) for target_id in target_ids]
+
+    async def filter(self, session: AsyncSession, user_id: int, target_ids: List[int]) -> List[int]:
+        """Оставляет только непросмотренные анкеты (порядок сохраняется)"""
+        flags = await self.contains_many(session, user_id, target_ids)
+        return [target_id for target_id, seen in zip(target_ids, flags) if not seen]
+
+    async def get_bitmap(self, session: AsyncSession, user_id: int) -> bytes:
+        """Возвращает битовую карту целиком"""
+        if await is_redis_available():
+            try:
+                await self._ensure_loaded_redis(session, user_id)
+                return await redis_binary_client.get(self._key(user_id)) or b""
+            except Exception as e:
+                mark_redis_unavailable(e)
+        return bytes(await self._ensure_loaded_local(session, user_id))
+
+    async def rebuild(
+        self,
+        session: AsyncSession,
+        user_id: Optional[int] = None,
+        progress: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> int:
+        """
+        Перестраивает битовые карты из таблиц likes/dislikes
+
+        Args:
+            session: Сессия БД
+            user_id: ID пользователя или None для перестройки всех карт
+            progress: Вызывается с числом уже перестроенных карт после каждой
+
+        Returns:
+            int: Количество перестроенных карт
+        """
+        from services.swipe_buffer import swipe_buffer
+
+        # Дизлайки из буфера отложенной записи еще не попали в таблицу. Буфер
+        # читается до таблицы: событие, записанное в БД в промежутке, не потеряется
+        buffered = await swipe_buffer.unflushed(user_id)
+
+        swipes = union_all(
+            select(Like.from_user_id.label("from_user_id"), Like.to_user_id.label("to_user_id")),
+            select(Dislike.from_user_id, Dislike.to_user_id),
+        ).subquery()
+        query = select(swipes.c.from_user_id, swipes.c.to_user_id)
+        if user_id is not None:
+            query = query.where(swipes.c.from_user_id == user_id)
+        query = query.order_by(swipes.c.from_user_id)
+
+        rebuilt = 0
+        current_user_id = None
+        bitmap = bytearray()
+        result = await session.stream(query.execution_options(yield_per=10000))
+        async for from_user_id, to_user_id in result:
+            if from_user_id != current_user_id:
+                if current_user_id is not None:
+                    await self._store(current_user_id, bitmap)
+                    rebuilt += 1
+                    if progress:
+                        await progress(rebuilt)
+                current_user_id = from_user_id
+                bitmap = bytearray()
+            _set_bit(bitmap, to_user_id)
+
+        if current_user_id is not None:
+            await self._store(current_user_id, bitmap)
+            rebuilt += 1
+        elif user_id is not None:
+            # У пользователя нет оценок - сохраняем пустую карту
+            await self._store(user_id, bytearray())
+            rebuilt += 1
+
+        for from_user_id, to_user_id in buffered:
+            await self.add(from_user_id, to_user_id)
+
+        if user_id is None:
+            logger.info(f"Перестроено битовых карт просмотренных анкет: {rebuilt}")
+        return rebuilt
+
+    def start_rebuild(self, bot: Bot, chat_id: int, message_id: int) -> bool:
+        """
+        Запускает полную перестройку в фоне
+
+        Прогресс и итог выводятся в сообщение message_id чата chat_id.
+
+        Returns:
+            bool: False, если перестройка уже идет
+        """
+        if self._rebuild_task and not self._rebuild_task.done():
+            return False
+        self._rebuild_task = asyncio.create_task(self._rebuild_all(bot, chat_id, message_id))
+        return True
+
+    async def _rebuild_all(self, bot: Bot, chat_id: int, message_id: int) -> None:
+        from database.connection import async_session_maker
+        from middleware.outbound import send_priority, SendPriority
+
+        send_priority.set(SendPriority.NOTIFICATION)
+        last_report = time.monotonic()
+
+        async def report_progress(rebuilt: int) -> None:
+            nonlocal last_report
+            if time.monotonic() - last_report >= self.PROGRESS_INTERVAL_SECONDS:
+                last_report = time.monotonic()
+                await self._report(bot, chat_id, message_id, f"⏳ Перестраиваю индекс просмотренных анкет: {rebuilt} пользователей")
+
+        try:
+            async with async_session_maker() as session:
+                rebuilt = await self.rebuild(session, progress=report_progress)
+            text = f"✅ Индекс перестроен: {rebuilt} пользователей"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка перестройки индекса просмотренных анкет: {e}", exc_info=True)
+            text = "❌ Не удалось перестроить индекс, подробности в логе"
+        await self._report(bot, chat_id, message_id, text)
+
+    @staticmethod
+    async def _report(bot: Bot, chat_id: int, message_id: int, text: str) -> None:
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except TelegramBadRequest:
+            # Сообщение удалено
+            pass
+
+    async def _store(self, user_id: int, bitmap: bytearray) -> None:
+        """Атомарно заменяет карту пользователя"""
+        if await is_redis_available():
+            try:
+                pipe = redis_binary_client.pipeline(transaction=True)
+                if bitmap:
+                    pipe.set(self._key(user_id), bytes(bitmap))
+                else:
+                    pipe.delete(self._key(user_id))
+                pipe.set(self._loaded_key(user_id), 1)
+                await pipe.execute()
+                return
+            except Exception as e:
+                mark_redis_unavailable(e)
+        old = self._local.pop(user_id, None)
+        if old is not None:
+            self._local_bytes -= len(old)
+        self._local[user_id] = bitmap
+        self._local_bytes += len(bitmap)
+        self._evict_local()
+
+    def _evict_local(self) -> None:
+        """Вытесняет давно не использованные in-process карты сверх лимита (последняя остается)"""
+        while self._local_bytes > self.max_local_bytes and len(self._local) > 1:
+            _, bitmap = self._local.popitem(last=False)
+            self._local_bytes -= len(bitmap)
+
+    # Ленивое заполнение сохраняет карту (и отметку :loaded) надолго - читаем
+    # только основную БД, даже если обработчику досталась сессия реплики
+
+    async def _ensure_loaded_redis(self, session: AsyncSession, user_id: int) -> None:
+        if not await redis_binary_client.exists(self._loaded_key(user_id)):
+            async with primary_session(session) as primary:
+                await self.rebuild(primary, user_id)
+
+    async def _ensure_loaded_local(self, session: AsyncSession, user_id: int) -> bytearray:
+        if user_id in self._local:
+            self._local.move_to_end(user_id)
+        else:
+            async with primary_session(session) as primary:
+                await self.rebuild(primary, user_id)
+        return self._local.setdefault(user_id, bytearray())
+
+    def clear_local(self) -> None:
+        """Очищает in-process карты"""
+        self._local.clear()
+        self._local_bytes = 0
+
+
+seen_set = SeenSetService(max_local_bytes=settings.SEEN_SET_LOCAL_MAX_MB * 1024 * 1024)
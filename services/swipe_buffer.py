@@ -0,0 +1,235 @@
+"""
+Отложенная запись дизлайков (write-behind)
+
+Дизлайк не требует ответа из БД, поэтому обработчик только добавляет событие
+в Redis Stream, а фоновый воркер пачками пишет их в таблицу dislikes одним
+INSERT ... VALUES с ON CONFLICT DO NOTHING. Пачка отправляется, когда набралось
+SWIPE_BUFFER_BATCH_SIZE событий или прошло SWIPE_BUFFER_FLUSH_SECONDS.
+
+Доставка at-least-once: событие подтверждается (XACK) только после коммита
+пачки. Каждый процесс читает группу под своим именем (хост:pid), поэтому
+pending-события одного процесса не достаются другому, пока тот их пишет;
+события упавших или перезапущенных процессов забираются через XAUTOCLAIM.
+Повторная запись безопасна благодаря уникальному ключу (from_user_id, to_user_id).
+
+Без Redis дизлайк пишется сразу в сессию обработчика. Seen-set обновляется
+обработчиком немедленно, а при перестройке карт дополняется событиями,
+которые еще не записаны в БД (см. unflushed). Для перестройки карты одного
+пользователя незаписанные дизлайки хранятся еще и в множестве пользователя
+(swipes:pending:<user_id>), чтобы не читать весь стрим.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.models import Dislike
+from database.redis_client import redis_client, is_redis_available, mark_redis_unavailable
+
+logger = logging.getLogger(__name__)
+
+
+class SwipeBufferService:
+    """Буфер дизлайков в Redis Stream с пакетной записью в БД"""
+
+    STREAM_KEY = "swipes:dislikes"
+    PENDING_KEY = "swipes:pending:{user_id}"
+    GROUP = "swipe-writers"
+
+    def __init__(self):
+        # Процессы одного хоста - разные потребители группы
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self._group_ready = False
+
+    async def add_dislike(self, session: AsyncSession, from_user_id: int, to_user_id: int) -> None:
+        """
+        Записывает дизлайк: в буфер, а без Redis - сразу в сессию обработчика
+
+        В обоих случаях коммит сессии остается за вызывающим кодом.
+        """
+        if settings.SWIPE_BUFFER_ENABLED and await is_redis_available():
+            try:
+                pending_key = self.PENDING_KEY.format(user_id=from_user_id)
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.xadd(self.STREAM_KEY, {
+                    "from": from_user_id,
+                    "to": to_user_id,
+                    "ts": datetime.utcnow().isoformat(),
+                })
+                pipe.sadd(pending_key, to_user_id)
+                pipe.expire(pending_key, settings.SWIPE_BUFFER_PENDING_TTL_SECONDS)
+                await pipe.execute()
+                return
+            except Exception as e:
+                mark_redis_unavailable(e)
+        await self.write(session, [(from_user_id, to_user_id, datetime.utcnow())])
+
+    async def write(self, session: AsyncSession, swipes: List[Tuple[int, int, datetime]]) -> int:
+        """
+        Пишет пачку дизлайков одним INSERT и обновляет счетчики (без коммита)
+
+        Returns:
+            int: Количество новых записей (повторы пропускаются)
+        """
+        from utils.helpers import increment_user_counters
+
+        if session.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        # Повторы внутри пачки схлопываем, оставляя первое событие
+        unique: Dict[Tuple[int, int], datetime] = {}
+        for from_user_id, to_user_id, created_at in swipes:
+            unique.setdefault((from_user_id, to_user_id), created_at)
+        if not unique:
+            return 0
+
+        result = await session.execute(
+            insert(Dislike)
+            .values([
+                {"from_user_id": from_user_id, "to_user_id": to_user_id, "created_at": created_at}
+                for (from_user_id, to_user_id), created_at in unique.items()
+            ])
+            .on_conflict_do_nothing(index_elements=["from_user_id", "to_user_id"])
+            .returning(Dislike.from_user_id)
+        )
+        # Счетчик увеличиваем только на реально вставленные записи - повторная
+        # доставка пачки не задваивает его
+        inserted = Counter(result.scalars().all())
+        for user_id, count in inserted.items():
+            await increment_user_counters(session, [user_id], total_dislikes=count)
+        return sum(inserted.values())
+
+    async def unflushed(self, user_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Дизлайки из буфера, еще не записанные в БД (from_user_id, to_user_id)
+
+        Для одного пользователя читается его множество незаписанных дизлайков,
+        весь стрим - только для всех пользователей (полная перестройка).
+        """
+        if not settings.SWIPE_BUFFER_ENABLED or not await is_redis_available():
+            return []
+        try:
+            if user_id is not None:
+                to_user_ids = await redis_client.smembers(self.PENDING_KEY.format(user_id=user_id))
+                return [(user_id, int(to_user_id)) for to_user_id in to_user_ids]
+            entries = await redis_client.xrange(self.STREAM_KEY)
+        except Exception as e:
+            mark_redis_unavailable(e)
+            return []
+        return [(int(fields["from"]), int(fields["to"])) for _, fields in entries]
+
+    async def run_flusher(self) -> None:
+        """Фоновый воркер записи буфера в БД"""
+        from database.connection import async_session_maker
+
+        # Сначала дописываем то, что этот воркер прочитал, но не подтвердил до перезапуска
+        start_id = "0"
+        next_claim_at = 0.0
+        while True:
+            try:
+                if not await is_redis_available():
+                    self._group_ready = False
+                    await asyncio.sleep(settings.SWIPE_BUFFER_FLUSH_SECONDS)
+                    continue
+                await self._ensure_group()
+
+                entries = []
+                if time.monotonic() >= next_claim_at:
+                    entries = await self._claim_stale()
+                    await self._drop_idle_consumers()
+                    next_claim_at = time.monotonic() + settings.SWIPE_BUFFER_CLAIM_IDLE_SECONDS
+                if not entries:
+                    entries = await self._read_batch(start_id)
+                    if start_id == "0" and not entries:
+                        start_id = ">"
+                        continue
+                if not entries:
+                    continue
+
+                swipes = [
+                    (int(fields["from"]), int(fields["to"]), datetime.fromisoformat(fields["ts"]))
+                    for _, fields in entries
+                ]
+                async with async_session_maker() as session:
+                    inserted = await self.write(session, swipes)
+                    await session.commit()
+
+                entry_ids = [entry_id for entry_id, _ in entries]
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.xack(self.STREAM_KEY, self.GROUP, *entry_ids)
+                pipe.xdel(self.STREAM_KEY, *entry_ids)
+                for from_user_id, to_user_id, _ in swipes:
+                    pipe.srem(self.PENDING_KEY.format(user_id=from_user_id), to_user_id)
+                await pipe.execute()
+                logger.debug(f"Записано дизлайков из буфера: {inserted} из {len(entries)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось записать буфер дизлайков: {e}")
+                await asyncio.sleep(settings.SWIPE_BUFFER_FLUSH_SECONDS)
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await redis_client.xgroup_create(self.STREAM_KEY, self.GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def _read_batch(self, start_id: str) -> list:
+        """Читает пачку: до SWIPE_BUFFER_BATCH_SIZE событий или до истечения интервала"""
+        batch_size = settings.SWIPE_BUFFER_BATCH_SIZE
+        if start_id != ">":
+            # Pending-список этого воркера читается без ожидания
+            response = await redis_client.xreadgroup(
+                self.GROUP, self.consumer, {self.STREAM_KEY: start_id}, count=batch_size
+            )
+            # Удаленные из стрима записи приходят без полей - пропускаем их
+            return [(entry_id, fields) for entry_id, fields in response[0][1] if fields] if response else []
+
+        entries = []
+        deadline = time.monotonic() + settings.SWIPE_BUFFER_FLUSH_SECONDS
+        while len(entries) < batch_size:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+            response = await redis_client.xreadgroup(
+                self.GROUP, self.consumer, {self.STREAM_KEY: ">"},
+                count=batch_size - len(entries), block=remaining_ms
+            )
+            if not response:
+                break
+            entries.extend(response[0][1])
+        return entries
+
+    async def _claim_stale(self) -> list:
+        """Забирает события, зависшие у других (упавших) воркеров"""
+        response = await redis_client.xautoclaim(
+            self.STREAM_KEY, self.GROUP, self.consumer,
+            min_idle_time=settings.SWIPE_BUFFER_CLAIM_IDLE_SECONDS * 1000,
+            start_id="0-0", count=settings.SWIPE_BUFFER_BATCH_SIZE
+        )
+        # Удаленные из стрима записи приходят как пустые - пропускаем их
+        return [(entry_id, fields) for entry_id, fields in response[1] if fields]
+
+    async def _drop_idle_consumers(self) -> None:
+        """Удаляет из группы потребителей завершившихся процессов (без pending-событий)"""
+        idle_ms = settings.SWIPE_BUFFER_CLAIM_IDLE_SECONDS * 1000
+        for consumer in await redis_client.xinfo_consumers(self.STREAM_KEY, self.GROUP):
+            # Живой потребитель без событий безопасно пересоздается следующим XREADGROUP
+            if consumer["name"] != self.consumer and consumer["pending"] == 0 and consumer["idle"] > idle_ms:
+                await redis_client.xgroup_delconsumer(self.STREAM_KEY, self.GROUP, consumer["name"])
+
+
+swipe_buffer = SwipeBufferService()
@@ -202,6 +202,9 @@ class TelegramPaymentService:
             
             await session.commit()
             
+            from middleware.user_context import user_cache
+            user_cache.invalidate(user.telegram_id)
+            
         except Exception as e:
             logger.error(f"Ошибка при обработке успешного платежа: {e}")
             await session.rollback()
@@ -0,0 +1,136 @@
+"""
+Общие фикстуры тестов
+
+Тесты работают с временной SQLite-базой и без Telegram API: запросы бота
+записываются RecordingSession, апдейты подаются в диспетчер, собранный так же,
+как в main.py. Redis не используется - сервисы работают через in-process fallback.
+"""
+import asyncio
+import itertools
+import os
+import tempfile
+import typing
+from datetime import datetime
+from typing import Any, List, Optional
+
+# Настройки читаются при импорте config - окружение задаем до импортов приложения
+_tmp_dir = tempfile.mkdtemp(prefix="dating_bot_tests_")
+os.environ["BOT_TOKEN"] = "42:TEST"
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp_dir}/test.db"
+os.environ["DATABASE_REPLICA_URL"] = ""
+os.environ["ADMIN_USER_IDS"] = "1000"
+# Закрытый порт: тесты всегда идут через in-process fallback, даже если рядом запущен Redis
+os.environ["REDIS_URL"] = "redis://127.0.0.1:1/0"
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, InlineKeyboardMarkup, Message, Update, User as TelegramUser
+
+from database.connection import engine
+from database.models import Base
+
+ADMIN_ID = 1000
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+class RecordingSession(BaseSession):
+    """Сессия бота без сети: запоминает запросы и отвечает правдоподобными объектами"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests: List[TelegramMethod] = []
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.requests.append(method)
+        returning = method.__returning__
+        if returning is Message:
+            reply_markup = getattr(method, "reply_markup", None)
+            return Message(
+                message_id=next(_message_ids),
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=getattr(method, "text", None),
+                # В Message бывает только inline-клавиатура (reply-клавиатура остается у клиента)
+                reply_markup=reply_markup if isinstance(reply_markup, InlineKeyboardMarkup) else None,
+            )
+        if returning is bool or bool in typing.get_args(returning):
+            return True
+        return None
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def sent_texts(self) -> List[str]:
+        return [method.text for method in self.requests if getattr(method, "text", None)]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+    asyncio.run(create())
+    yield engine
+
+
+@pytest.fixture(scope="session")
+def dispatcher() -> Dispatcher:
+    """Диспетчер с middleware и порядком роутеров из main.py (роутер подключается один раз)"""
+    from main import setup_dispatcher
+    dp = Dispatcher(storage=MemoryStorage())
+    setup_dispatcher(dp)
+    return dp
+
+
+@pytest.fixture
+def bot() -> Bot:
+    return Bot(token=os.environ["BOT_TOKEN"], session=RecordingSession())
+
+
+def message_update(user_id: int, text: str) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        message=Message(
+            message_id=next(_message_ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=TelegramUser(id=user_id, is_bot=False, first_name="Test"),
+            text=text,
+        ),
+    )
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        callback_query=CallbackQuery(
+            id=str(next(_update_ids)),
+            from_user=TelegramUser(id=user_id, is_bot=False, first_name="Test"),
+            chat_instance="test",
+            data=data,
+            message=Message(
+                message_id=next(_message_ids),
+                date=datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                text="-",
+            ),
+        ),
+    )
+
+
+def drain_notifications() -> List[dict]:
+    """Забирает уведомления из in-process очереди (воркеры в тестах не запущены)"""
+    from services.notifications import notification_dispatcher
+    jobs = []
+    while not notification_dispatcher._local.empty():
+        jobs.append(notification_dispatcher._local.get_nowait())
+    return jobs
@@ -0,0 +1,21 @@
+"""Отметка активности не делает анкету измененной для снимка анкет"""
+from datetime import datetime
+
+from database.connection import async_session_maker
+from database.models import User
+from middleware.activity import ActivityMiddleware
+
+
+async def test_touch_keeps_updated_at():
+    updated_at = datetime(2024, 1, 1)
+    async with async_session_maker() as session:
+        user = User(telegram_id=9700, name="A", age=30, gender="male", city="Активск", updated_at=updated_at)
+        session.add(user)
+        await session.commit()
+
+    await ActivityMiddleware()._touch(9700)
+
+    async with async_session_maker() as session:
+        user = await session.get(User, user.id)
+        assert user.last_active_at is not None
+        assert user.updated_at == updated_at
@@ -0,0 +1,24 @@
+"""Админ-команды доходят до своих обработчиков (раньше общего обработчика сообщений)"""
+from tests.conftest import ADMIN_ID, message_update
+
+
+async def test_rebuild_seen_reaches_handler(dispatcher, bot):
+    from services.seen_set import seen_set
+
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, "/rebuild_seen"))
+    # Перестройка идет в фоне и дописывает итог в то же сообщение
+    await seen_set._rebuild_task
+
+    texts = bot.session.sent_texts()
+    assert any(text.startswith("⏳ Перестраиваю индекс") for text in texts)
+    assert any(text.startswith("✅ Индекс перестроен") for text in texts)
+
+
+async def test_retry_notifications_requeues_dead_letters(dispatcher, bot):
+    from services.notifications import notification_dispatcher
+
+    notification_dispatcher._local_dead.append({"id": "dead", "chat_id": 1, "text": "x", "attempt": 8})
+
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, "/retry_notifications"))
+
+    assert "✅ Поставлено в очередь повторно: 1\nОсталось недоставленных: 0" in bot.session.sent_texts()
@@ -0,0 +1,44 @@
+"""Рассылка от админа: текст -> кнопки -> аудитория с превью -> планирование"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from database.connection import async_session_maker
+from database.models import AdminMessage, User
+from tests.conftest import ADMIN_ID, callback_update, message_update
+
+
+async def test_segment_preview_and_schedule(dispatcher, bot):
+    async with async_session_maker() as session:
+        session.add_all([
+            User(telegram_id=5001, name="A", age=25, gender="female", city="Броудкастск"),
+            User(telegram_id=5002, name="B", age=30, gender="male", city="Броудкастск"),
+            User(telegram_id=5003, name="C", age=30, gender="male", city="Другой"),
+            User(telegram_id=5004, name="D", age=30, gender="male", city="Броудкастск", is_banned=True),
+        ])
+        await session.commit()
+
+    await dispatcher.feed_update(bot, callback_update(ADMIN_ID, "admin_broadcast"))
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, "Привет всем"))
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, "/skip"))
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, "Город: Броудкастск"))
+
+    preview = bot.session.requests[-1]
+    assert preview.text.startswith("📢 Превью рассылки:")
+    assert preview.text.endswith("Получателей: 2")
+    schedule_data = preview.reply_markup.inline_keyboard[1][0].callback_data
+    assert schedule_data.startswith("broadcast_schedule_")
+    admin_msg_id = int(schedule_data.split("_")[2])
+
+    scheduled_at = (datetime.utcnow() + timedelta(days=1)).replace(second=0, microsecond=0)
+    await dispatcher.feed_update(bot, callback_update(ADMIN_ID, schedule_data))
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, scheduled_at.strftime("%d.%m.%Y %H:%M")))
+
+    assert bot.session.sent_texts()[-1].startswith(f"🕒 Рассылка #{admin_msg_id} запланирована")
+    async with async_session_maker() as session:
+        admin_msg = (await session.execute(
+            select(AdminMessage).where(AdminMessage.id == admin_msg_id)
+        )).scalar_one()
+    assert admin_msg.segment == {"city": "Броудкастск"}
+    assert admin_msg.status == "scheduled"
+    assert admin_msg.scheduled_at == scheduled_at
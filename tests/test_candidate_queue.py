@@ -0,0 +1,70 @@
+"""Состояние очередей кандидатов и предзагрузки ограничено по числу пользователей и простою"""
+import itertools
+import time
+
+import pytest
+
+from database.connection import async_session_maker
+from database.models import User
+from services.candidate_queue import candidate_queue
+from services.profile_prefetch import profile_prefetch
+
+_telegram_ids = itertools.count(9100)
+
+
+@pytest.fixture
+async def viewers(monkeypatch):
+    # Без фонового пополнения: тест проверяет только учет пользователей
+    monkeypatch.setattr(candidate_queue, "refill_threshold", 0)
+    candidate_queue._last_used.clear()
+    async with async_session_maker() as session:
+        users = [
+            User(telegram_id=next(_telegram_ids), name=f"V{i}", age=28, gender="female", city="Очередьград")
+            for i in range(4)
+        ]
+        session.add_all(users)
+        await session.commit()
+    return users
+
+
+async def pop(user: User) -> None:
+    async with async_session_maker() as session:
+        await candidate_queue.pop(session, user)
+
+
+def is_known(user_id: int) -> bool:
+    return user_id in candidate_queue._last_used or user_id in candidate_queue._queues
+
+
+async def test_least_recently_used_is_forgotten(viewers, monkeypatch):
+    monkeypatch.setattr(candidate_queue, "max_users", 2)
+    first, second, third, _ = viewers
+
+    await pop(first)
+    await pop(second)
+    profile_prefetch._parked[first.id] = (candidate_queue.generation(first.id), object())
+    await pop(first)  # first снова недавний - вытесняется second
+    await pop(third)
+
+    assert is_known(first.id) and is_known(third.id)
+    assert not is_known(second.id)
+    assert len(candidate_queue._last_used) == 2
+    assert first.id in profile_prefetch._parked
+
+    await pop(second)
+    assert not is_known(first.id)
+    assert first.id not in profile_prefetch._parked
+
+
+async def test_idle_users_are_forgotten(viewers):
+    idle, active, *_ = viewers
+
+    await pop(idle)
+    candidate_queue._last_used[idle.id] = time.monotonic() - 10 ** 6
+    await pop(active)
+
+    assert not is_known(idle.id)
+    assert is_known(active.id)
+    # Забытому пользователю сбрасывать нечего - invalidate не заводит состояние заново
+    candidate_queue.invalidate(idle.id)
+    assert idle.id not in candidate_queue._generations
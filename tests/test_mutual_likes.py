@@ -0,0 +1,144 @@
+"""Встречные лайки: обе записи взаимные, сообщение о симпатии - ровно одно каждому"""
+import asyncio
+from collections import Counter
+from typing import List, Tuple
+
+from aiogram.methods import SendMessage
+from sqlalchemy import select
+
+from database.connection import async_session_maker
+from database.models import Like, User
+from handlers.states import SuperLike
+from services.reconciliation import reconciliation
+from tests.conftest import callback_update, drain_notifications, message_update
+from utils.helpers import record_like
+
+MATCH_PREFIX = "💕 Взаимная симпатия!"
+
+
+async def create_pairs(first_telegram_id: int, count: int) -> List[Tuple[User, User]]:
+    async with async_session_maker() as session:
+        users = [
+            User(telegram_id=first_telegram_id + i, name=f"U{i}", age=25,
+                 gender="male" if i % 2 else "female", city="Лайкополь")
+            for i in range(count * 2)
+        ]
+        session.add_all(users)
+        await session.commit()
+    return [(users[i], users[i + 1]) for i in range(0, len(users), 2)]
+
+
+async def pair_rows(pairs: List[Tuple[User, User]]) -> List[Like]:
+    ids = [user.id for pair in pairs for user in pair]
+    async with async_session_maker() as session:
+        result = await session.execute(select(Like).where(Like.from_user_id.in_(ids)))
+        return result.scalars().all()
+
+
+def match_notices(bot, jobs: List[dict]) -> Counter:
+    """Сообщения о взаимной симпатии по получателям: отправленные сразу и поставленные в очередь"""
+    recipients = Counter(
+        method.chat_id for method in bot.session.requests
+        if isinstance(method, SendMessage) and method.text.startswith(MATCH_PREFIX)
+    )
+    recipients.update(job["chat_id"] for job in jobs if job["text"].startswith(MATCH_PREFIX))
+    return recipients
+
+
+async def like(liker: User, target: User) -> bool:
+    """Лайк в своей транзакции, как в обработчике like_*"""
+    async with async_session_maker() as session:
+        created, is_mutual = await record_like(session, liker.id, target.id)
+        await session.commit()
+    assert created
+    return is_mutual
+
+
+async def test_simultaneous_reciprocal_likes():
+    pairs = await create_pairs(6000, 10)
+
+    # Оба лайка каждой пары - одновременно; сверка не запускается
+    results = await asyncio.gather(*(
+        like(liker, target)
+        for first, second in pairs
+        for liker, target in ((first, second), (second, first))
+    ))
+
+    rows = await pair_rows(pairs)
+    assert len(rows) == 2 * len(pairs)
+    assert all(row.is_mutual for row in rows)
+    # Сообщение о симпатии отправляет тот лайк, что увидел взаимность: по одному на пару
+    for index in range(len(pairs)):
+        assert sorted(results[2 * index:2 * index + 2]) == [False, True]
+
+
+async def test_simultaneous_likes_notify_each_side_once(dispatcher, bot):
+    pairs = await create_pairs(7000, 10)
+    drain_notifications()
+
+    # Оба лайка каждой пары - одновременно, через обработчик like_*
+    await asyncio.gather(*(
+        dispatcher.feed_update(bot, callback_update(liker.telegram_id, f"like_{target.id}"))
+        for first, second in pairs
+        for liker, target in ((first, second), (second, first))
+    ))
+
+    # Сразу после обработчиков, без сверки
+    rows = await pair_rows(pairs)
+    assert len(rows) == 2 * len(pairs)
+    assert all(row.is_mutual for row in rows)
+
+    notices = match_notices(bot, drain_notifications())
+    assert notices == Counter({user.telegram_id: 1 for pair in pairs for user in pair})
+
+
+async def test_reconciliation_notifies_lost_match_once(bot):
+    pairs = await create_pairs(8000, 3)
+    drain_notifications()
+
+    # Гонка, в которой каждая транзакция не увидела встречный лайк
+    async with async_session_maker() as session:
+        session.add_all([
+            Like(from_user_id=liker.id, to_user_id=target.id, is_mutual=False)
+            for first, second in pairs
+            for liker, target in ((first, second), (second, first))
+        ])
+        await session.commit()
+
+    async with async_session_maker() as session:
+        fixed = await reconciliation.reconcile_mutual_likes(session)
+    assert fixed == 2 * len(pairs)
+    assert all(row.is_mutual for row in await pair_rows(pairs))
+
+    jobs = drain_notifications()
+    assert match_notices(bot, jobs) == Counter({user.telegram_id: 1 for pair in pairs for user in pair})
+    first, second = pairs[0]
+    job = next(job for job in jobs if job["chat_id"] == first.telegram_id)
+    assert job["text"] == f"{MATCH_PREFIX}\n\n👤 {second.name}\n\nВы понравились друг другу!"
+    assert job["reply_markup"]["inline_keyboard"][0][0]["callback_data"] == f"view_profile_{second.id}"
+
+    # Повторная сверка ничего не исправляет и ничего не отправляет
+    async with async_session_maker() as session:
+        assert await reconciliation.reconcile_mutual_likes(session) == 0
+    assert drain_notifications() == []
+
+
+async def test_super_like_on_mutual_pair_sends_no_second_match(dispatcher, bot):
+    (first, second), = await create_pairs(8100, 1)
+    async with async_session_maker() as session:
+        assert await record_like(session, first.id, second.id) == (True, False)
+        assert await record_like(session, second.id, first.id) == (True, True)
+        await session.commit()
+    drain_notifications()
+
+    # Суперлайк поверх обычного лайка уже взаимной пары
+    state = dispatcher.fsm.resolve_context(bot, first.telegram_id, first.telegram_id)
+    await state.set_state(SuperLike.message)
+    await state.update_data(target_user_id=second.id)
+    await dispatcher.feed_update(bot, message_update(first.telegram_id, "Привет!"))
+
+    rows = {(row.from_user_id, row.is_super_like) for row in await pair_rows([(first, second)])}
+    assert rows == {(first.id, True), (second.id, False)}
+    jobs = drain_notifications()
+    assert [job["chat_id"] for job in jobs if job["text"].startswith("⭐")] == [second.telegram_id]
+    assert not match_notices(bot, jobs)
@@ -0,0 +1,54 @@
+"""Воркер уведомлений не пережидает flood wait, а откладывает уведомление"""
+import asyncio
+import os
+from contextlib import suppress
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from middleware.outbound import OutboundRateLimitMiddleware
+from services.notifications import notification_dispatcher
+from tests.conftest import RecordingSession, drain_notifications
+
+
+class FloodSession(RecordingSession):
+    """Отвечает flood wait на каждое сообщение"""
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(method)
+        raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=30)
+
+
+async def test_worker_defers_flood_wait_to_delayed_retry(monkeypatch):
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=FloodSession())
+    limiter = OutboundRateLimitMiddleware()
+    bot.session.middleware(limiter)
+    # В оба чата недавно отправляли - flood wait относится к чату, а не ко всему боту
+    for chat_id in (5001, 5002):
+        limiter.chat_buckets.reserve(chat_id)
+    monkeypatch.setattr(notification_dispatcher, "_bot", bot)
+    retries = []
+
+    async def record_retry(job, raw, error, min_delay=0):
+        retries.append((job["chat_id"], min_delay))
+
+    monkeypatch.setattr(notification_dispatcher, "_retry", record_retry)
+    drain_notifications()
+
+    worker = asyncio.create_task(notification_dispatcher._worker())
+    try:
+        await notification_dispatcher.enqueue(5001, "Первое")
+        await notification_dispatcher.enqueue(5002, "Второе")
+        for _ in range(50):
+            if len(retries) == 2:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        worker.cancel()
+        with suppress(asyncio.CancelledError):
+            await worker
+
+    # Оба уведомления отложены с retry_after за доли секунды, без повторов внутри отправки
+    assert retries == [(5001, 30), (5002, 30)]
+    assert [method.chat_id for method in bot.session.requests if isinstance(method, SendMessage)] == [5001, 5002]
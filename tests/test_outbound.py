@@ -0,0 +1,68 @@
+"""Flood wait: пауза чата или всего бота, ответы пользователю соблюдают лимит чата"""
+import os
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from middleware.outbound import OutboundRateLimitMiddleware, flood_wait_retry
+from tests.conftest import RecordingSession
+
+
+class FloodOnceSession(RecordingSession):
+    """Отвечает flood wait на первое сообщение в каждый чат из flood_chats"""
+
+    def __init__(self, flood_chats):
+        super().__init__()
+        self.flood_chats = set(flood_chats)
+
+    async def make_request(self, bot, method, timeout=None):
+        if method.chat_id in self.flood_chats:
+            self.flood_chats.discard(method.chat_id)
+            self.requests.append(method)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        return await super().make_request(bot, method, timeout)
+
+
+def limited_bot(flood_chats=()) -> Bot:
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=FloodOnceSession(flood_chats))
+    bot.session.middleware(OutboundRateLimitMiddleware())
+    return bot
+
+
+async def timed_send(bot: Bot, chat_id: int) -> float:
+    started = time.monotonic()
+    await bot.send_message(chat_id, "-")
+    return time.monotonic() - started
+
+
+async def test_flood_wait_on_idle_chat_pauses_all_chats():
+    bot = limited_bot(flood_chats={601})
+    token = flood_wait_retry.set(False)
+    try:
+        with pytest.raises(TelegramRetryAfter):
+            await bot.send_message(601, "-")
+    finally:
+        flood_wait_retry.reset(token)
+
+    # В чат 601 раньше не отправляли - превышен лимит бота, ждут и другие чаты
+    assert await timed_send(bot, 602) >= 0.9
+
+
+async def test_flood_wait_on_busy_chat_blocks_only_that_chat():
+    bot = limited_bot()
+    await bot.send_message(701, "-")
+    bot.session.flood_chats.add(701)
+
+    # Повтор внутри вызова после паузы чата
+    assert await timed_send(bot, 701) >= 0.9
+    assert await timed_send(bot, 702) < 0.5
+
+
+async def test_interactive_burst_waits_for_chat_bucket():
+    bot = limited_bot()
+    # Запас чата - 3 сообщения, дальше не чаще TELEGRAM_CHAT_RATE
+    delays = [await timed_send(bot, 801) for _ in range(4)]
+    assert max(delays[:3]) < 0.5
+    assert delays[3] >= 0.5
@@ -0,0 +1,27 @@
+"""Пользователь, снова запустивший бота, считается доступным сразу после /start"""
+from database.connection import async_session_maker
+from database.models import User
+from middleware.user_context import user_cache
+from services.reachability import reachability
+from tests.conftest import message_update
+
+
+async def test_start_restores_reachability_once(dispatcher, bot, monkeypatch):
+    async with async_session_maker() as session:
+        session.add(User(telegram_id=9800, name="R", age=30, gender="female", city="Доступск", is_reachable=False))
+        await session.commit()
+
+    calls = []
+    mark_reachable = reachability.mark_reachable
+
+    async def record_mark_reachable(telegram_id, session=None):
+        calls.append(telegram_id)
+        await mark_reachable(telegram_id, session=session)
+
+    monkeypatch.setattr(reachability, "mark_reachable", record_mark_reachable)
+
+    await dispatcher.feed_update(bot, message_update(9800, "/start"))
+    assert user_cache.get(9800).is_reachable
+    await dispatcher.feed_update(bot, message_update(9800, "/start"))
+
+    assert calls == [9800]
@@ -0,0 +1,105 @@
+"""Реплика для чтения: отстающая реплика не попадает в долгоживущие кеши"""
+import os
+import types
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import middleware.database as database_middleware
+from database.connection import ReplicaSession, async_session_maker
+from database.models import Base, Like, User
+from middleware.database import DatabaseMiddleware, primary_pins
+from middleware.user_context import UserContextMiddleware, user_cache
+from services.profile_snapshot import profile_snapshot
+from services.seen_set import seen_set
+from tests.conftest import _tmp_dir
+
+
+@pytest.fixture
+async def lagging_replica():
+    """Реплика, которая еще не получила ни одной строки основной БД"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'replica.db')}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine, async_sessionmaker(
+        engine, class_=AsyncSession, sync_session_class=ReplicaSession,
+        expire_on_commit=False, info={"replica": True}
+    )
+    await engine.dispose()
+
+
+async def create_users(*telegram_ids: int):
+    async with async_session_maker() as session:
+        users = [User(telegram_id=telegram_id, name=f"R{telegram_id}", age=30, gender="male")
+                 for telegram_id in telegram_ids]
+        session.add_all(users)
+        await session.commit()
+    return users
+
+
+def handler_data(telegram_id: int, params: set, read_only: bool) -> dict:
+    return {
+        "event_from_user": types.SimpleNamespace(id=telegram_id),
+        "handler": types.SimpleNamespace(
+            params=params, varkw=False, flags={"read_only": True} if read_only else {}
+        ),
+    }
+
+
+async def test_seen_set_loads_from_primary(lagging_replica):
+    _, replica_session_maker = lagging_replica
+    viewer, target = await create_users(9001, 9002)
+    async with async_session_maker() as session:
+        session.add(Like(from_user_id=viewer.id, to_user_id=target.id))
+        await session.commit()
+    seen_set.clear_local()
+
+    async with replica_session_maker() as replica:
+        assert await seen_set.filter(replica, viewer.id, [target.id]) == []
+
+
+async def test_snapshot_refreshes_from_primary(lagging_replica):
+    _, replica_session_maker = lagging_replica
+    (profile,) = await create_users(9003)
+
+    async with replica_session_maker() as replica:
+        await profile_snapshot.refresh(replica)
+
+    assert profile.id in profile_snapshot._snapshot.ids
+
+
+async def test_read_only_handler_gets_user_from_primary(lagging_replica):
+    _, replica_session_maker = lagging_replica
+    (user,) = await create_users(9004)
+    user_cache.invalidate(user.telegram_id)
+    data = handler_data(user.telegram_id, {"user"}, read_only=True)
+
+    async def handler(event, data):
+        return data["user"]
+
+    async with replica_session_maker() as replica:
+        data["session"] = replica
+        resolved = await UserContextMiddleware()(handler, None, data)
+
+    assert resolved is not None and resolved.id == user.id
+    assert user_cache.get(user.telegram_id) is not None
+
+
+async def test_commit_pins_user_to_primary(lagging_replica, monkeypatch):
+    replica_engine, replica_session_maker = lagging_replica
+    monkeypatch.setattr(database_middleware, "replica_engine", replica_engine)
+    monkeypatch.setattr(database_middleware, "replica_session_maker", replica_session_maker)
+    middleware = DatabaseMiddleware()
+    telegram_id = 9005
+
+    async def is_replica(event, data):
+        return bool(data["session"].info.get("replica"))
+
+    async def write(event, data):
+        await data["session"].commit()
+
+    assert await middleware(is_replica, None, handler_data(telegram_id, {"session"}, read_only=True))
+    await middleware(write, None, handler_data(telegram_id, {"session"}, read_only=False))
+    assert primary_pins.is_pinned(telegram_id)
+    assert not await middleware(is_replica, None, handler_data(telegram_id, {"session"}, read_only=True))
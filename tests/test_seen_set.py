@@ -0,0 +1,48 @@
+"""In-process карты просмотренных анкет ограничены по памяти"""
+import itertools
+
+import pytest
+
+from database.connection import async_session_maker
+from database.models import Like, User
+from services.seen_set import seen_set
+
+_telegram_ids = itertools.count(9500)
+
+
+@pytest.fixture
+async def swipers():
+    async with async_session_maker() as session:
+        users = [
+            User(telegram_id=next(_telegram_ids), name=f"S{i}", age=30, gender="male", city="Битоград")
+            for i in range(4)
+        ]
+        session.add_all(users)
+        await session.commit()
+        # Каждый лайкнул следующего
+        session.add_all([
+            Like(from_user_id=user.id, to_user_id=target.id)
+            for user, target in zip(users, users[1:] + users[:1])
+        ])
+        await session.commit()
+    seen_set.clear_local()
+    return users
+
+
+async def test_least_recently_used_bitmaps_are_evicted(swipers, monkeypatch):
+    first, second, third, fourth = swipers
+    async with async_session_maker() as session:
+        await seen_set.contains(session, first.id, second.id)
+        bitmap_size = seen_set._local_bytes
+        monkeypatch.setattr(seen_set, "max_local_bytes", 2 * bitmap_size)
+
+        await seen_set.contains(session, second.id, third.id)
+        await seen_set.contains(session, first.id, second.id)  # first снова недавний
+        await seen_set.contains(session, third.id, fourth.id)
+
+        assert list(seen_set._local) == [first.id, third.id]
+        assert seen_set._local_bytes <= 2 * bitmap_size
+
+        # Вытесненная карта строится заново из БД
+        assert await seen_set.contains(session, second.id, third.id)
+        assert not await seen_set.contains(session, second.id, fourth.id)
@@ -0,0 +1,153 @@
+"""
+Геопоиск: geohash-ячейки и расстояния между пользователями
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from database.models import User
+
+EARTH_RADIUS_KM = 6371.0088
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int) -> str:
+    """Кодирует координаты в geohash заданной длины"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """Размер ячейки geohash в градусах (широта, долгота)"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Прямоугольник (min_lat, max_lat, min_lon, max_lon), покрывающий круг радиуса radius_km"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6:
+        lon_delta = 180.0
+    else:
+        lon_delta = min(180.0, lat_delta / cos_lat)
+    return (
+        max(-90.0, latitude - lat_delta),
+        min(90.0, latitude + lat_delta),
+        longitude - lon_delta,
+        longitude + lon_delta,
+    )
+
+
+def covering_cells(latitude: float, longitude: float, radius_km: float, precision: int, max_cells: int) -> Optional[List[str]]:
+    """
+    Список geohash-ячеек, покрывающих круг поиска
+
+    Returns:
+        List[str]: Ячейки или None, если их больше max_cells (радиус слишком велик)
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    cell_lat, cell_lon = geohash_cell_size(precision)
+
+    lat_steps = int((max_lat - min_lat) / cell_lat) + 2
+    lon_steps = int((max_lon - min_lon) / cell_lon) + 2
+    if lat_steps * lon_steps > max_cells * 4:
+        return None
+
+    cells = set()
+    for i in range(lat_steps):
+        lat = min(max_lat, min_lat + i * cell_lat)
+        for j in range(lon_steps):
+            lon = min(max_lon, min_lon + j * cell_lon)
+            # Нормализуем долготу при переходе через 180-й меридиан
+            lon = (lon + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(lat, lon, precision))
+            if len(cells) > max_cells:
+                return None
+    return sorted(cells)
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Векторизованное расстояние (км) от точки до массива точек"""
+    lat1 = np.radians(latitude)
+    lon1 = np.radians(longitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def approx_distance_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Приближенное расстояние (км) по равнопромежуточной проекции в float32
+
+    В несколько раз быстрее haversine_km; погрешность меньше 1% на расстояниях
+    до нескольких сотен км, поэтому годится для ранжирования, но не для показа.
+    """
+    km_per_degree = np.float32(math.radians(1) * EARTH_RADIUS_KM)
+    dlat = (np.asarray(latitudes, dtype=np.float32) - np.float32(latitude)) * km_per_degree
+    dlon = np.asarray(longitudes, dtype=np.float32) - np.float32(longitude)
+    # Переход через 180-й меридиан
+    dlon -= np.float32(360.0) * np.round(dlon / np.float32(360.0))
+    dlon *= km_per_degree * np.float32(math.cos(math.radians(latitude)))
+    return np.sqrt(dlat * dlat + dlon * dlon)
+
+
+def distance_between(viewer: User, profile: User) -> Optional[float]:
+    """Расстояние между двумя пользователями (км) или None, если нет координат"""
+    if None in (viewer.latitude, viewer.longitude, profile.latitude, profile.longitude):
+        return None
+    return float(haversine_km(viewer.latitude, viewer.longitude, [profile.latitude], [profile.longitude])[0])
+
+
+def apply_location(user: User, latitude: Optional[float], longitude: Optional[float]) -> None:
+    """Сохраняет координаты пользователя вместе с geohash-ячейкой"""
+    user.latitude = latitude
+    user.longitude = longitude
+    if latitude is not None and longitude is not None:
+        user.geo_cell = encode_geohash(latitude, longitude, settings.GEO_CELL_PRECISION)
+    else:
+        user.geo_cell = None
+
+
+def format_distance(distance_km: float) -> str:
+    """Человекочитаемое расстояние"""
+    if distance_km < 1:
+        return "меньше 1 км"
+    if distance_km < 10:
+        return f"{distance_km:.1f} км".replace(".", ",")
+    return f"{round(distance_km)} км"
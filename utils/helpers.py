@@ -1,7 +1,7 @@
 import secrets
 import string
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional, Set
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User, Like, Dislike
 from config import settings
@@ -48,136 +48,411 @@ async def check_mutual_like(session: AsyncSession, from_user_id: int, to_user_id
     return mutual_like.scalar_one_or_none() is not None
 
 
-async def get_next_profile(session: AsyncSession, user: User) -> Optional[User]:
-    """Получает следующую анкету для просмотра"""
-    import logging
-    logger = logging.getLogger(__name__)
-    from sqlalchemy import select, and_, not_, or_
-    # Получаем ID пользователей, которых уже лайкнули/дизлайкнули
-    liked_result = await session.execute(
-        select(Like.to_user_id).where(Like.from_user_id == user.id)
+async def increment_user_counters(session: AsyncSession, user_ids: List[int], **counters: int) -> None:
+    """
+    Атомарно увеличивает счетчики пользователей (без commit)
+
+    Выполняется одним UPDATE ... SET x = x + n, без чтения строк в ORM, поэтому
+    одновременные лайки не теряют инкременты. Объекты User, уже загруженные в
+    сессию, получают новые значения из RETURNING - в том числе анкета текущего
+    пользователя, которую UserContextMiddleware кладет в кеш после обработчика.
+
+    Example:
+        await increment_user_counters(session, [user.id], daily_dislikes_used=1)
+    """
+    from sqlalchemy import update, func
+    from sqlalchemy.orm.attributes import set_committed_value
+    
+    names = list(counters)
+    result = await session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values({
+            name: func.coalesce(getattr(User, name), 0) + counters[name]
+            for name in names
+        })
+        .returning(User.id, *(getattr(User, name) for name in names))
+        .execution_options(synchronize_session=False)
     )
-    disliked_result = await session.execute(
-        select(Dislike.to_user_id).where(Dislike.from_user_id == user.id)
+    updated = {row[0]: row[1:] for row in result.all()}
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, User) and instance.id in updated:
+            for name, value in zip(names, updated[instance.id]):
+                set_committed_value(instance, name, value)
+
+
+async def record_like(
+    session: AsyncSession,
+    from_user_id: int,
+    to_user_id: int,
+    is_super_like: bool = False,
+    message: Optional[str] = None,
+    video: Optional[str] = None
+) -> tuple[bool, bool]:
+    """
+    Записывает лайк и отмечает взаимную симпатию (без commit)
+
+    Вставка идет через ON CONFLICT по уникальному ключу (from_user_id, to_user_id),
+    поэтому повторный лайк не создает дубль даже при гонке. Суперлайк поверх
+    обычного лайка превращает его в суперлайк. Взаимность проверяется и
+    отмечается на обеих записях одним UPDATE - только для новой записи или
+    суперлайка, и только если пара еще не взаимная. Счетчики total_likes обоих
+    пользователей увеличиваются атомарно и только для новой записи.
+    
+    Встречные лайки одной пары сериализуются: в PostgreSQL - advisory-блокировкой
+    пары до конца транзакции (остальные лайки не ждут), в SQLite - блокировкой
+    записи самой БД. Иначе при одновременных лайках каждая транзакция не видит
+    незакоммиченную вставку другой и взаимность теряется. Оставшиеся расхождения
+    исправляет services.reconciliation.
+
+    Returns:
+        tuple[bool, bool]: (лайк записан, симпатия стала взаимной этим лайком)
+    """
+    from sqlalchemy import select, update, exists, and_, or_, func
+    from sqlalchemy.orm import aliased
+    
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        low_id, high_id = sorted((from_user_id, to_user_id))
+        await session.execute(select(func.pg_advisory_xact_lock(low_id, high_id)))
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    
+    stmt = insert(Like).values(
+        from_user_id=from_user_id,
+        to_user_id=to_user_id,
+        is_super_like=is_super_like,
+        message=message,
+        video=video
+    ).on_conflict_do_nothing(index_elements=[Like.from_user_id, Like.to_user_id])
+    inserted = (await session.execute(stmt.returning(Like.id))).first() is not None
+    created = inserted
+    
+    if inserted:
+        # Лайк учитывается в total_likes обоих пользователей
+        await increment_user_counters(session, [from_user_id, to_user_id], total_likes=1)
+    elif is_super_like:
+        # Обычный лайк уже есть - превращаем его в суперлайк
+        upgraded = await session.execute(
+            update(Like)
+            .where(
+                Like.from_user_id == from_user_id,
+                Like.to_user_id == to_user_id,
+                Like.is_super_like == False
+            )
+            .values(is_super_like=True, message=message, video=video)
+            .execution_options(synchronize_session=False)
+        )
+        created = upgraded.rowcount > 0
+    
+    if not created:
+        return False, False
+    
+    # Обе записи пары помечаются взаимными, только если встречный лайк существует
+    reverse = aliased(Like)
+    result = await session.execute(
+        update(Like)
+        .where(
+            or_(
+                and_(Like.from_user_id == from_user_id, Like.to_user_id == to_user_id),
+                and_(Like.from_user_id == to_user_id, Like.to_user_id == from_user_id),
+            ),
+            exists().where(reverse.from_user_id == to_user_id, reverse.to_user_id == from_user_id),
+            # Уже взаимная пара не дает повторного сообщения о симпатии
+            Like.is_mutual == False
+        )
+        .values(is_mutual=True)
+        .execution_options(synchronize_session=False)
     )
+    return created, result.rowcount > 0
+
+
+def mutual_like_notice(partner: User):
+    """
+    Сообщение о взаимной симпатии: текст и кнопка анкеты второй стороны пары
+
+    Returns:
+        tuple[str, InlineKeyboardMarkup]: (текст, клавиатура)
+    """
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     
-    liked_ids = set(liked_result.scalars().all())
-    disliked_ids = set(disliked_result.scalars().all())
-    excluded_ids = {user.id} | liked_ids | disliked_ids
+    partner_name = partner.name or partner.first_name or "Пользователь"
+    text = f"💕 Взаимная симпатия!\n\n"
+    text += f"👤 {partner_name}"
+    if partner.username:
+        text += f" (@{partner.username})"
+    text += f"\n\nВы понравились друг другу!"
     
-    # Базовые условия (обязательные)
-    base_conditions = [
-        User.id != user.id,
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="👤 Посмотреть анкету", callback_data=f"view_profile_{partner.id}")
+    ]])
+    return text, keyboard
+
+
+def visible_profile_conditions() -> list:
+    """Условия показа анкеты: активна, не забанена, не скрыта, заполнена"""
+    return [
         User.is_active == True,
         User.is_banned == False,
         User.is_hidden == False,
+        # Проверка на заполненность анкеты (есть имя)
+        User.name.isnot(None),
     ]
+
+
+def search_filter_conditions(user: User) -> list:
+    """Условия по фильтрам поиска пользователя: диапазон возраста и расстояние"""
+    conditions = []
+    if user.search_age_min:
+        conditions.append(User.age >= user.search_age_min)
+    if user.search_age_max:
+        conditions.append(User.age <= user.search_age_max)
+    if user.search_max_distance_km and user.latitude is not None and user.longitude is not None:
+        # Грубый отбор по прямоугольнику; точное расстояние проверяется при ранжировании
+        from utils.geo import bounding_box
+        min_lat, max_lat, min_lon, max_lon = bounding_box(
+            user.latitude, user.longitude, user.search_max_distance_km
+        )
+        conditions.append(User.latitude.between(min_lat, max_lat))
+        if -180.0 <= min_lon and max_lon <= 180.0:
+            conditions.append(User.longitude.between(min_lon, max_lon))
+        conditions.append(User.longitude.isnot(None))
+    return conditions
+
+
+def candidate_base_conditions(user: User, exclude_swiped: bool = True) -> list:
+    """Обязательные условия для анкет-кандидатов (по умолчанию без уже оцененных)"""
+    from sqlalchemy import exists
+    conditions = [User.id != user.id, *visible_profile_conditions(), *search_filter_conditions(user)]
+    if exclude_swiped:
+        # Уже лайкнутые/дизлайкнутые исключаются анти-джойном на стороне БД.
+        # Алиасы - чтобы подзапрос не коррелировал с likes внешнего запроса
+        from sqlalchemy.orm import aliased
+        swiped_like = aliased(Like)
+        swiped_dislike = aliased(Dislike)
+        conditions += [
+            ~exists().where(swiped_like.from_user_id == user.id, swiped_like.to_user_id == User.id),
+            ~exists().where(swiped_dislike.from_user_id == user.id, swiped_dislike.to_user_id == User.id),
+        ]
+    return conditions
+
+
+def relevance_tiers(user: User, boosted_ids=None) -> tuple:
+    """
+    Выражения уровней релевантности: (интерес, город, boost)
+
+    Args:
+        boosted_ids: ID пользователей с активным boost (из boost_registry)
+    """
+    from sqlalchemy import case, literal
+    from database.models import Gender
+    
+    if user.interest and user.interest.value in ("male", "female"):
+        interest_match = case((User.gender == Gender(user.interest.value), 1), else_=0)
+    else:
+        interest_match = literal(0)
     
-    # Проверка на заполненность анкеты (есть имя)
-    base_conditions.append(User.name.isnot(None))
+    if user.city:
+        city_match = case((User.city == user.city, 1), else_=0)
+    else:
+        city_match = literal(0)
     
-    # Добавляем исключения только если они есть
-    if excluded_ids:
-        base_conditions.append(~User.id.in_(excluded_ids))
+    if boosted_ids is not None and len(boosted_ids):
+        boost_match = case((User.id.in_([int(uid) for uid in boosted_ids]), 1), else_=0)
+    else:
+        boost_match = literal(0)
+    return interest_match, city_match, boost_match
+
+
+async def get_nearby_candidate_ids(
+    session: AsyncSession,
+    user: User,
+    limit: int,
+    exclude_ids: Optional[Set[int]] = None
+) -> List[int]:
+    """Подбирает ближайшие анкеты в радиусе поиска (сначала подходящие по интересу)"""
+    import numpy as np
+    from sqlalchemy import select
+    from utils.geo import covering_cells, bounding_box, haversine_km
     
-    # Фильтры (необязательные - если нет результатов, показываем без фильтров)
-    interest_filter = None
-    if user.interest and user.interest.value == "male":
-        interest_filter = User.gender == "male"
-    elif user.interest and user.interest.value == "female":
-        interest_filter = User.gender == "female"
+    radius_km = user.search_max_distance_km or settings.GEO_SEARCH_RADIUS_KM
+    conditions = candidate_base_conditions(user)
+    if exclude_ids:
+        conditions.append(~User.id.in_(exclude_ids))
     
-    city_filter = None
-    if user.city:
-        city_filter = User.city == user.city
+    # Грубый отбор по индексированной geohash-ячейке, при большом радиусе - по координатам
+    cells = covering_cells(
+        user.latitude, user.longitude, radius_km,
+        settings.GEO_CELL_PRECISION, settings.GEO_MAX_CELLS
+    )
+    if cells is not None:
+        conditions.append(User.geo_cell.in_(cells))
+    else:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(user.latitude, user.longitude, radius_km)
+        conditions.append(User.latitude.between(min_lat, max_lat))
+        if -180.0 <= min_lon and max_lon <= 180.0:
+            conditions.append(User.longitude.between(min_lon, max_lon))
+        conditions.append(User.longitude.isnot(None))
+    
+    interest_match, _, _ = relevance_tiers(user)
+    result = await session.execute(
+        select(User.id, User.latitude, User.longitude, interest_match)
+        .where(*conditions)
+        .order_by(interest_match.desc())
+        .limit(settings.GEO_CANDIDATE_POOL)
+    )
+    rows = result.all()
+    if not rows:
+        return []
+    
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    latitudes = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    longitudes = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    interest = np.fromiter((row[3] for row in rows), dtype=np.int64, count=len(rows))
+    
+    # Точное расстояние считаем векторно для всей выборки
+    distances = haversine_km(user.latitude, user.longitude, latitudes, longitudes)
+    in_radius = distances <= radius_km
+    ids, distances, interest = ids[in_radius], distances[in_radius], interest[in_radius]
+    
+    # Сначала подходящие по интересу, внутри - по возрастанию расстояния
+    order = np.lexsort((distances, -interest))[:limit]
+    return ids[order].tolist()
+
+
+async def get_admirer_ids(
+    session: AsyncSession,
+    user: User,
+    limit: int,
+    exclude_ids: Optional[Set[int]] = None
+) -> List[int]:
+    """Подбирает еще не оцененные анкеты тех, кто лайкнул пользователя (сначала новые)"""
+    from sqlalchemy import select
     
-    # Пробуем найти с фильтрами
-    conditions = base_conditions.copy()
-    if interest_filter:
-        conditions.append(interest_filter)
-    if city_filter:
-        conditions.append(city_filter)
+    from database.models import Gender
     
-    query = select(User).where(and_(*conditions))
+    conditions = candidate_base_conditions(user)
+    if exclude_ids:
+        conditions.append(~User.id.in_(exclude_ids))
+    # В отличие от общей ленты, интерес здесь - жесткий фильтр: лента идет первой
+    if user.interest and user.interest.value in ("male", "female"):
+        conditions.append(User.gender == Gender(user.interest.value))
     
-    # Boost пользователи в приоритете
-    from database.models import Boost
-    boosted_result = await session.execute(
-        select(Boost.user_id).where(Boost.expires_at > datetime.utcnow())
+    # Отбор по индексу likes(to_user_id, from_user_id)
+    result = await session.execute(
+        select(User.id)
+        .join(Like, Like.from_user_id == User.id)
+        .where(Like.to_user_id == user.id, *conditions)
+        .order_by(Like.id.desc())
+        .limit(limit)
     )
-    boosted_ids = set(boosted_result.scalars().all())
-    
-    result = await session.execute(query)
-    profiles = result.scalars().all()
-    
-    # Сортируем: сначала boost, потом остальные
-    boosted_profiles = [p for p in profiles if p.id in boosted_ids]
-    other_profiles = [p for p in profiles if p.id not in boosted_ids]
-    all_profiles = boosted_profiles + other_profiles
-    
-    # Если нашли с фильтрами - возвращаем
-    if all_profiles:
-        logger.info(f"Найдено {len(all_profiles)} анкет с фильтрами для пользователя {user.id}")
-        return all_profiles[0]
-    
-    # Если не нашли с фильтрами - пробуем без фильтра по городу
-    if city_filter:
-        conditions = base_conditions.copy()
-        if interest_filter:
-            conditions.append(interest_filter)
-        
-        query = select(User).where(and_(*conditions))
-        result = await session.execute(query)
-        profiles = result.scalars().all()
-        
-        boosted_profiles = [p for p in profiles if p.id in boosted_ids]
-        other_profiles = [p for p in profiles if p.id not in boosted_ids]
-        all_profiles = boosted_profiles + other_profiles
-        
-        if all_profiles:
-            return all_profiles[0]
-    
-    # Если не нашли - пробуем без фильтра по полу
-    if interest_filter:
-        conditions = base_conditions.copy()
-        if city_filter:
-            conditions.append(city_filter)
-        
-        query = select(User).where(and_(*conditions))
-        result = await session.execute(query)
-        profiles = result.scalars().all()
+    return list(result.scalars().all())
+
+
+async def get_candidate_ids(
+    session: AsyncSession,
+    user: User,
+    limit: int,
+    exclude_ids: Optional[Set[int]] = None
+) -> List[int]:
+    """Подбирает пачку ID анкет для просмотра (в порядке приоритета)"""
+    import math
+    
+    exclude_ids = set(exclude_ids or ())
+    
+    # Первыми идут те, кто уже лайкнул пользователя: лайк в ответ сразу дает взаимную
+    # симпатию (check_mutual_like). Их доля в пачке ограничена ADMIRER_SHARE
+    admirer_ids: List[int] = []
+    admirer_limit = math.ceil(limit * settings.ADMIRER_SHARE)
+    if admirer_limit > 0:
+        admirer_ids = await get_admirer_ids(session, user, admirer_limit, exclude_ids)
+        exclude_ids.update(admirer_ids)
+    
+    return admirer_ids + await get_ranked_candidate_ids(session, user, limit - len(admirer_ids), exclude_ids)
+
+
+async def get_ranked_candidate_ids(
+    session: AsyncSession,
+    user: User,
+    limit: int,
+    exclude_ids: Set[int]
+) -> List[int]:
+    """Подбирает анкеты по релевантности (без ленты "Вы понравились")"""
+    from sqlalchemy import select
+    
+    candidate_ids: List[int] = []
+    
+    # Основной путь - взвешенная оценка пула; ниже - упорядочивание по уровням без оценки
+    if settings.RANKING_ENABLED:
+        from services.ranking import ranking_engine
+        return await ranking_engine.get_candidate_ids(session, user, limit, exclude_ids)
+    
+    # Если известны координаты - сначала ближайшие анкеты в радиусе поиска
+    if settings.GEO_MATCHING_ENABLED and user.latitude is not None and user.longitude is not None:
+        candidate_ids = await get_nearby_candidate_ids(session, user, limit, exclude_ids)
+        if len(candidate_ids) >= limit:
+            return candidate_ids
+        exclude_ids.update(candidate_ids)
+    
+    conditions = candidate_base_conditions(user)
+    if exclude_ids:
+        conditions.append(~User.id.in_(exclude_ids))
+    
+    # Фильтры по интересу и городу не отсекают анкеты, а задают уровни релевантности:
+    # интерес + город -> интерес -> город -> остальные, внутри уровня сначала boost
+    from services.boost_registry import boost_registry
+    await boost_registry.ensure_loaded(session)
+    interest_match, city_match, boost_match = relevance_tiers(user, boost_registry.active_ids())
+    
+    result = await session.execute(
+        select(User.id)
+        .where(*conditions)
+        .order_by(interest_match.desc(), city_match.desc(), boost_match.desc(), User.id)
+        .limit(limit - len(candidate_ids))
+    )
+    return candidate_ids + list(result.scalars().all())
+
+
+async def get_next_profile(session: AsyncSession, user: User) -> Optional[User]:
+    """Получает следующую анкету для просмотра"""
+    import logging
+    logger = logging.getLogger(__name__)
+    from sqlalchemy import select
+    from services.candidate_queue import candidate_queue
+    from services.seen_set import seen_set
+    
+    while True:
+        candidate_id = await candidate_queue.pop(session, user)
+        if candidate_id is None:
+            logger.warning(f"Не найдено анкет для пользователя {user.id}")
+            return None
         
-        boosted_profiles = [p for p in profiles if p.id in boosted_ids]
-        other_profiles = [p for p in profiles if p.id not in boosted_ids]
-        all_profiles = boosted_profiles + other_profiles
+        # Анкета из очереди могла устареть: уже оценена (проверка по seen-set без БД)...
+        if await seen_set.contains(session, user.id, candidate_id):
+            continue
         
-        if all_profiles:
-            return all_profiles[0]
-    
-    # Если все еще не нашли - показываем любые анкеты (только базовые условия)
-    conditions = base_conditions.copy()
-    query = select(User).where(and_(*conditions))
-    result = await session.execute(query)
-    profiles = result.scalars().all()
-    
-    boosted_profiles = [p for p in profiles if p.id in boosted_ids]
-    other_profiles = [p for p in profiles if p.id not in boosted_ids]
-    all_profiles = boosted_profiles + other_profiles
-    
-    if all_profiles:
-        logger.info(f"Найдено {len(all_profiles)} анкет без фильтров для пользователя {user.id}")
-        return all_profiles[0]
-    else:
-        logger.warning(f"Не найдено анкет для пользователя {user.id}. Всего пользователей в базе: {len(profiles)}")
-        return None
+        # ...или забанена/скрыта - проверяем по первичному ключу
+        result = await session.execute(
+            select(User).where(
+                User.id == candidate_id,
+                *candidate_base_conditions(user, exclude_swiped=False)
+            )
+        )
+        profile = result.scalar_one_or_none()
+        if profile:
+            return profile
 
 
-def format_profile_text(user: User) -> str:
+def format_profile_text(user: User, distance_km: Optional[float] = None) -> str:
     """Форматирует текст анкеты"""
     text = f"👤 {user.name or 'Не указано'}\n"
     if user.age:
         text += f"🎂 {user.age} лет\n"
-    if user.city:
+    if distance_km is not None:
+        from utils.geo import format_distance
+        location = f"{user.city}, " if user.city else ""
+        text += f"📍 {location}{format_distance(distance_km)} от тебя\n"
+    elif user.city:
         text += f"📍 {user.city}\n"
     if user.description:
         text += f"\n{user.description}\n"
@@ -201,3 +476,33 @@ def format_profile_text(user: User) -> str:
         text += f"\n🔵 VK: <a href='{vk_url}'>{user.vk}</a>"
     return text
 
+
+
+def format_filters_text(user: User) -> str:
+    """Форматирует текст настроек фильтров поиска"""
+    if user.search_age_min and user.search_age_max:
+        age_range = f"{user.search_age_min}-{user.search_age_max} лет"
+    elif user.search_age_min:
+        age_range = f"от {user.search_age_min} лет"
+    elif user.search_age_max:
+        age_range = f"до {user.search_age_max} лет"
+    else:
+        age_range = "Любой"
+    
+    if user.search_max_distance_km:
+        distance = f"до {user.search_max_distance_km:g} км"
+        if user.latitude is None or user.longitude is None:
+            distance += " (нужна геолокация в анкете)"
+    else:
+        distance = "Любое"
+    
+    return f"""⚙️ Фильтры поиска
+
+Текущие настройки:
+• Пол: {user.gender.value if user.gender else 'Не указан'}
+• Интерес: {user.interest.value if user.interest else 'Не указан'}
+• Город: {user.city or 'Не указан'}
+• Возраст: {age_range}
+• Расстояние: {distance}
+
+Пол, интерес и город меняются при редактировании анкеты."""
@@ -0,0 +1,87 @@
+"""
+Карточка анкеты: текст, клавиатура и медиа для показа в ленте
+"""
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from database.models import User
+from keyboards.common import get_profile_view_keyboard
+from utils.geo import distance_between
+from utils.helpers import format_profile_text
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProfileCard:
+    """Готовая к отправке карточка анкеты"""
+    profile_id: int
+    text: str
+    keyboard: InlineKeyboardMarkup
+    video: Optional[str] = None  # file_id видео (показывается в первую очередь)
+    photo: Optional[str] = None  # file_id фото
+
+
+def build_profile_card(viewer: User, profile: User) -> ProfileCard:
+    """Собирает карточку анкеты для пользователя viewer"""
+    lang = viewer.language or 'ru'
+    keyboard = get_profile_view_keyboard(lang)
+    # Добавляем ID профиля в callback_data
+    keyboard.inline_keyboard[0][0].callback_data = f"like_{profile.id}"
+    keyboard.inline_keyboard[0][1].callback_data = f"dislike_{profile.id}"
+    keyboard.inline_keyboard[0][2].callback_data = f"super_like_{profile.id}"
+    keyboard.inline_keyboard[1][0].callback_data = f"next_profile"
+
+    return ProfileCard(
+        profile_id=profile.id,
+        text=format_profile_text(profile, distance_between(viewer, profile)),
+        keyboard=keyboard,
+        video=profile.videos[0] if profile.videos else None,
+        photo=profile.photos[0] if profile.photos else None,
+    )
+
+
+async def send_profile_card(message: Message, card: ProfileCard, replace: bool = False) -> None:
+    """
+    Отправляет карточку анкеты
+
+    Args:
+        message: Сообщение, в чат которого отправляется карточка
+        card: Карточка анкеты
+        replace: Заменить message (сообщение бота) вместо отправки нового
+    """
+    text, keyboard = card.text, card.keyboard
+
+    if replace and (card.video or card.photo):
+        # Медиа нельзя добавить к текстовому сообщению - удаляем его и отправляем новое
+        try:
+            await message.delete()
+        except Exception:
+            pass
+
+    # Приоритет: сначала видео, потом фото
+    if card.video:
+        try:
+            await message.answer_video(card.video, caption=text, reply_markup=keyboard, parse_mode="HTML")
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось отправить видео профиля: {e}. Пробуем фото.")
+    if card.photo:
+        try:
+            await message.answer_photo(card.photo, caption=text, reply_markup=keyboard, parse_mode="HTML")
+            return
+        except Exception as e:
+            # Если file_id невалиден (например, от старого бота), отправляем только текст
+            logger.warning(f"Не удалось отправить фото профиля: {e}. Отправляем текст без фото.")
+
+    if replace and not (card.video or card.photo):
+        try:
+            await message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+            return
+        except Exception:
+            # Предыдущая карточка была с медиа - текст в ней не отредактировать
+            pass
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")